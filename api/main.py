@@ -38,6 +38,8 @@ class KPIResponse(BaseModel):
     conversion_rate: float
     period_start: str
     period_end: str
+    total_customers_exact: bool = True
+    total_customers_error: float = 0.0
 
 class TransactionResponse(BaseModel):
     transaction_id: str
@@ -69,6 +71,50 @@ class ProductResponse(BaseModel):
 def get_db_engine():
     return get_engine()
 
+def _filtros_bocetos(start_date, end_date, **selecciones):
+    """
+    Filtros del dataset compartido equivalentes a 'date >= start_date AND date <= end_date'
+    a resolución de día (un end_date sin hora solo incluye el instante 00:00 de ese día).
+    Las selecciones llegan con los nombres en inglés de la base de datos y se traducen a
+    los del dataset (países consolidados, categorías en español).
+    """
+    from utils.filtros import FiltroSpec
+    from utils.traducciones import traducir_categoria, traducir_pais_consolidado
+    
+    traductores = {'paises': traducir_pais_consolidado, 'categorias': traducir_categoria}
+    fecha_fin = None
+    if end_date:
+        fecha_fin = pd.Timestamp(end_date)
+        if fecha_fin == fecha_fin.normalize():
+            fecha_fin -= pd.Timedelta(days=1)
+    filtros = {'fecha_inicio': pd.Timestamp(start_date) if start_date else None, 'fecha_fin': fecha_fin}
+    filtros.update({clave: [traductores[clave](valor)] for clave, valor in selecciones.items() if valor})
+    return FiltroSpec.desde_filtros(filtros).como_filtros()
+
+def _pais_con_variantes(country):
+    """True si el país de la base de datos se consolida en el dataset con otros valores"""
+    from utils.traducciones import traducir_pais_consolidado, valores_origen
+    
+    if not country:
+        return False
+    grupo = traducir_pais_consolidado(country)
+    variantes = {v for v in valores_origen('country', [grupo]) if v != grupo and traducir_pais_consolidado(v) == grupo}
+    return len(variantes) > 1
+
+def _bocetos_clientes(start_date, end_date):
+    """
+    Bocetos HLL diarios del dataset de la API que cubre el rango; None si el rango es
+    abierto (el dataset de la API está acotado y no cubriría todo el histórico de la
+    consulta SQL) o si no se puede cargar
+    """
+    from utils.dataset import obtener_dataset_api
+    from utils.distintos import bocetos_diarios
+    
+    if not start_date or not end_date:
+        return None
+    dataset = obtener_dataset_api(start_date, end_date)
+    return bocetos_diarios(dataset) if dataset is not None else None
+
 @app.get("/")
 def read_root():
     return {
@@ -89,10 +135,16 @@ def get_kpis(
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
     country: Optional[str] = Query(None, description="Filter by country"),
-    category: Optional[str] = Query(None, description="Filter by category")
+    category: Optional[str] = Query(None, description="Filter by category"),
+    exact: bool = Query(True, description="Exact distinct customers (false: HyperLogLog estimate with its error bound)")
 ):
     """
     Obtiene KPIs principales del ecommerce - SECURED with parameterized queries
+    
+    Con exact=false los clientes distintos salen de los bocetos HLL diarios del dataset
+    compartido (error típico en total_customers_error) y la consulta evita el COUNT(DISTINCT).
+    Un país con variantes consolidadas en el dataset (USA / United States) se cuenta
+    exacto: el boceto sumaría las dos y la consulta filtra solo una.
     """
     engine = get_db_engine()
     
@@ -102,6 +154,16 @@ def get_kpis(
     if not start_date:
         start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
     
+    # Clientes aproximados: solo si los bocetos resuelven el filtro (una dimensión como mucho)
+    clientes_aproximados = None
+    if not exact and not _pais_con_variantes(country):
+        from utils.distintos import ERROR_RELATIVO_HLL
+        bocetos = _bocetos_clientes(start_date, end_date)
+        if bocetos is not None:
+            clientes_aproximados = bocetos.estimar(
+                'customer_id', _filtros_bocetos(start_date, end_date, paises=country, categorias=category)
+            )
+    
     # Query base con parámetros
     query = text("""
     SELECT 
@@ -109,7 +171,7 @@ def get_kpis(
         SUM(total_amount_usd) as total_revenue,
         AVG(total_amount_usd) as avg_order_value,
         SUM(profit) as gross_profit,
-        COUNT(DISTINCT customer_id) as total_customers
+        """ + ("NULL" if clientes_aproximados is not None else "COUNT(DISTINCT customer_id)") + """ as total_customers
     FROM transactions
     WHERE date >= :start_date AND date <= :end_date
     """ + (" AND country = :country" if country else "") +
@@ -129,7 +191,10 @@ def get_kpis(
             if row is None:
                 raise HTTPException(status_code=404, detail="No data found")
             
-            total_customers = float(row[4]) if row[4] else 1
+            if clientes_aproximados is not None:
+                total_customers = float(clientes_aproximados) if clientes_aproximados else 1
+            else:
+                total_customers = float(row[4]) if row[4] else 1
             total_orders = float(row[0]) if row[0] else 0
             
             return KPIResponse(
@@ -140,7 +205,9 @@ def get_kpis(
                 total_customers=int(total_customers),
                 conversion_rate=round((total_orders / total_customers) * 100, 2) if total_customers > 0 else 0,
                 period_start=start_date,
-                period_end=end_date
+                period_end=end_date,
+                total_customers_exact=clientes_aproximados is None,
+                total_customers_error=ERROR_RELATIVO_HLL if clientes_aproximados is not None else 0.0
             )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -296,10 +363,16 @@ def get_products(
 @app.get("/api/analytics/countries")
 def get_country_analytics(
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    exact: bool = Query(True, description="Exact distinct customers per country (false: HyperLogLog estimate)")
 ):
     """
     Análisis de revenue por país - SECURED
+    
+    Con exact=false los clientes por país salen de los bocetos HLL diarios del dataset
+    compartido (error típico en customers_error) y la consulta evita el COUNT(DISTINCT).
+    Los bocetos cuentan por país consolidado: las filas se agrupan con los nombres del
+    dashboard y source_countries lista los valores de la base de datos de cada grupo.
     """
     engine = get_db_engine()
     
@@ -315,13 +388,22 @@ def get_country_analytics(
     
     where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
     
+    clientes_pais = None
+    if not exact:
+        from utils.distintos import ERROR_RELATIVO_HLL
+        bocetos = _bocetos_clientes(start_date, end_date)
+        if bocetos is not None:
+            clientes_pais = bocetos.estimar_por_valor(
+                'customer_id', 'country', _filtros_bocetos(start_date, end_date)
+            )
+    
+    distintos_sql = "" if clientes_pais is not None else ",\n        COUNT(DISTINCT customer_id) as customers"
     query = text(f"""
     SELECT 
         country,
         COUNT(*) as orders,
         SUM(total_amount_usd) as revenue,
-        AVG(total_amount_usd) as aov,
-        COUNT(DISTINCT customer_id) as customers
+        AVG(total_amount_usd) as aov{distintos_sql}
     FROM transactions
     {where_sql}
     GROUP BY country
@@ -330,7 +412,25 @@ def get_country_analytics(
     
     try:
         df = pd.read_sql_query(query, engine, params=params if params else None)
+        if clientes_pais is not None:
+            # Los bocetos usan los nombres traducidos y consolidados del dataset: las variantes
+            # (USA / United States) se agrupan antes, o cada una recibiría los clientes del grupo
+            from utils.traducciones import traducir_pais_consolidado
+            df['source_countries'] = df['country']
+            df['country'] = df['country'].map(traducir_pais_consolidado)
+            df = df.groupby('country', sort=False).agg(
+                orders=('orders', 'sum'),
+                revenue=('revenue', 'sum'),
+                source_countries=('source_countries', list)
+            ).reset_index()
+            df['aov'] = df['revenue'] / df['orders']
+            df['customers'] = clientes_pais.reindex(df['country']).fillna(0).astype(int).to_numpy()
+            df = df.sort_values('revenue', ascending=False)[
+                ['country', 'orders', 'revenue', 'aov', 'customers', 'source_countries']
+            ]
         return {
+            "customers_exact": clientes_pais is None,
+            "customers_error": ERROR_RELATIVO_HLL if clientes_pais is not None else 0.0,
             "data": df.to_dict(orient='records')
         }
     except Exception as e:
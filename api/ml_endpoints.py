@@ -1,10 +1,12 @@
 from fastapi import APIRouter, HTTPException, Query
-from typing import Optional, List
+from typing import Optional, List, Literal
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from database.schema import get_engine
 from pydantic import BaseModel
+from utils.registro_modelos import ModeloNoEntrenado, cargar_modelo
+from utils.reentrenar_modelos import N_CLUSTERS_API, CONTAMINACION_API
 
 router = APIRouter(prefix="/api/ml", tags=["Machine Learning"])
 
@@ -45,57 +47,127 @@ class DemandForecastResponse(BaseModel):
     stock_out_risk: str
     recommended_reorder: int
 
+# Modelos de la API en el registro (utils.registro_modelos): los entrena el job de
+# reentrenamiento (python -m utils.reentrenar_modelos) y las peticiones solo cargan y
+# predicen; sin versión registrada responden 503 (modelo aún no entrenado)
+TIPO_MODELO_FORECAST = 'prophet_diario'
+TIPO_MODELO_CLUSTERS = 'kmeans_scores_clientes'
+TIPO_MODELO_ANOMALIAS_DIARIAS = 'isolation_forest_diario'
+
+COLUMNAS_SCORES_CLIENTES = ['recency_score', 'frequency_score', 'monetary_score',
+                            'age', 'total_orders', 'avg_order_value']
+
+def entrenar_forecast(metric):
+    """Prophet sobre la serie diaria completa de revenue u orders: (modelo, métricas)"""
+    from prophet import Prophet
+    from sklearn.metrics import mean_squared_error, r2_score
+    
+    engine = get_engine()
+    
+    # Obtener datos históricos
+    query = f"""
+    SELECT 
+        DATE(date) as ds,
+        {'SUM(total_amount_usd)' if metric == 'revenue' else 'COUNT(*)'} as y
+    FROM transactions
+    GROUP BY DATE(date)
+    ORDER BY ds
+    """
+    
+    df = pd.read_sql_query(query, engine)
+    df['ds'] = pd.to_datetime(df['ds'])
+    
+    # Entrenar Prophet
+    model = Prophet(
+        daily_seasonality=False,
+        weekly_seasonality=True,
+        yearly_seasonality=True,
+        interval_width=0.95
+    )
+    model.fit(df)
+    
+    # Métricas en la muestra de entrenamiento
+    y_true = df['y'].values
+    y_pred = model.predict(df[['ds']])['yhat'].values
+    
+    mape = np.mean(np.abs((y_true - y_pred) / y_true)) * 100
+    rmse = np.sqrt(mean_squared_error(y_true, y_pred))
+    r2 = r2_score(y_true, y_pred)
+    
+    return model, {
+        'mape': round(float(mape), 2),
+        'rmse': round(float(rmse), 2),
+        'r2': round(float(r2), 3),
+        'training_samples': len(df)
+    }
+
+def entrenar_clusters_clientes(n_clusters):
+    """StandardScaler + K-Means sobre las puntuaciones de la tabla customers: (artefacto, métricas)"""
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+    
+    engine = get_engine()
+    query = f"SELECT {', '.join(COLUMNAS_SCORES_CLIENTES)} FROM customers"
+    features = pd.read_sql_query(query, engine)
+    
+    scaler = StandardScaler()
+    features_scaled = scaler.fit_transform(features)
+    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+    kmeans.fit(features_scaled)
+    
+    return {'escalador': scaler, 'modelo': kmeans}, {
+        'clientes': len(features),
+        'inercia': round(float(kmeans.inertia_), 2)
+    }
+
+def _ventas_diarias(engine, start_date=None):
+    """Pedidos e ingresos por día (desde start_date, si se indica)"""
+    from sqlalchemy import text
+    
+    query = text(f"""
+    SELECT 
+        DATE(date) as day,
+        COUNT(*) as orders,
+        SUM(total_amount_usd) as revenue
+    FROM transactions
+    {'WHERE date >= :start_date' if start_date else ''}
+    GROUP BY DATE(date)
+    ORDER BY day
+    """)
+    params = {"start_date": start_date} if start_date else {}
+    return pd.read_sql_query(query, engine, params=params)
+
+def entrenar_anomalias_diarias(contamination):
+    """Isolation Forest sobre revenue y orders diarios de todo el histórico: (modelo, métricas)"""
+    from sklearn.ensemble import IsolationForest
+    
+    df = _ventas_diarias(get_engine())
+    iso_forest = IsolationForest(contamination=contamination, random_state=42)
+    iso_forest.fit(df[['revenue', 'orders']])
+    
+    return iso_forest, {
+        'training_days': len(df),
+        'first_day': str(df['day'].min()) if len(df) else None,
+        'last_day': str(df['day'].max()) if len(df) else None
+    }
+
 @router.post("/forecast")
 def create_forecast(
     days_ahead: int = Query(90, ge=7, le=180),
-    metric: str = Query("revenue", description="revenue or orders")
+    metric: Literal['revenue', 'orders'] = Query("revenue", description="revenue or orders")
 ):
     """
-    Genera forecast usando Prophet para revenue o orders
+    Genera forecast usando Prophet para revenue o orders (modelo del registro)
     """
     try:
-        from prophet import Prophet
-        
-        engine = get_engine()
-        
-        # Obtener datos históricos
-        query = f"""
-        SELECT 
-            DATE(date) as ds,
-            {'SUM(total_amount_usd)' if metric == 'revenue' else 'COUNT(*)'} as y
-        FROM transactions
-        GROUP BY DATE(date)
-        ORDER BY ds
-        """
-        
-        df = pd.read_sql_query(query, engine)
-        df['ds'] = pd.to_datetime(df['ds'])
-        
-        # Entrenar Prophet
-        model = Prophet(
-            daily_seasonality=False,
-            weekly_seasonality=True,
-            yearly_seasonality=True,
-            interval_width=0.95
-        )
-        model.fit(df)
+        model, metadatos = cargar_modelo(TIPO_MODELO_FORECAST, {'metric': metric})
         
-        # Generar forecast
-        future = model.make_future_dataframe(periods=days_ahead)
-        forecast = model.predict(future)
-        
-        # Calcular métricas
-        from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-        
-        y_true = df['y'].values
-        y_pred = forecast.iloc[:len(df)]['yhat'].values
-        
-        mape = np.mean(np.abs((y_true - y_pred) / y_true)) * 100
-        rmse = np.sqrt(mean_squared_error(y_true, y_pred))
-        r2 = r2_score(y_true, y_pred)
-        
-        # Extraer predicciones futuras
-        future_forecast = forecast.tail(days_ahead)
+        # Solo se predicen los días futuros: desde mañana, aunque el modelo se entrenara con
+        # datos de hace semanas (make_future_dataframe partiría del final del entrenamiento)
+        ultimo_entrenado = model.history['ds'].max()
+        inicio = max(pd.Timestamp.now().normalize(), ultimo_entrenado.normalize()) + pd.Timedelta(days=1)
+        future = pd.DataFrame({'ds': pd.date_range(inicio, periods=days_ahead, freq='D')})
+        future_forecast = model.predict(future)
         
         return ForecastResponse(
             dates=[d.strftime('%Y-%m-%d') for d in future_forecast['ds']],
@@ -103,48 +175,73 @@ def create_forecast(
             lower_bound=future_forecast['yhat_lower'].tolist(),
             upper_bound=future_forecast['yhat_upper'].tolist(),
             model_metrics={
-                'mape': round(mape, 2),
-                'rmse': round(rmse, 2),
-                'r2': round(r2, 3),
-                'training_samples': len(df)
+                **metadatos.get('metricas', {}),
+                'model_version': metadatos.get('version'),
+                'trained_at': metadatos.get('creado_en'),
+                'trained_until': ultimo_entrenado.strftime('%Y-%m-%d')
             }
         )
     
+    except ModeloNoEntrenado as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generando forecast: {str(e)}")
 
+def _dataset_rango(start_date, end_date):
+    """
+    Dataset de la API que cubre el rango (periodo acotado, con las mismas cachés por
+    filtros que el dashboard) y filtros de fechas equivalentes; (None, None) si no se
+    puede cargar
+    """
+    from utils.dataset import obtener_dataset_api
+    
+    dataset = obtener_dataset_api(start_date, end_date)
+    if dataset is None:
+        return None, None
+    filtros = {
+        'fecha_inicio': pd.Timestamp(start_date) if start_date else None,
+        'fecha_fin': pd.Timestamp(end_date) if end_date else None
+    }
+    return dataset, filtros
+
 @router.get("/clustering/customers")
 def get_customer_clusters(
-    n_clusters: int = Query(5, ge=3, le=10)
+    n_clusters: int = Query(5, ge=min(N_CLUSTERS_API), le=max(N_CLUSTERS_API)),
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)")
 ):
     """
-    Clustering de clientes usando K-Means
+    Clustering de clientes usando K-Means sobre el RFM de las transacciones del rango
+    (o sobre las puntuaciones de la tabla customers si el dataset no está disponible)
     """
     try:
-        from sklearn.cluster import KMeans
-        from sklearn.preprocessing import StandardScaler
-        
-        engine = get_engine()
-        
-        # Cargar datos de clientes
-        query = """
-        SELECT customer_id, recency_score, frequency_score, monetary_score,
-               age, total_orders, avg_order_value
-        FROM customers
-        """
-        df = pd.read_sql_query(query, engine)
-        
-        # Preparar features
-        features = df[['recency_score', 'frequency_score', 'monetary_score', 
-                       'age', 'total_orders', 'avg_order_value']]
-        
-        # Normalizar
-        scaler = StandardScaler()
-        features_scaled = scaler.fit_transform(features)
-        
-        # K-Means
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        df['cluster'] = kmeans.fit_predict(features_scaled)
+        from utils.cache_filtros import obtener_rfm
+        from utils.servicio_modelos import obtener_segmentacion
+        from utils.segmentacion import TIPO_MODELO_SEGMENTACION, parametros_segmentacion
+        
+        dataset, filtros = _dataset_rango(start_date, end_date)
+        if dataset is not None:
+            origen = 'transactions_rfm'
+            # RFM por filtros (compartido con el dashboard) y segmentos del registro; cluster 0 = más valor
+            segmentacion = obtener_segmentacion(dataset, filtros, n_clusters)
+            if segmentacion is None:
+                raise ModeloNoEntrenado(TIPO_MODELO_SEGMENTACION, parametros_segmentacion(n_clusters))
+            df = obtener_rfm(dataset, filtros).copy()
+            df['cluster'] = segmentacion['etiquetas']
+            columnas_media = {'avg_monetary': 'monetary', 'avg_frequency': 'frequency', 'avg_recency': 'recency'}
+        else:
+            origen = 'customers_scores'
+            engine = get_engine()
+            
+            # Cargar datos de clientes
+            query = f"SELECT customer_id, {', '.join(COLUMNAS_SCORES_CLIENTES)} FROM customers"
+            df = pd.read_sql_query(query, engine)
+            columnas_media = {'avg_monetary': 'monetary_score', 'avg_frequency': 'frequency_score', 'avg_recency': 'recency_score'}
+            
+            # Escalador y K-Means del registro: solo se asigna cluster
+            artefacto, _ = cargar_modelo(TIPO_MODELO_CLUSTERS, {'n_clusters': n_clusters})
+            features_scaled = artefacto['escalador'].transform(df[COLUMNAS_SCORES_CLIENTES])
+            df['cluster'] = artefacto['modelo'].predict(features_scaled)
         
         # Características por cluster
         clusters_info = []
@@ -157,17 +254,18 @@ def get_customer_clusters(
                 'cluster_id': i,
                 'cluster_name': cluster_names[i] if i < len(cluster_names) else f'Cluster {i}',
                 'size': len(cluster_data),
-                'avg_monetary': round(cluster_data['monetary_score'].mean(), 2),
-                'avg_frequency': round(cluster_data['frequency_score'].mean(), 2),
-                'avg_recency': round(cluster_data['recency_score'].mean(), 2)
+                **{campo: round(float(cluster_data[col].mean()), 2) for campo, col in columnas_media.items()}
             })
         
         return {
             'n_clusters': n_clusters,
             'total_customers': len(df),
+            'features_source': origen,
             'clusters': clusters_info
         }
     
+    except ModeloNoEntrenado as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en clustering: {str(e)}")
 
@@ -374,36 +472,32 @@ def get_demand_forecast(
 
 @router.get("/anomalies")
 def detect_anomalies(
-    contamination: float = Query(0.05, ge=0.01, le=0.1),
+    contamination: float = Query(0.05, ge=min(CONTAMINACION_API), le=max(CONTAMINACION_API),
+                                 description="Multiple of 0.01"),
     days_back: int = Query(90, ge=30, le=365)
 ):
     """
-    Detección de anomalías en revenue diario usando Isolation Forest - SECURED
+    Detección de anomalías en revenue diario usando Isolation Forest (modelo del registro) - SECURED
+    
+    El job entrena un modelo por cada valor de CONTAMINACION_API (pasos de 0.01); otros
+    valores del rango se rechazan en lugar de responder que no hay modelo
     """
+    if not np.isclose(contamination, CONTAMINACION_API).any():
+        raise HTTPException(
+            status_code=422,
+            detail=f"contamination must be one of {list(CONTAMINACION_API)}"
+        )
+    contamination = round(contamination, 2)
+    
     try:
-        from sklearn.ensemble import IsolationForest
-        from sqlalchemy import text
+        # Isolation Forest del registro (entrenado sobre todo el histórico diario): solo se puntúa
+        iso_forest, metadatos = cargar_modelo(TIPO_MODELO_ANOMALIAS_DIARIAS, {'contamination': contamination})
         
         engine = get_engine()
         
         start_date = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
-        
-        query = text("""
-        SELECT 
-            DATE(date) as day,
-            COUNT(*) as orders,
-            SUM(total_amount_usd) as revenue
-        FROM transactions
-        WHERE date >= :start_date
-        GROUP BY DATE(date)
-        ORDER BY day
-        """)
-        
-        df = pd.read_sql_query(query, engine, params={"start_date": start_date})
-        
-        # Isolation Forest
-        iso_forest = IsolationForest(contamination=contamination, random_state=42)
-        df['anomaly'] = iso_forest.fit_predict(df[['revenue', 'orders']])
+        df = _ventas_diarias(engine, start_date)
+        df['anomaly'] = iso_forest.predict(df[['revenue', 'orders']])
         df['is_anomaly'] = df['anomaly'] == -1
         
         # Anomalías detectadas
@@ -420,8 +514,11 @@ def detect_anomalies(
             'total_days_analyzed': len(df),
             'anomalies_detected': len(anomalies),
             'contamination_rate': contamination,
+            'model_version': metadatos.get('version'),
             'anomalies': anomalies[['day', 'revenue', 'orders', 'deviation_pct', 'severity']].to_dict(orient='records')
         }
     
+    except ModeloNoEntrenado as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error detectando anomalías: {str(e)}")
@@ -40,11 +40,21 @@ st.set_page_config(
 
 from utils.ui_components import (
     aplicar_estilos_globales, crear_header_principal, crear_tarjeta_kpi,
-    crear_seccion_titulo, crear_pie_pagina, mostrar_info_dataset,
+    crear_seccion_titulo, crear_pie_pagina, mostrar_info_dataset, seccion_independiente,
     crear_descripcion_seccion, crear_insight, crear_recomendaciones
 )
-from utils.filtros import crear_filtros_sidebar, aplicar_filtros
-from utils.data_loader_pg import load_or_generate_data
+from utils.filtros import crear_filtro_periodo, crear_filtros_sidebar, ventana_carga, FiltroSpec
+from utils.dataset import obtener_dataset, estado_refresco
+from utils.indices import indice_filtros
+from utils.agregaciones import ContextoAgregacion
+from utils.facetas import catalogo_facetas
+from utils.cache_filtros import (
+    obtener_vista_filtrada, obtener_agregado_cubo, obtener_totales, obtener_conteos_facetas, cache_vistas,
+    obtener_distintos, obtener_distintos_por_valor, obtener_rfm
+)
+from utils.servicio_modelos import obtener_segmentacion, obtener_puntuaciones_anomalia
+from utils.segmentacion import NOMBRES_SEGMENTOS
+from utils.anomalias import modelo_anomalias
 from utils.traducciones import obtener_labels_profesionales
 
 # Labels profesionales para gráficos
@@ -53,41 +63,89 @@ LABELS = obtener_labels_profesionales()
 # Aplicar estilos globales con detección automática de tema del navegador
 aplicar_estilos_globales()
 
-@st.cache_data(ttl=60)
-def cargar_datos():
-    return load_or_generate_data()
+# El periodo se elige primero: decide qué particiones mensuales de transacciones se cargan
+filtros = crear_filtro_periodo()
 
-transacciones_df, clientes_df, productos_df = cargar_datos()
+# Dataset compartido por todas las sesiones (sin copias por sesión ni por rerun),
+# con el periodo seleccionado y la ventana de comparación anterior
+dataset = obtener_dataset(*ventana_carga(filtros))
 
-if transacciones_df is None or clientes_df is None or productos_df is None:
+if dataset is None:
     st.error("❌ Error al cargar los datos. Por favor recarga la página.")
     st.stop()
 
+# Clientes y productos se materializan por columnas solo en las pestañas que los usan
+transacciones_df = dataset.transacciones
+
 crear_header_principal(
     "📊 Analytics Ecommerce Global",
     "Plataforma Avanzada de Business Intelligence, Machine Learning y Análisis Predictivo"
 )
 
-filtros = crear_filtros_sidebar(transacciones_df)
-datos_filtrados = aplicar_filtros(transacciones_df, filtros)
+# Índice de filtros de esta versión del dataset (se construye una vez y se comparte)
+indice = indice_filtros(dataset)
+
+# Cada opción del sidebar muestra sus pedidos e ingresos con el resto de filtros aplicados
+filtros = crear_filtros_sidebar(
+    transacciones_df, filtros, catalogo_facetas(dataset),
+    lambda seleccion: obtener_conteos_facetas(dataset, seleccion, indice)
+)
+
+# Frescura del dataset: lo refresca un hilo en segundo plano, nunca la petición del usuario
+estado = estado_refresco()
+if estado['ultima_actualizacion'] is not None:
+    st.sidebar.caption(
+        f"🔄 Datos actualizados {estado['ultima_actualizacion']:%H:%M:%S} "
+        f"({estado['duracion_actualizacion']:.1f} s)"
+    )
+else:
+    st.sidebar.caption(f"🔄 Datos cargados {dataset.creado_en:%H:%M:%S}")
+# Forma canónica de los filtros: mismas filas seleccionadas, misma clave de caché
+spec = FiltroSpec.desde_filtros(filtros)
+filtros.update(spec.como_filtros())
+
+# Solo las posiciones de las filas filtradas: cada sección materializa las columnas que usa
+vista = obtener_vista_filtrada(dataset, spec, indice)
+
+def agregado_cubo(dimensiones=(), frecuencia=None):
+    """Métricas aditivas de los filtros actuales desde el cubo diario (pedidos, ingresos, beneficio, unidades, coste)"""
+    return obtener_agregado_cubo(dataset, spec, dimensiones, frecuencia, indice)
+
+# Group-by de este rerun: cada (claves, medidas) se calcula una vez para todas las pestañas
+contexto = ContextoAgregacion(vista, cubo=agregado_cubo)
+
+estadisticas_cache = cache_vistas(dataset).estadisticas()
+st.sidebar.caption(
+    f"⚡ Caché de filtros: {estadisticas_cache['aciertos']} aciertos / {estadisticas_cache['fallos']} fallos "
+    f"({estadisticas_cache['bytes_usados'] / 1e6:.0f} MB)"
+)
 
-if len(datos_filtrados) == 0:
+if vista.vacia:
     st.warning("⚠️ No hay datos que coincidan con los filtros seleccionados. Ajusta los criterios de búsqueda.")
     st.stop()
 
-tab_overview, tab_geografia, tab_rendimiento, tab_productos, tab_clientes, tab_canal, tab_ml, tab_finanzas, tab_operacional = st.tabs([
-    "🏠 Resumen General",
-    "🌍 Análisis Geográfico",
-    "📈 Rendimiento & Análisis Temporal",
-    "📦 Análisis de Productos",
-    "👥 Segmentación de Clientes",
-    "📱 Análisis de Canal",
-    "🤖 ML & IA Insights",
-    "💰 Análisis Financiero",
-    "⚙️ Métricas Operacionales"
-])
+# Router de secciones: st.tabs ejecuta el cuerpo de las nueve pestañas en cada rerun; aquí
+# solo se ejecuta la sección visible y las demás no calculan nada hasta que se eligen
+# (sus agregados y vistas quedan en la caché por filtros, así volver a ellas es inmediato)
+pestana_activa = st.radio(
+    "Sección",
+    [
+        "🏠 Resumen General",
+        "🌍 Análisis Geográfico",
+        "📈 Rendimiento & Análisis Temporal",
+        "📦 Análisis de Productos",
+        "👥 Segmentación de Clientes",
+        "📱 Análisis de Canal",
+        "🤖 ML & IA Insights",
+        "💰 Análisis Financiero",
+        "⚙️ Métricas Operacionales"
+    ],
+    horizontal=True,
+    key='pestana_activa',
+    label_visibility='collapsed'
+)
 
-with tab_overview:
+if pestana_activa == "🏠 Resumen General":
     crear_descripcion_seccion(
         "Resumen Ejecutivo",
         "Esta sección presenta una visión general del rendimiento del negocio. Los KPIs principales muestran la salud financiera, "
@@ -117,11 +175,15 @@ with tab_overview:
         **📊 Items por Pedido:** Promedio de artículos incluidos en cada transacción. Útil para estrategias de bundling y cross-selling.
         """)
     
-    ingresos_totales = datos_filtrados['total_amount_usd'].sum()
-    pedidos_totales = len(datos_filtrados)
-    ticket_promedio = datos_filtrados['total_amount_usd'].mean()
-    beneficio_total = datos_filtrados['profit'].sum()
-    clientes_unicos = datos_filtrados['customer_id'].nunique()
+    # KPIs aditivos del rango: dos accesos a las sumas prefijas diarias
+    totales = obtener_totales(dataset, spec, indice)
+    ingresos_totales = totales['ingresos']
+    pedidos_totales = totales['pedidos']
+    ticket_promedio = (ingresos_totales / pedidos_totales) if pedidos_totales > 0 else 0
+    beneficio_total = totales['beneficio']
+    # Distintos estimados con bocetos HLL diarios (exactos si los filtros no lo permiten)
+    distintos_clientes = obtener_distintos(dataset, spec, 'customer_id', indice)
+    clientes_unicos = distintos_clientes['valor']
     margen_promedio = (beneficio_total / ingresos_totales * 100) if ingresos_totales > 0 else 0
     
     fecha_inicio_comparacion = filtros['fecha_inicio'] - (filtros['fecha_fin'] - filtros['fecha_inicio'])
@@ -131,12 +193,10 @@ with tab_overview:
     filtros_periodo_anterior_overview['fecha_inicio'] = fecha_inicio_comparacion
     filtros_periodo_anterior_overview['fecha_fin'] = filtros['fecha_inicio'] - pd.Timedelta(days=1)
     
-    datos_periodo_anterior = aplicar_filtros(transacciones_df, filtros_periodo_anterior_overview)
-    
-    ingresos_anteriores = datos_periodo_anterior['total_amount_usd'].sum()
+    totales_anteriores = obtener_totales(dataset, filtros_periodo_anterior_overview, indice)
+    ingresos_anteriores, pedidos_anteriores = totales_anteriores['ingresos'], totales_anteriores['pedidos']
     cambio_ingresos = ((ingresos_totales - ingresos_anteriores) / ingresos_anteriores * 100) if ingresos_anteriores > 0 else 0
     
-    pedidos_anteriores = len(datos_periodo_anterior)
     cambio_pedidos = ((pedidos_totales - pedidos_anteriores) / pedidos_anteriores * 100) if pedidos_anteriores > 0 else 0
     
     col1, col2, col3, col4 = st.columns(4)
@@ -174,14 +234,17 @@ with tab_overview:
     with col5:
         st.metric(
             label="👥 Clientes Únicos",
-            value=f"{clientes_unicos:,}"
+            value=f"{clientes_unicos:,}",
+            help=None if distintos_clientes['exacto'] else f"Estimación HyperLogLog (error típico ±{distintos_clientes['error_relativo']:.1%})"
         )
     
     with col6:
-        productos_unicos = datos_filtrados['product_id'].nunique()
+        distintos_productos = obtener_distintos(dataset, spec, 'product_id', indice)
+        productos_unicos = distintos_productos['valor']
         st.metric(
             label="📦 Productos Vendidos",
-            value=f"{productos_unicos:,}"
+            value=f"{productos_unicos:,}",
+            help=None if distintos_productos['exacto'] else f"Estimación HyperLogLog (error típico ±{distintos_productos['error_relativo']:.1%})"
         )
     
     with col7:
@@ -192,7 +255,7 @@ with tab_overview:
         )
     
     with col8:
-        items_promedio = datos_filtrados['quantity'].mean()
+        items_promedio = vista['quantity'].mean()
         st.metric(
             label="📊 Items por Pedido",
             value=f"{items_promedio:.1f}"
@@ -204,12 +267,14 @@ with tab_overview:
     
     # Calcular métricas adicionales para insights (con protección contra división por cero)
     if ingresos_totales > 0:
-        top_pais = datos_filtrados.groupby('country')['total_amount_usd'].sum().idxmax()
-        ingresos_top_pais = datos_filtrados.groupby('country')['total_amount_usd'].sum().max()
+        ingresos_por_pais = contexto.agrupar('country', {'total_amount_usd': 'sum'}).set_index('country')['total_amount_usd']
+        top_pais = ingresos_por_pais.idxmax()
+        ingresos_top_pais = ingresos_por_pais.max()
         porcentaje_top_pais = (ingresos_top_pais / ingresos_totales * 100)
         
-        top_categoria = datos_filtrados.groupby('category')['total_amount_usd'].sum().idxmax()
-        ingresos_top_categoria = datos_filtrados.groupby('category')['total_amount_usd'].sum().max()
+        ingresos_por_categoria = contexto.agrupar('category', {'total_amount_usd': 'sum'}).set_index('category')['total_amount_usd']
+        top_categoria = ingresos_por_categoria.idxmax()
+        ingresos_top_categoria = ingresos_por_categoria.max()
         porcentaje_top_categoria = (ingresos_top_categoria / ingresos_totales * 100)
     else:
         top_pais = "N/A"
@@ -293,14 +358,7 @@ with tab_overview:
     
     crear_seccion_titulo("Evolución Temporal")
     
-    datos_temporales = datos_filtrados.copy()
-    datos_temporales['fecha'] = pd.to_datetime(datos_temporales['date'])
-    datos_temporales_agrupados = datos_temporales.groupby(datos_temporales['fecha'].dt.to_period('M')).agg({
-        'total_amount_usd': 'sum',
-        'transaction_id': 'count',
-        'profit': 'sum'
-    }).reset_index()
-    datos_temporales_agrupados['fecha'] = datos_temporales_agrupados['fecha'].dt.to_timestamp()
+    datos_temporales_agrupados = agregado_cubo(frecuencia='M')[['fecha', 'ingresos', 'pedidos', 'beneficio']]
     datos_temporales_agrupados.columns = ['Fecha', 'Ingresos', 'Pedidos', 'Beneficio']
     
     # Crear figura con eje secundario
@@ -374,7 +432,7 @@ with tab_overview:
     col_dist1, col_dist2 = st.columns(2)
     
     with col_dist1:
-        top_paises = datos_filtrados.groupby('country')['total_amount_usd'].sum().nlargest(10).reset_index()
+        top_paises = contexto.agrupar('country', {'total_amount_usd': 'sum'}).nlargest(10, 'total_amount_usd')
         fig_paises = px.bar(
             top_paises,
             x='total_amount_usd',
@@ -395,7 +453,7 @@ with tab_overview:
         st.plotly_chart(fig_paises, use_container_width=True)
     
     with col_dist2:
-        por_categoria = datos_filtrados.groupby('category')['total_amount_usd'].sum().reset_index()
+        por_categoria = contexto.agrupar('category', {'total_amount_usd': 'sum'})
         fig_categorias = px.pie(
             por_categoria,
             values='total_amount_usd',
@@ -416,7 +474,7 @@ with tab_overview:
         )
         st.plotly_chart(fig_categorias, use_container_width=True)
 
-with tab_geografia:
+if pestana_activa == "🌍 Análisis Geográfico":
     crear_descripcion_seccion(
         "Análisis de Distribución Geográfica",
         "Visualiza cómo se distribuyen tus ventas alrededor del mundo. Identifica los mercados más rentables, "
@@ -446,12 +504,10 @@ with tab_geografia:
             'Baréin': 'BHR', 'Líbano': 'LBN', 'Comunidad Europea': None
         }
         
-        datos_pais = datos_filtrados.groupby('country').agg({
-            'total_amount_usd': 'sum',
-            'transaction_id': 'count',
-            'customer_id': 'nunique'
-        }).reset_index()
-        datos_pais.columns = ['country', 'ingresos', 'pedidos', 'clientes']
+        datos_pais = contexto.agrupar('country', {'total_amount_usd': 'sum', 'transaction_id': 'count'})
+        datos_pais.columns = ['country', 'ingresos', 'pedidos']
+        clientes_pais, _ = obtener_distintos_por_valor(dataset, spec, 'customer_id', 'country', indice)
+        datos_pais['clientes'] = clientes_pais.reindex(datos_pais['country'].astype(object)).fillna(0).astype(int).to_numpy()
         datos_pais['aov'] = datos_pais['ingresos'] / datos_pais['pedidos']
         
         # Agregar códigos ISO
@@ -510,9 +566,7 @@ with tab_geografia:
     with col3:
         st.subheader("Jerarquía Geográfica (Treemap)")
         
-        datos_tree_geo = datos_filtrados.groupby(['country', 'category']).agg({
-            'total_amount_usd': 'sum'
-        }).reset_index()
+        datos_tree_geo = contexto.agrupar(['country', 'category'], {'total_amount_usd': 'sum'})
         datos_tree_geo.rename(columns={'total_amount_usd': 'ingresos'}, inplace=True)
         
         fig_tree = px.treemap(
@@ -555,7 +609,7 @@ with tab_geografia:
         fig_pie.update_layout(height=400)
         st.plotly_chart(fig_pie, use_container_width=True)
 
-with tab_rendimiento:
+if pestana_activa == "📈 Rendimiento & Análisis Temporal":
     crear_descripcion_seccion(
         "Análisis de Rendimiento y Tendencias Temporales",
         "Analiza la evolución de tus ventas a lo largo del tiempo, identifica patrones de crecimiento y estacionalidad. "
@@ -567,55 +621,128 @@ with tab_rendimiento:
     
     st.subheader("Ingresos y Pedidos a lo Largo del Tiempo")
     
-    granularidad = st.selectbox(
-        "Granularidad Temporal",
-        ['Día', 'Semana', 'Mes'],
-        index=1,
-        help="Selecciona el nivel de agregación temporal para el análisis"
-    )
-    
-    temp_df = datos_filtrados.copy()
-    if granularidad == 'Día':
-        temp_df['periodo'] = temp_df['date'].dt.date
-    elif granularidad == 'Semana':
-        temp_df['periodo'] = temp_df['date'].dt.to_period('W').dt.start_time
-    else:
-        temp_df['periodo'] = temp_df['date'].dt.to_period('M').dt.start_time
+    # Cambiar la granularidad solo vuelve a ejecutar esta sección, sobre el mismo agregado del cubo
+    @seccion_independiente
+    def serie_ingresos_pedidos(agregado_cubo):
+        granularidad = st.selectbox(
+            "Granularidad Temporal",
+            ['Día', 'Semana', 'Mes'],
+            index=1,
+            help="Selecciona el nivel de agregación temporal para el análisis"
+        )
     
-    serie_temporal = temp_df.groupby('periodo').agg({
-        'total_amount_usd': 'sum',
-        'transaction_id': 'count'
-    }).reset_index()
-    serie_temporal.columns = ['periodo', 'ingresos', 'pedidos']
+        frecuencia = {'Día': 'D', 'Semana': 'W'}.get(granularidad, 'M')
+        serie_temporal = agregado_cubo(frecuencia=frecuencia)[['fecha', 'ingresos', 'pedidos']]
+        serie_temporal.columns = ['periodo', 'ingresos', 'pedidos']
     
-    fig_tiempo = make_subplots(specs=[[{"secondary_y": True}]])
+        fig_tiempo = make_subplots(specs=[[{"secondary_y": True}]])
     
-    fig_tiempo.add_trace(
-        go.Bar(x=serie_temporal['periodo'], y=serie_temporal['ingresos'], name='Ingresos', marker_color='#667eea'),
-        secondary_y=False
-    )
+        fig_tiempo.add_trace(
+            go.Bar(x=serie_temporal['periodo'], y=serie_temporal['ingresos'], name='Ingresos', marker_color='#667eea'),
+            secondary_y=False
+        )
     
-    fig_tiempo.add_trace(
-        go.Scatter(x=serie_temporal['periodo'], y=serie_temporal['pedidos'], name='Pedidos', 
-                   line=dict(color='#f093fb', width=3), mode='lines+markers'),
-        secondary_y=True
-    )
+        fig_tiempo.add_trace(
+            go.Scatter(x=serie_temporal['periodo'], y=serie_temporal['pedidos'], name='Pedidos', 
+                       line=dict(color='#f093fb', width=3), mode='lines+markers'),
+            secondary_y=True
+        )
     
-    fig_tiempo.update_xaxes(title_text="Fecha")
-    fig_tiempo.update_yaxes(title_text="Ingresos ($)", secondary_y=False)
-    fig_tiempo.update_yaxes(title_text="Pedidos", secondary_y=True)
-    fig_tiempo.update_layout(height=400, title='Evolución de Ingresos y Pedidos')
+        fig_tiempo.update_xaxes(title_text="Fecha")
+        fig_tiempo.update_yaxes(title_text="Ingresos ($)", secondary_y=False)
+        fig_tiempo.update_yaxes(title_text="Pedidos", secondary_y=True)
+        fig_tiempo.update_layout(height=400, title='Evolución de Ingresos y Pedidos')
+    
+        st.plotly_chart(fig_tiempo, use_container_width=True)
+        
+        # Análisis de Tendencias con Promedio Móvil
+        if len(serie_temporal) > 7:
+            st.markdown("<br>", unsafe_allow_html=True)
+            st.subheader("📊 Análisis de Tendencias (Promedio Móvil)")
+        
+            # Calcular promedio móvil según granularidad
+            if granularidad == 'Día':
+                ventana_corta = 7
+                ventana_larga = 30
+                label_corta = "7 días"
+                label_larga = "30 días"
+            elif granularidad == 'Semana':
+                ventana_corta = 4
+                ventana_larga = 12
+                label_corta = "4 semanas"
+                label_larga = "12 semanas"
+            else:  # Mes
+                ventana_corta = 3
+                ventana_larga = 6
+                label_corta = "3 meses"
+                label_larga = "6 meses"
+        
+            serie_temporal_sorted = serie_temporal.sort_values('periodo').copy()
+        
+            if len(serie_temporal_sorted) >= ventana_corta:
+                serie_temporal_sorted[f'ma_{ventana_corta}'] = serie_temporal_sorted['ingresos'].rolling(window=ventana_corta, min_periods=1).mean()
+        
+            if len(serie_temporal_sorted) >= ventana_larga:
+                serie_temporal_sorted[f'ma_{ventana_larga}'] = serie_temporal_sorted['ingresos'].rolling(window=ventana_larga, min_periods=1).mean()
+        
+            fig_tendencias = go.Figure()
+        
+            # Datos reales
+            fig_tendencias.add_trace(go.Scatter(
+                x=serie_temporal_sorted['periodo'],
+                y=serie_temporal_sorted['ingresos'],
+                mode='lines+markers',
+                name='Ingresos Reales',
+                line=dict(color='rgba(102, 126, 234, 0.4)', width=1),
+                marker=dict(size=4, color='#667eea')
+            ))
+        
+            # Promedio móvil corto
+            if f'ma_{ventana_corta}' in serie_temporal_sorted.columns:
+                fig_tendencias.add_trace(go.Scatter(
+                    x=serie_temporal_sorted['periodo'],
+                    y=serie_temporal_sorted[f'ma_{ventana_corta}'],
+                    mode='lines',
+                    name=f'Tendencia {label_corta}',
+                    line=dict(color='#10B981', width=3)
+                ))
+        
+            # Promedio móvil largo
+            if f'ma_{ventana_larga}' in serie_temporal_sorted.columns:
+                fig_tendencias.add_trace(go.Scatter(
+                    x=serie_temporal_sorted['periodo'],
+                    y=serie_temporal_sorted[f'ma_{ventana_larga}'],
+                    mode='lines',
+                    name=f'Tendencia {label_larga}',
+                    line=dict(color='#F59E0B', width=2, dash='dash')
+                ))
+        
+            fig_tendencias.update_layout(
+                title=f'Tendencias de Ingresos con Promedio Móvil ({granularidad})',
+                xaxis_title='Fecha',
+                yaxis_title='Ingresos (USD)',
+                height=450,
+                hovermode='x unified',
+                legend=dict(
+                    orientation="h",
+                    yanchor="bottom",
+                    y=1.02,
+                    xanchor="right",
+                    x=1
+                )
+            )
+        
+            st.plotly_chart(fig_tendencias, use_container_width=True)
     
-    st.plotly_chart(fig_tiempo, use_container_width=True)
+    serie_ingresos_pedidos(agregado_cubo)
     
     #Análisis de Crecimiento y Momentum
     st.markdown("<br>", unsafe_allow_html=True)
     crear_seccion_titulo("Indicadores de Crecimiento")
     
     # Calcular períodos para comparación
-    datos_actuales = datos_filtrados.copy()
-    fecha_fin_actual = datos_actuales['date'].max()
-    fecha_inicio_actual = datos_actuales['date'].min()
+    fecha_fin_actual = vista['date'].max()
+    fecha_inicio_actual = vista['date'].min()
     duracion_dias = (fecha_fin_actual - fecha_inicio_actual).days
     
     # Período anterior (mismo número de días hacia atrás)
@@ -627,14 +754,12 @@ with tab_rendimiento:
     filtros_periodo_anterior['fecha_inicio'] = fecha_inicio_anterior
     filtros_periodo_anterior['fecha_fin'] = fecha_fin_anterior
     
-    datos_periodo_anterior = aplicar_filtros(transacciones_df, filtros_periodo_anterior)
+    totales_anterior = obtener_totales(dataset, filtros_periodo_anterior, indice)
+    ingresos_anterior, pedidos_anterior = totales_anterior['ingresos'], totales_anterior['pedidos']
     
     # Métricas de comparación
-    ingresos_actual = datos_actuales['total_amount_usd'].sum()
-    ingresos_anterior = datos_periodo_anterior['total_amount_usd'].sum()
-    
-    pedidos_actual = len(datos_actuales)
-    pedidos_anterior = len(datos_periodo_anterior)
+    totales_actual = obtener_totales(dataset, spec, indice)
+    ingresos_actual, pedidos_actual = totales_actual['ingresos'], totales_actual['pedidos']
     
     # Calcular variaciones
     var_ingresos = ((ingresos_actual - ingresos_anterior) / ingresos_anterior * 100) if ingresos_anterior > 0 else 0
@@ -682,92 +807,14 @@ with tab_rendimiento:
         
         st.metric("Momentum", momentum)
     
-    # Análisis de Tendencias con Promedio Móvil
-    if len(serie_temporal) > 7:
-        st.markdown("<br>", unsafe_allow_html=True)
-        st.subheader("📊 Análisis de Tendencias (Promedio Móvil)")
-        
-        # Calcular promedio móvil según granularidad
-        if granularidad == 'Día':
-            ventana_corta = 7
-            ventana_larga = 30
-            label_corta = "7 días"
-            label_larga = "30 días"
-        elif granularidad == 'Semana':
-            ventana_corta = 4
-            ventana_larga = 12
-            label_corta = "4 semanas"
-            label_larga = "12 semanas"
-        else:  # Mes
-            ventana_corta = 3
-            ventana_larga = 6
-            label_corta = "3 meses"
-            label_larga = "6 meses"
-        
-        serie_temporal_sorted = serie_temporal.sort_values('periodo').copy()
-        
-        if len(serie_temporal_sorted) >= ventana_corta:
-            serie_temporal_sorted[f'ma_{ventana_corta}'] = serie_temporal_sorted['ingresos'].rolling(window=ventana_corta, min_periods=1).mean()
-        
-        if len(serie_temporal_sorted) >= ventana_larga:
-            serie_temporal_sorted[f'ma_{ventana_larga}'] = serie_temporal_sorted['ingresos'].rolling(window=ventana_larga, min_periods=1).mean()
-        
-        fig_tendencias = go.Figure()
-        
-        # Datos reales
-        fig_tendencias.add_trace(go.Scatter(
-            x=serie_temporal_sorted['periodo'],
-            y=serie_temporal_sorted['ingresos'],
-            mode='lines+markers',
-            name='Ingresos Reales',
-            line=dict(color='rgba(102, 126, 234, 0.4)', width=1),
-            marker=dict(size=4, color='#667eea')
-        ))
-        
-        # Promedio móvil corto
-        if f'ma_{ventana_corta}' in serie_temporal_sorted.columns:
-            fig_tendencias.add_trace(go.Scatter(
-                x=serie_temporal_sorted['periodo'],
-                y=serie_temporal_sorted[f'ma_{ventana_corta}'],
-                mode='lines',
-                name=f'Tendencia {label_corta}',
-                line=dict(color='#10B981', width=3)
-            ))
-        
-        # Promedio móvil largo
-        if f'ma_{ventana_larga}' in serie_temporal_sorted.columns:
-            fig_tendencias.add_trace(go.Scatter(
-                x=serie_temporal_sorted['periodo'],
-                y=serie_temporal_sorted[f'ma_{ventana_larga}'],
-                mode='lines',
-                name=f'Tendencia {label_larga}',
-                line=dict(color='#F59E0B', width=2, dash='dash')
-            ))
-        
-        fig_tendencias.update_layout(
-            title=f'Tendencias de Ingresos con Promedio Móvil ({granularidad})',
-            xaxis_title='Fecha',
-            yaxis_title='Ingresos (USD)',
-            height=450,
-            hovermode='x unified',
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
-            )
-        )
-        
-        st.plotly_chart(fig_tendencias, use_container_width=True)
-    
     col_dist1, col_dist2 = st.columns(2)
     
     with col_dist1:
         st.subheader("Distribución de Ingresos por Día de Semana")
         from utils.traducciones import traducir_dia_semana
-        temp_df['dia_semana'] = pd.to_datetime(temp_df['date']).dt.day_name()
-        ingresos_dia = temp_df.groupby('dia_semana')['total_amount_usd'].sum().reset_index()
+        ingresos_diarios = agregado_cubo(frecuencia='D')
+        ingresos_dia = ingresos_diarios.groupby(ingresos_diarios['fecha'].dt.day_name().rename('dia_semana'))['ingresos'].sum().reset_index()
+        ingresos_dia.columns = ['dia_semana', 'total_amount_usd']
         dias_orden = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         ingresos_dia['dia_semana'] = pd.Categorical(ingresos_dia['dia_semana'], categories=dias_orden, ordered=True)
         ingresos_dia = ingresos_dia.sort_values('dia_semana')
@@ -789,8 +836,8 @@ with tab_rendimiento:
     
     with col_dist2:
         st.subheader("Distribución de Ingresos por Hora")
-        temp_df['hora'] = pd.to_datetime(temp_df['date']).dt.hour
-        ingresos_hora = temp_df.groupby('hora')['total_amount_usd'].sum().reset_index()
+        # La hora está por debajo del grano diario del cubo: se agrupan las transacciones
+        ingresos_hora = vista['total_amount_usd'].groupby(vista['date'].dt.hour.rename('hora')).sum().reset_index()
         
         fig_horas = px.line(
             ingresos_hora,
@@ -808,7 +855,7 @@ with tab_rendimiento:
         fig_horas.update_layout(height=400)
         st.plotly_chart(fig_horas, use_container_width=True)
 
-with tab_productos:
+if pestana_activa == "📦 Análisis de Productos":
     crear_descripcion_seccion(
         "Rendimiento y Estrategia de Productos",
         "Analiza qué productos generan más ingresos, cuáles tienen mejor margen y cómo se distribuyen por categorías. "
@@ -822,14 +869,16 @@ with tab_productos:
     
     # Filtrar productos no significativos (costos de envío, productos genéricos)
     productos_excluir = ['Manual', 'POSTAGE', 'DOTCOM POSTAGE', 'Adjust bad debt', 'BANK CHARGES']
-    datos_productos_reales = datos_filtrados[~datos_filtrados['product_name'].isin(productos_excluir)]
+    contexto_productos = contexto.subconjunto(
+        'productos reales', lambda vista: vista.seleccionar(~vista['product_name'].isin(productos_excluir))
+    )
     
-    top_productos = datos_productos_reales.groupby(['product_id', 'product_name', 'category']).agg({
+    top_productos = contexto_productos.agrupar(['product_id', 'product_name', 'category'], {
         'total_amount_usd': 'sum',
         'transaction_id': 'count',
         'quantity': 'sum',
         'profit': 'sum'
-    }).reset_index().nlargest(20, 'total_amount_usd')
+    }).nlargest(20, 'total_amount_usd')
     
     fig_productos = px.bar(
         top_productos,
@@ -848,11 +897,11 @@ with tab_productos:
     
     st.subheader("Top 15 Productos Más Comprados")
     
-    top_comprados = datos_productos_reales.groupby(['product_id', 'product_name', 'category']).agg({
+    top_comprados = contexto_productos.agrupar(['product_id', 'product_name', 'category'], {
         'quantity': 'sum',
         'transaction_id': 'count',
         'total_amount_usd': 'sum'
-    }).reset_index().nlargest(15, 'quantity')
+    }).nlargest(15, 'quantity')
     
     fig_comprados = px.bar(
         top_comprados,
@@ -873,9 +922,7 @@ with tab_productos:
     
     with col1:
         st.subheader("Ingresos por Categoría (Treemap)")
-        datos_categoria = datos_filtrados.groupby(['category', 'subcategory']).agg({
-            'total_amount_usd': 'sum'
-        }).reset_index()
+        datos_categoria = contexto.agrupar(['category', 'subcategory'], {'total_amount_usd': 'sum'})
         
         fig_tree_cat = px.treemap(
             datos_categoria,
@@ -897,10 +944,7 @@ with tab_productos:
     
     with col2:
         st.subheader("Margen por Categoría")
-        margen_cat = datos_filtrados.groupby('category').agg({
-            'total_amount_usd': 'sum',
-            'profit': 'sum'
-        }).reset_index()
+        margen_cat = contexto.agrupar('category', {'total_amount_usd': 'sum', 'profit': 'sum'})
         margen_cat['margen_%'] = (margen_cat['profit'] / margen_cat['total_amount_usd'] * 100)
         
         fig_margen = px.bar(
@@ -919,10 +963,10 @@ with tab_productos:
     st.subheader("Análisis de Performance de Productos (Matriz BCG)")
     
     # Usar los mismos datos filtrados (productos reales, sin envíos)
-    productos_bcg = datos_productos_reales.groupby(['product_id', 'product_name']).agg({
+    productos_bcg = contexto_productos.agrupar(['product_id', 'product_name'], {
         'total_amount_usd': 'sum',
         'transaction_id': 'count'
-    }).reset_index()
+    })
     productos_bcg.columns = ['product_id', 'producto', 'ingresos', 'frecuencia']
     productos_bcg['ingresos_formato'] = productos_bcg['ingresos'].apply(lambda x: f"${x:,.0f}")
     
@@ -995,7 +1039,7 @@ with tab_productos:
             count = len(productos_bcg[productos_bcg['cuadrante'] == cuadrante])
             st.metric(cuadrante, f"{count} productos")
 
-with tab_clientes:
+if pestana_activa == "👥 Segmentación de Clientes":
     crear_descripcion_seccion(
         "Conoce a Tus Clientes en Profundidad",
         "Esta sección te permite entender quiénes son tus mejores clientes, cuáles están en riesgo de abandonar y cómo puedes "
@@ -1007,10 +1051,12 @@ with tab_clientes:
     
     st.subheader("Análisis RFM (Recencia, Frecuencia, Monetario)")
     
-    clientes_filt = clientes_df[clientes_df['customer_id'].isin(datos_filtrados['customer_id'].unique())]
+    clientes_df = dataset.clientes.columnas(['customer_id', 'rfm_segment', 'lifetime_value', 'churn_probability'])
+    clientes_filt = clientes_df[clientes_df['customer_id'].isin(vista['customer_id'].unique())]
     
     rfm_segments = clientes_filt['rfm_segment'].value_counts().reset_index()
     rfm_segments.columns = ['segmento', 'cantidad']
+    rfm_segments = rfm_segments[rfm_segments['cantidad'] > 0]
     
     col1, col2 = st.columns([6, 4])
     
@@ -1066,7 +1112,7 @@ with tab_clientes:
     fig_ltv_dist.update_layout(height=400, showlegend=False)
     st.plotly_chart(fig_ltv_dist, use_container_width=True)
     
-    if filtros.get('mostrar_ml') and len(datos_filtrados) > 100:
+    if filtros.get('mostrar_ml') and len(vista) > 100:
         crear_seccion_titulo("Segmentación Inteligente de Clientes (K-Means)")
         
         crear_descripcion_seccion(
@@ -1077,42 +1123,23 @@ with tab_clientes:
         )
         
         try:
-            from sklearn.cluster import KMeans
-            from sklearn.preprocessing import StandardScaler
-            
-            fecha_analisis = datos_filtrados['date'].max()
-            
-            rfm_data = datos_filtrados.groupby('customer_id').agg({
-                'date': lambda x: (fecha_analisis - x.max()).days,
-                'transaction_id': 'count',
-                'total_amount_usd': 'sum'
-            }).reset_index()
-            rfm_data.columns = ['customer_id', 'recency', 'frequency', 'monetary']
+            # RFM vectorizado y cacheado por filtros (copia: se le añaden columnas de cluster)
+            rfm_data = obtener_rfm(dataset, spec, indice).copy()
             
-            rfm_data = rfm_data.merge(
-                clientes_df[['customer_id', 'lifetime_value']], 
-                on='customer_id', 
-                how='left'
-            )
-            
-            features_clustering = rfm_data[['recency', 'frequency', 'monetary', 'lifetime_value']].fillna(0)
+            # Segmentos del modelo registrado, cacheados por filtros; etiqueta 0 = segmento de más valor
+            segmentacion = obtener_segmentacion(dataset, spec, n_clusters=len(NOMBRES_SEGMENTOS), indice=indice) \
+                if len(rfm_data) > 10 else None
             
-            if len(features_clustering) > 10:
-                scaler = StandardScaler()
-                features_scaled = scaler.fit_transform(features_clustering)
-                
-                kmeans = KMeans(n_clusters=4, random_state=42, n_init=10)
-                clusters = kmeans.fit_predict(features_scaled)
-                
-                rfm_data['cluster'] = clusters
-                rfm_data['cluster_nombre'] = rfm_data['cluster'].map({
-                    0: 'Premium',
-                    1: 'Activo',
-                    2: 'En Riesgo',
-                    3: 'Inactivo'
-                })
+            if len(rfm_data) > 10 and segmentacion is None:
+                st.info(
+                    "ℹ️ El modelo de segmentación aún no está entrenado. Ejecuta "
+                    "`python -m utils.reentrenar_modelos segmentacion` para publicarlo."
+                )
+            elif len(rfm_data) > 10:
+                rfm_data['cluster'] = segmentacion['etiquetas']
+                rfm_data['cluster_nombre'] = rfm_data['cluster'].map(dict(enumerate(NOMBRES_SEGMENTOS)))
                 
-                muestra_viz = rfm_data.sample(min(1000, len(rfm_data)))
+                muestra_viz = rfm_data.sample(min(1000, len(rfm_data)), random_state=42)
                 
                 fig_clusters = px.scatter_3d(
                     muestra_viz,
@@ -1306,7 +1333,7 @@ with tab_clientes:
     
     crear_recomendaciones("Acciones Recomendadas para Reducir Churn", recomendaciones_churn)
 
-with tab_canal:
+if pestana_activa == "📱 Análisis de Canal":
     crear_descripcion_seccion(
         "Optimización de Canales de Venta",
         "Descubre qué dispositivos (móvil, escritorio, tablet) generan más ventas, qué fuentes de tráfico son más rentables "
@@ -1320,7 +1347,7 @@ with tab_canal:
     
     with col1:
         st.subheader("Ingresos por Tipo de Dispositivo")
-        dispositivos = datos_filtrados.groupby('device_type')['total_amount_usd'].sum().reset_index()
+        dispositivos = contexto.agrupar('device_type', {'total_amount_usd': 'sum'})
         
         fig_dispositivos = px.pie(
             dispositivos,
@@ -1338,7 +1365,7 @@ with tab_canal:
     
     with col2:
         st.subheader("Fuentes de Tráfico")
-        trafico = datos_filtrados.groupby('traffic_source')['total_amount_usd'].sum().reset_index()
+        trafico = contexto.agrupar('traffic_source', {'total_amount_usd': 'sum'})
         
         fig_trafico = px.bar(
             trafico.sort_values('total_amount_usd', ascending=False),
@@ -1355,10 +1382,7 @@ with tab_canal:
     
     st.subheader("Métodos de Pago")
     
-    pagos = datos_filtrados.groupby('payment_method').agg({
-        'total_amount_usd': 'sum',
-        'transaction_id': 'count'
-    }).reset_index()
+    pagos = contexto.agrupar('payment_method', {'total_amount_usd': 'sum', 'transaction_id': 'count'})
     pagos.columns = ['metodo', 'ingresos', 'transacciones']
     
     fig_pagos = px.bar(
@@ -1387,7 +1411,7 @@ with tab_canal:
     st.subheader("Flujo de Conversión (Diagrama Sankey)")
     
     try:
-        sankey_data = datos_filtrados.groupby(['traffic_source', 'device_type', 'payment_method'])['total_amount_usd'].sum().reset_index()
+        sankey_data = contexto.agrupar(['traffic_source', 'device_type', 'payment_method'], {'total_amount_usd': 'sum'})
         sankey_top = sankey_data.nlargest(30, 'total_amount_usd')
         
         labels_list = list(pd.concat([
@@ -1435,7 +1459,7 @@ with tab_canal:
     except Exception as e:
         st.warning(f"No se pudo generar diagrama Sankey: {str(e)}")
 
-with tab_ml:
+if pestana_activa == "🤖 ML & IA Insights":
     crear_descripcion_seccion(
         "Inteligencia Artificial para Decisiones Estratégicas",
         "Esta sección combina múltiples modelos de machine learning para detectar patrones ocultos, anomalías en ventas y "
@@ -1451,22 +1475,30 @@ with tab_ml:
         st.subheader("🔍 Detección de Anomalías (Isolation Forest)")
         
         try:
-            from sklearn.ensemble import IsolationForest
-            
-            features_anomaly = datos_filtrados[['total_amount_usd', 'quantity', 'profit']].dropna()
+            # Modelo del registro puntuado una vez por versión del dataset; aquí solo se leen las puntuaciones
+            puntuaciones = obtener_puntuaciones_anomalia(dataset, spec, indice)
+            puntuadas = ~np.isnan(puntuaciones) if puntuaciones is not None else None
             
-            if len(features_anomaly) > 100:
-                iso_forest = IsolationForest(contamination=0.05, random_state=42)
-                anomalias = iso_forest.fit_predict(features_anomaly)
-                
-                datos_anomalias = datos_filtrados.loc[features_anomaly.index].copy()
-                datos_anomalias['es_anomalia'] = anomalias == -1
+            if puntuaciones is None:
+                st.info(
+                    "ℹ️ El modelo de anomalías aún no está entrenado. Ejecuta "
+                    "`python -m utils.reentrenar_modelos anomalias` para publicarlo."
+                )
+            elif puntuadas.sum() > 100:
+                metadatos_modelo = modelo_anomalias(dataset).metadatos
+                st.caption(
+                    f"Modelo {metadatos_modelo.get('version', 'sin registrar')} · entrenado el "
+                    f"{metadatos_modelo.get('creado_en', '—')} con "
+                    f"{metadatos_modelo.get('metricas', {}).get('filas_entrenamiento', 0):,} transacciones de muestra"
+                )
+                datos_anomalias = vista.seleccionar(puntuadas).materializar(['quantity', 'total_amount_usd', 'profit'])
+                datos_anomalias['es_anomalia'] = puntuaciones[puntuadas] < 0
                 
                 col1, col2 = st.columns([7, 3])
                 
                 with col1:
                     fig_anomalias = px.scatter(
-                        datos_anomalias.sample(min(2000, len(datos_anomalias))),
+                        datos_anomalias.sample(min(2000, len(datos_anomalias)), random_state=42),
                         x='quantity',
                         y='total_amount_usd',
                         color='es_anomalia',
@@ -1504,7 +1536,7 @@ with tab_ml:
         try:
             correlacion_cols = ['total_amount_usd', 'quantity', 'profit', 'unit_price']
             labels_es = ['Ingresos (USD)', 'Cantidad', 'Beneficio (USD)', 'Precio Unitario']
-            corr_data = datos_filtrados[correlacion_cols].corr()
+            corr_data = vista.columnas(correlacion_cols).corr()
             
             # Renombrar índices y columnas con labels en español
             corr_data.index = labels_es
@@ -1530,7 +1562,7 @@ with tab_ml:
         st.subheader("🎯 Top Productos Recomendados (Market Basket Analysis)")
         
         try:
-            productos_frecuentes = datos_filtrados.groupby('product_name')['transaction_id'].count().reset_index()
+            productos_frecuentes = contexto.agrupar('product_name', {'transaction_id': 'count'})
             productos_frecuentes.columns = ['producto', 'frecuencia']
             top_productos_rec = productos_frecuentes.nlargest(15, 'frecuencia')
             
@@ -1550,7 +1582,7 @@ with tab_ml:
         except Exception as e:
             st.warning(f"No se pudo generar análisis de recomendaciones: {str(e)}")
 
-with tab_finanzas:
+if pestana_activa == "💰 Análisis Financiero":
     crear_descripcion_seccion(
         "Salud Financiera del Negocio",
         "Analiza en detalle la rentabilidad de tu negocio. El estado de Pérdidas y Ganancias (P&L) muestra la cascada de "
@@ -1562,9 +1594,10 @@ with tab_finanzas:
     
     st.subheader("💰 Estado de Pérdidas y Ganancias (P&L)")
     
-    total_ingresos = datos_filtrados['total_amount_usd'].sum()
-    total_beneficio = datos_filtrados['profit'].sum()
-    costo_total = total_ingresos - total_beneficio
+    totales = obtener_totales(dataset, spec, indice)
+    total_ingresos = totales['ingresos']
+    total_beneficio = totales['beneficio']
+    costo_total = totales['coste']
     margen_beneficio = (total_beneficio / total_ingresos * 100) if total_ingresos > 0 else 0
     
     col_pl1, col_pl2, col_pl3, col_pl4 = st.columns(4)
@@ -1618,10 +1651,7 @@ with tab_finanzas:
     
     with col_fin1:
         st.subheader("Márgenes por Categoría")
-        margenes_cat = datos_filtrados.groupby('category').agg({
-            'total_amount_usd': 'sum',
-            'profit': 'sum'
-        }).reset_index()
+        margenes_cat = contexto.agrupar('category', {'total_amount_usd': 'sum', 'profit': 'sum'})
         margenes_cat['margen_%'] = (margenes_cat['profit'] / margenes_cat['total_amount_usd'] * 100)
         
         fig_margenes = px.bar(
@@ -1639,9 +1669,8 @@ with tab_finanzas:
     
     with col_fin2:
         st.subheader("Evolución del Beneficio Mensual")
-        temp_df = datos_filtrados.copy()
-        temp_df['mes'] = temp_df['date'].dt.to_period('M').dt.start_time
-        beneficio_mensual = temp_df.groupby('mes')['profit'].sum().reset_index()
+        beneficio_mensual = agregado_cubo(frecuencia='M')[['fecha', 'beneficio']]
+        beneficio_mensual.columns = ['mes', 'profit']
         
         # Calcular tendencia y proyección (próximos 3 meses)
         mostrar_proyeccion = len(beneficio_mensual) >= 3
@@ -1727,9 +1756,9 @@ with tab_finanzas:
     
     col_metricas = st.columns(4)
     
-    num_clientes = datos_filtrados['customer_id'].nunique()
+    num_clientes = obtener_distintos(dataset, spec, 'customer_id', indice)['valor']
     cac = costo_total / num_clientes if num_clientes > 0 else 0
-    ltv_promedio = clientes_df['lifetime_value'].mean()
+    ltv_promedio = dataset.clientes.columnas(['lifetime_value'])['lifetime_value'].mean()
     ltv_cac_ratio = ltv_promedio / cac if cac > 0 else 0
     roas = total_ingresos / costo_total if costo_total > 0 else 0
     
@@ -1740,10 +1769,10 @@ with tab_finanzas:
     with col_metricas[2]:
         st.metric("ROAS", f"{roas:.2f}x")
     with col_metricas[3]:
-        aov = datos_filtrados['total_amount_usd'].mean()
+        aov = vista['total_amount_usd'].mean()
         st.metric("AOV (Valor Promedio)", f"${aov:,.0f}")
 
-with tab_operacional:
+if pestana_activa == "⚙️ Métricas Operacionales":
     crear_descripcion_seccion(
         "Eficiencia Operativa y Logística",
         "Monitorea la eficiencia de tus operaciones diarias. Analiza tiempos de procesamiento de pedidos, rotación de inventario, "
@@ -1755,10 +1784,10 @@ with tab_operacional:
     
     st.subheader("📦 KPIs Operativos Principales")
     
-    total_pedidos = datos_filtrados['transaction_id'].nunique()
-    total_unidades = datos_filtrados['quantity'].sum()
-    promedio_unidades_pedido = datos_filtrados.groupby('transaction_id')['quantity'].sum().mean()
-    tasa_conversion = (total_pedidos / len(datos_filtrados) * 100) if len(datos_filtrados) > 0 else 0
+    total_pedidos = vista['transaction_id'].nunique()
+    total_unidades = vista['quantity'].sum()
+    promedio_unidades_pedido = contexto.agrupar('transaction_id', {'quantity': 'sum'})['quantity'].mean()
+    tasa_conversion = (total_pedidos / len(vista) * 100) if len(vista) > 0 else 0
     
     col_op1, col_op2, col_op3, col_op4 = st.columns(4)
     
@@ -1776,9 +1805,9 @@ with tab_operacional:
     with col_op_viz1:
         st.subheader("Pedidos por Día de Semana")
         from utils.traducciones import traducir_dia_semana
-        temp_df = datos_filtrados.copy()
-        temp_df['dia_semana'] = pd.to_datetime(temp_df['date']).dt.day_name()
-        pedidos_dia = temp_df.groupby('dia_semana')['transaction_id'].nunique().reset_index()
+        pedidos_diarios = agregado_cubo(frecuencia='D')
+        pedidos_dia = pedidos_diarios.groupby(pedidos_diarios['fecha'].dt.day_name().rename('dia_semana'))['pedidos'].sum().reset_index()
+        pedidos_dia.columns = ['dia_semana', 'transaction_id']
         dias_orden = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         pedidos_dia['dia_semana'] = pd.Categorical(pedidos_dia['dia_semana'], categories=dias_orden, ordered=True)
         pedidos_dia = pedidos_dia.sort_values('dia_semana')
@@ -1804,7 +1833,7 @@ with tab_operacional:
     
     with col_op_viz2:
         st.subheader("Distribución de Cantidad por Pedido")
-        cantidades_pedido = datos_filtrados.groupby('transaction_id')['quantity'].sum()
+        cantidades_pedido = contexto.agrupar('transaction_id', {'quantity': 'sum'}).set_index('transaction_id')['quantity']
         
         fig_cantidad = px.histogram(
             cantidades_pedido,
@@ -1819,14 +1848,7 @@ with tab_operacional:
     
     st.subheader("⏱️ Análisis de Velocidad de Ventas")
     
-    temp_df = datos_filtrados.copy()
-    temp_df['fecha'] = pd.to_datetime(temp_df['date']).dt.date
-    ventas_diarias = temp_df.groupby('fecha').agg({
-        'transaction_id': 'nunique',
-        'quantity': 'sum',
-        'total_amount_usd': 'sum'
-    }).reset_index()
-    ventas_diarias.columns = ['fecha', 'pedidos', 'unidades', 'ingresos']
+    ventas_diarias = agregado_cubo(frecuencia='D')[['fecha', 'pedidos', 'unidades', 'ingresos']]
     
     fig_velocidad = make_subplots(specs=[[{"secondary_y": True}]])
     
@@ -1861,12 +1883,12 @@ with tab_operacional:
     
     # Filtrar productos no significativos (mismos que en Top 20)
     productos_excluir = ['Manual', 'POSTAGE', 'DOTCOM POSTAGE', 'Adjust bad debt', 'BANK CHARGES']
-    datos_operacionales_reales = datos_filtrados[~datos_filtrados['product_name'].isin(productos_excluir)]
-    
-    rotacion_productos = datos_operacionales_reales.groupby(['product_name', 'category']).agg({
+    rotacion_productos = contexto.subconjunto(
+        'productos reales', lambda vista: vista.seleccionar(~vista['product_name'].isin(productos_excluir))
+    ).agrupar(['product_name', 'category'], {
         'quantity': 'sum',
         'transaction_id': 'count'
-    }).reset_index()
+    })
     rotacion_productos.columns = ['producto', 'categoria', 'unidades_vendidas', 'frecuencia']
     rotacion_productos['velocidad'] = rotacion_productos['unidades_vendidas'] * rotacion_productos['frecuencia']
     top_rotacion = rotacion_productos.nlargest(15, 'velocidad')
@@ -1887,3 +1909,5 @@ with tab_operacional:
     st.plotly_chart(fig_rotacion, use_container_width=True)
 
 crear_pie_pagina()
+
+contexto.registrar()
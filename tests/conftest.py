@@ -0,0 +1,55 @@
+"""
+Datos sintéticos compartidos por las pruebas
+Autor: cmsr92
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.filtros import COLUMNAS_FILTRO  # noqa: E402
+
+VALORES_DIMENSION = {
+    'country': ['Alemania', 'España', 'Francia', 'Reino Unido'],
+    'region': ['Europa', 'Europa del Norte'],
+    'category': ['Electrónica', 'Hogar', 'Moda'],
+    'subcategory': ['Móviles', 'Portátiles', 'Cocina', 'Calzado'],
+    'customer_segment': ['Nuevo', 'Recurrente'],
+    'payment_method': ['Tarjeta', 'PayPal'],
+    'device_type': ['Móvil', 'Escritorio'],
+    'traffic_source': ['Orgánico', 'Pago', 'Email']
+}
+
+
+def transacciones_sinteticas(num_filas=20000, fraccion_nulos=0.02, random_state=0):
+    """Transacciones ordenadas por fecha, con dimensiones categóricas y algunos nulos en ellas"""
+    rng = np.random.default_rng(random_state)
+    fechas = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 365 * 24 * 3600, num_filas)), unit='s')
+    cantidades = rng.integers(1, 6, num_filas)
+    precios = rng.uniform(5, 500, num_filas).round(2)
+    importes = (cantidades * precios).round(2)
+    df = pd.DataFrame({
+        'transaction_id': [f"T{i:07d}" for i in range(num_filas)],
+        'date': fechas,
+        'customer_id': pd.Categorical([f"C{i:05d}" for i in rng.integers(0, 3000, num_filas)]),
+        'product_id': pd.Categorical([f"P{i:04d}" for i in rng.integers(0, 500, num_filas)]),
+        'quantity': cantidades,
+        'unit_price': precios,
+        'total_amount_usd': importes,
+        'profit': (importes * rng.uniform(0.05, 0.4, num_filas)).round(2)
+    })
+    for columna in COLUMNAS_FILTRO.values():
+        valores = pd.Series(rng.choice(VALORES_DIMENSION[columna], num_filas), dtype='object')
+        valores[rng.random(num_filas) < fraccion_nulos] = None
+        df[columna] = valores.astype('category')
+    return df
+
+
+@pytest.fixture(scope='session')
+def transacciones():
+    return transacciones_sinteticas()
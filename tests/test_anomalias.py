@@ -0,0 +1,63 @@
+"""
+Pruebas del modelo de anomalías entrenado una vez y puntuado por versión del dataset
+Autor: cmsr92
+"""
+
+import numpy as np
+
+from conftest import transacciones_sinteticas
+from utils.anomalias import ModeloAnomalias, muestra_estratificada
+from utils.filtros import filtrar_vista
+
+
+def test_muestra_estratificada_proporcional():
+    estratos = np.repeat([0, 1, 2, -1], [6000, 3000, 990, 10])
+    muestra = muestra_estratificada(estratos, 1000)
+
+    assert len(muestra) <= 1000
+    assert np.all(np.diff(muestra) > 0)
+    conteos = dict(zip(*np.unique(estratos[muestra], return_counts=True)))
+    assert conteos == {-1: 1, 0: 600, 1: 300, 2: 99}
+    np.testing.assert_array_equal(muestra_estratificada(estratos[:500], 1000), np.arange(500))
+
+
+def _con_nulos(df):
+    df = df.copy()
+    df.loc[df.index[::97], 'profit'] = np.nan
+    return df
+
+
+def test_entrenar_con_muestra_y_puntuar_todas_las_filas():
+    df = _con_nulos(transacciones_sinteticas(num_filas=8000, random_state=11))
+    modelo, metricas = ModeloAnomalias.entrenar(df, tamano_muestra=2000)
+
+    assert metricas['filas_entrenamiento'] <= 2000
+    assert metricas['filas_dataset'] == len(df)
+
+    puntuaciones = ModeloAnomalias.puntuar(modelo, df)
+    assert len(puntuaciones) == len(df)
+    np.testing.assert_array_equal(np.isnan(puntuaciones), df['profit'].isna().to_numpy())
+    assert 0 < np.mean(puntuaciones[~np.isnan(puntuaciones)] < 0) < 0.2
+
+
+def test_extender_solo_puntua_el_anexo_y_coincide_con_puntuar_todo():
+    df = _con_nulos(transacciones_sinteticas(num_filas=6000, random_state=12))
+    previas, nuevas = df.iloc[:5000], df.iloc[5000:]
+    modelo, _ = ModeloAnomalias.entrenar(previas, tamano_muestra=1500)
+
+    extendido = ModeloAnomalias.construir(modelo, {'version': 'v1'}, previas).extender(nuevas)
+    completo = ModeloAnomalias.construir(modelo, {'version': 'v1'}, df)
+
+    assert extendido.modelo is modelo and extendido.metadatos['version'] == 'v1'
+    np.testing.assert_allclose(extendido.puntuaciones, completo.puntuaciones, equal_nan=True)
+
+
+def test_puntuaciones_de_una_vista(transacciones):
+    modelo, _ = ModeloAnomalias.entrenar(transacciones, tamano_muestra=3000)
+    servido = ModeloAnomalias.construir(modelo, {}, transacciones)
+    vista = filtrar_vista(transacciones, {'paises': ['Francia']})
+
+    np.testing.assert_allclose(
+        servido.puntuaciones_de(vista.filas),
+        ModeloAnomalias.puntuar(modelo, vista.materializar())
+    )
@@ -0,0 +1,72 @@
+"""
+Pruebas de la caché LRU de vistas filtradas
+Autor: cmsr92
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.cache_filtros import CacheLRU, cache_vistas, obtener_vista_filtrada, tamano_bytes
+from utils.dataset import DatasetCompartido
+from utils.filtros import FiltroSpec, mascara_filtros
+
+
+def _dataset(transacciones):
+    return DatasetCompartido(transacciones, pd.DataFrame(), pd.DataFrame(), version='pruebas')
+
+
+def test_lru_expulsa_la_entrada_menos_usada():
+    cache = CacheLRU(presupuesto_bytes=3000)
+    for clave in ('a', 'b', 'c'):
+        cache.obtener(clave, lambda: np.zeros(100))  # 800 bytes cada una
+    cache.obtener('a', lambda: None)
+    cache.obtener('d', lambda: np.zeros(100))
+
+    assert len(cache) == 3
+    assert cache.obtener('b', lambda: 'recalculado') == 'recalculado'
+    estadisticas = cache.estadisticas()
+    assert estadisticas['expulsiones'] >= 1
+    assert estadisticas['bytes_usados'] <= 3000
+
+
+def test_valor_mayor_que_el_presupuesto_no_se_guarda():
+    cache = CacheLRU(presupuesto_bytes=100)
+    assert len(cache.obtener('grande', lambda: np.zeros(1000))) == 1000
+    assert len(cache) == 0 and cache.bytes_usados == 0
+
+
+def test_misma_spec_se_sirve_de_la_cache(transacciones):
+    dataset = _dataset(transacciones)
+    filtros = {'fecha_inicio': '2024-02-01', 'fecha_fin': '2024-02-29', 'paises': ['Francia', 'España']}
+    # Mismos filtros con otro orden de selección y otra hora: misma spec canónica
+    equivalentes = {'fecha_inicio': '2024-02-01 10:30', 'fecha_fin': '2024-02-29', 'paises': ['España', 'Francia']}
+
+    vista = obtener_vista_filtrada(dataset, filtros)
+    assert obtener_vista_filtrada(dataset, equivalentes) is vista
+    assert cache_vistas(dataset).estadisticas()['aciertos'] == 1
+
+    canonicos = FiltroSpec.desde_filtros(filtros).como_filtros()
+    np.testing.assert_array_equal(vista.filas, np.flatnonzero(mascara_filtros(transacciones, canonicos)))
+
+
+def test_columnas_materializadas_cuentan_en_el_presupuesto(transacciones):
+    dataset = _dataset(transacciones)
+    cache = cache_vistas(dataset)
+    vista = obtener_vista_filtrada(dataset, {'categorias': ['Hogar']})
+    solo_filas = cache.bytes_usados
+    assert solo_filas == vista.filas.nbytes
+
+    vista['customer_id']
+    vista['total_amount_usd']
+    assert cache.bytes_usados == solo_filas + tamano_bytes(vista['customer_id']) + tamano_bytes(vista['total_amount_usd'])
+
+
+def test_reajustar_expulsa_si_la_vista_crece_por_encima_del_presupuesto(transacciones):
+    dataset = _dataset(transacciones)
+    cache = cache_vistas(dataset)
+    vista = obtener_vista_filtrada(dataset, {})
+    cache.presupuesto_bytes = vista.filas.nbytes + 1000
+
+    vista['total_amount_usd']
+    assert len(cache) == 0 and cache.bytes_usados == 0
+    assert cache.estadisticas()['expulsiones'] == 1
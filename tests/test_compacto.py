@@ -0,0 +1,20 @@
+"""
+Pruebas del modo compacto de la tabla de hechos
+Autor: cmsr92
+"""
+
+import numpy as np
+
+from conftest import transacciones_sinteticas
+from utils.data_loader_pg import COLUMNAS_MEDIDAS, compactar_transacciones
+
+
+def test_medidas_sumadas_conservan_los_centimos():
+    df = transacciones_sinteticas(num_filas=200000, fraccion_nulos=0.0, random_state=1)
+    df['total_amount_usd'] = df['total_amount_usd'] * 50
+    compacto, _, _ = compactar_transacciones(df)
+
+    assert compacto['unit_price'].dtype == np.float32
+    for col in COLUMNAS_MEDIDAS:
+        assert compacto[col].dtype == np.float64
+        assert round(compacto[col].sum(), 2) == round(df[col].sum(), 2)
@@ -0,0 +1,100 @@
+"""
+Pruebas del cubo diario y las sumas prefijas frente a la máscara de filtros
+Autor: cmsr92
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.cache_filtros import obtener_agregado_cubo
+from utils.cubo import CuboDiario
+from utils.dataset import DatasetCompartido
+from utils.filtros import COLUMNAS_FILTRO, mascara_filtros
+from utils.sumas_prefijas import SumasPrefijas
+
+FILTROS = [
+    {},
+    {'fecha_inicio': '2024-03-01', 'fecha_fin': '2024-06-30 23:59:59'},
+    {'paises': ['España', 'Francia']},
+    {'categorias': ['Hogar'], 'dispositivos': ['Móvil'], 'fecha_inicio': '2024-05-01'}
+]
+
+
+def _totales_filas(df, filtros):
+    filas = df[mascara_filtros(df, filtros)]
+    return len(filas), filas['total_amount_usd'].sum(), filas['profit'].sum()
+
+
+@pytest.mark.parametrize('filtros', FILTROS)
+def test_cubo_cuenta_filas_con_dimensiones_nulas(transacciones, filtros):
+    assert transacciones['country'].isna().any()
+    pedidos, ingresos, beneficio = _totales_filas(transacciones, filtros)
+
+    total = CuboDiario.construir(transacciones).agregar(filtros).iloc[0]
+    assert total['pedidos'] == pedidos
+    assert total['ingresos'] == pytest.approx(ingresos)
+    assert total['beneficio'] == pytest.approx(beneficio)
+
+
+@pytest.mark.parametrize('filtros', FILTROS[:3])
+def test_sumas_prefijas_igual_que_mascara(transacciones, filtros):
+    pedidos, ingresos, _ = _totales_filas(transacciones, filtros)
+    totales = SumasPrefijas.construir(CuboDiario.construir(transacciones)).consultar(filtros)
+    assert totales['pedidos'] == pedidos
+    assert totales['ingresos'] == pytest.approx(ingresos)
+
+
+def test_cubo_extendido_igual_que_construido(transacciones):
+    corte = len(transacciones) * 3 // 4
+    extendido = CuboDiario.construir(transacciones.iloc[:corte]).extender(transacciones.iloc[corte:], transacciones)
+    assert extendido.agregar({}).iloc[0]['pedidos'] == len(transacciones)
+    assert np.isclose(extendido.agregar({}).iloc[0]['ingresos'], transacciones['total_amount_usd'].sum())
+
+
+@pytest.mark.parametrize('clave, columna', list(COLUMNAS_FILTRO.items()))
+@pytest.mark.parametrize('fecha_inicio, fecha_fin', [(None, None), ('2024-04-03', '2024-09-17 23:59:59')])
+def test_sumas_prefijas_igual_que_groupby(transacciones, clave, columna, fecha_inicio, fecha_fin):
+    sumas = SumasPrefijas.construir(CuboDiario.construir(transacciones))
+    rango = {'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin}
+    filas = transacciones[mascara_filtros(transacciones, rango)]
+    esperado = filas.groupby(columna, observed=True).agg(
+        pedidos=('transaction_id', 'count'),
+        ingresos=('total_amount_usd', 'sum'),
+        beneficio=('profit', 'sum'),
+        unidades=('quantity', 'sum')
+    )
+
+    for valor, fila in esperado.iterrows():
+        totales = sumas.consultar({**rango, clave: [valor]})
+        assert totales['pedidos'] == fila['pedidos']
+        assert totales['unidades'] == fila['unidades']
+        assert totales['ingresos'] == pytest.approx(fila['ingresos'])
+        assert totales['beneficio'] == pytest.approx(fila['beneficio'])
+        assert totales['coste'] == pytest.approx(fila['ingresos'] - fila['beneficio'])
+
+
+def test_sumas_prefijas_no_resuelven_precio_ni_varias_selecciones(transacciones):
+    sumas = SumasPrefijas.construir(CuboDiario.construir(transacciones))
+    assert sumas.consultar({'paises': ['España'], 'categorias': ['Hogar']}) is None
+    assert sumas.consultar({'precio_min': 100.0, 'precio_max': 200.0}) is None
+    assert sumas.consultar({'fecha_inicio': '2030-01-01'})['pedidos'] == 0
+
+
+@pytest.mark.parametrize('frecuencia, periodo', [('D', 'D'), ('W', 'W'), ('M', 'M')])
+@pytest.mark.parametrize('filtros', [
+    {'paises': ['Francia'], 'fecha_inicio': '2024-02-01', 'fecha_fin': '2024-07-31 23:59:59'},
+    # El filtro de precio no lo resuelve el cubo: se agregan las filas filtradas
+    {'categorias': ['Moda'], 'precio_min': 50.0, 'precio_max': 250.0}
+])
+def test_serie_temporal_por_granularidad(transacciones, frecuencia, periodo, filtros):
+    dataset = DatasetCompartido(transacciones, pd.DataFrame(), pd.DataFrame(), version='pruebas')
+    serie = obtener_agregado_cubo(dataset, filtros, frecuencia=frecuencia)
+
+    filas = transacciones[mascara_filtros(transacciones, filtros)]
+    inicio_periodo = filas['date'].dt.to_period(periodo).dt.start_time.rename('fecha')
+    esperado = filas.groupby(inicio_periodo)['total_amount_usd'].agg(['count', 'sum'])
+
+    np.testing.assert_array_equal(serie['fecha'].to_numpy(), esperado.index.to_numpy())
+    np.testing.assert_array_equal(serie['pedidos'].to_numpy(), esperado['count'].to_numpy())
+    np.testing.assert_allclose(serie['ingresos'].to_numpy(), esperado['sum'].to_numpy())
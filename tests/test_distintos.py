@@ -0,0 +1,43 @@
+"""
+Pruebas de los bocetos HLL diarios frente a los recuentos exactos
+Autor: cmsr92
+"""
+
+import pytest
+
+from utils.distintos import ERROR_RELATIVO_HLL, BocetosDiarios
+from utils.filtros import mascara_filtros
+
+# Margen de 4 errores típicos sobre el recuento exacto
+TOLERANCIA = 4 * ERROR_RELATIVO_HLL
+
+RANGOS = {
+    'abierto': {},
+    'solo_inicio': {'fecha_inicio': '2024-04-01'},
+    'solo_fin': {'fecha_fin': '2024-09-30 23:59:59'},
+    'cerrado': {'fecha_inicio': '2024-04-01', 'fecha_fin': '2024-09-30 23:59:59'}
+}
+
+
+@pytest.fixture(scope='module')
+def bocetos(transacciones):
+    return BocetosDiarios.construir(transacciones)
+
+
+@pytest.mark.parametrize('rango', RANGOS)
+def test_estimar_por_valor_en_todos_los_grupos(transacciones, bocetos, rango):
+    filtros = RANGOS[rango]
+    filas = transacciones[mascara_filtros(transacciones, filtros)]
+    exactos = filas.groupby('country', observed=True)['customer_id'].nunique()
+
+    estimados = bocetos.estimar_por_valor('customer_id', 'country', filtros)
+    assert len(exactos) > 2
+    for pais, exacto in exactos.items():
+        assert estimados[pais] == pytest.approx(exacto, rel=TOLERANCIA)
+
+
+@pytest.mark.parametrize('rango', RANGOS)
+def test_estimar_con_seleccion_de_varios_grupos(transacciones, bocetos, rango):
+    filtros = dict(RANGOS[rango], paises=['España', 'Reino Unido'])
+    exacto = transacciones.loc[mascara_filtros(transacciones, filtros), 'customer_id'].nunique()
+    assert bocetos.estimar('customer_id', filtros) == pytest.approx(exacto, rel=TOLERANCIA)
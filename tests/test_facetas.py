@@ -0,0 +1,67 @@
+"""
+Pruebas del catálogo de facetas y de los recuentos por opción del sidebar
+Autor: cmsr92
+"""
+
+import pandas as pd
+import pytest
+
+from conftest import transacciones_sinteticas
+from utils.facetas import CatalogoFacetas, conteos_facetas
+from utils.filtros import COLUMNAS_FILTRO, mascara_filtros
+from utils.indices import IndiceFiltros
+
+FILTROS = [
+    {},
+    {'paises': ['España', 'Francia']},
+    {'paises': ['Alemania'], 'categorias': ['Moda', 'Hogar'], 'dispositivos': ['Escritorio']},
+    {'fecha_inicio': '2024-05-01', 'fecha_fin': '2024-08-31 23:59:59', 'fuentes_trafico': ['Email'],
+     'precio_min': 20.0, 'precio_max': 400.0}
+]
+
+
+def _conteos_esperados(df, filtros, clave, columna):
+    """Recuento por fuerza bruta: todos los filtros salvo el de la propia faceta"""
+    sin_faceta = {k: v for k, v in filtros.items() if k != clave}
+    filas = df[mascara_filtros(df, sin_faceta)]
+    agrupado = filas.groupby(columna, observed=True)['total_amount_usd'].agg(['count', 'sum'])
+    return {valor: (int(fila['count']), fila['sum']) for valor, fila in agrupado.iterrows()}
+
+
+@pytest.mark.parametrize('filtros', FILTROS)
+@pytest.mark.parametrize('con_indice', [False, True])
+def test_conteos_excluyen_el_filtro_de_la_propia_faceta(transacciones, filtros, con_indice):
+    indice = IndiceFiltros.construir(transacciones) if con_indice else None
+    conteos = conteos_facetas(transacciones, filtros, indice)
+
+    for clave, columna in COLUMNAS_FILTRO.items():
+        esperados = _conteos_esperados(transacciones, filtros, clave, columna)
+        assert conteos[columna].keys() == esperados.keys()
+        for valor, (pedidos, ingresos) in esperados.items():
+            assert conteos[columna][valor][0] == pedidos
+            assert conteos[columna][valor][1] == pytest.approx(ingresos)
+
+
+def test_catalogo_extendido_igual_que_construido():
+    df = transacciones_sinteticas(num_filas=5000, random_state=5)
+    previas = df[df['country'] != 'Reino Unido']
+    nuevas = df[df['country'] == 'Reino Unido']
+    previas, nuevas = previas.reset_index(drop=True), nuevas.reset_index(drop=True)
+
+    extendido = CatalogoFacetas.construir(previas).extender(nuevas)
+    completo = CatalogoFacetas.construir(pd.concat([previas, nuevas], ignore_index=True))
+
+    assert 'Reino Unido' not in CatalogoFacetas.construir(previas).opciones('country')
+    assert extendido.valores == completo.valores
+    assert extendido.regiones_por_pais == completo.regiones_por_pais
+    assert extendido.subcategorias_por_categoria == completo.subcategorias_por_categoria
+    assert (extendido.precio_min, extendido.precio_max) == (completo.precio_min, completo.precio_max)
+
+
+def test_opciones_en_cascada(transacciones):
+    catalogo = CatalogoFacetas.construir(transacciones)
+    francia = transacciones[transacciones['country'] == 'Francia']
+
+    assert catalogo.regiones(['Francia']) == sorted(francia['region'].dropna().unique().tolist())
+    assert catalogo.regiones() == catalogo.opciones('region')
+    assert catalogo.subcategorias(['Inexistente']) == []
@@ -0,0 +1,95 @@
+"""
+Pruebas de los índices invertidos de filtros frente a la máscara de filtros
+Autor: cmsr92
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import transacciones_sinteticas
+from utils.filtros import filtrar_vista, mascara_filtros
+from utils.indices import IndiceFiltros
+from utils.snapshot import filtrar_periodo, ordenar_por_fecha, periodo_mensual
+
+FILTROS = [
+    {},
+    {'paises': ['España']},
+    {'paises': ['España', 'Francia', 'Alemania'], 'categorias': ['Hogar']},
+    {'categorias': ['Moda'], 'dispositivos': ['Móvil'], 'metodos_pago': ['PayPal']},
+    {'paises': ['Portugal']},
+    {'fecha_inicio': '2024-03-01', 'fecha_fin': '2024-06-30 23:59:59', 'regiones': ['Europa']},
+    {'fecha_inicio': '2024-11-15', 'paises': ['Reino Unido'], 'precio_min': 50.0, 'precio_max': 300.0}
+]
+
+
+@pytest.mark.parametrize('filtros', FILTROS)
+def test_vista_indexada_igual_que_mascara(transacciones, filtros):
+    indice = IndiceFiltros.construir(transacciones)
+    esperadas = np.flatnonzero(mascara_filtros(transacciones, filtros))
+
+    np.testing.assert_array_equal(filtrar_vista(transacciones, filtros, indice).filas, esperadas)
+    np.testing.assert_array_equal(filtrar_vista(transacciones, filtros).filas, esperadas)
+
+
+def test_indice_de_otra_tabla_no_se_usa(transacciones):
+    indice = IndiceFiltros.construir(transacciones.iloc[:1000])
+    filtros = {'paises': ['Francia']}
+    np.testing.assert_array_equal(
+        filtrar_vista(transacciones, filtros, indice).filas,
+        np.flatnonzero(mascara_filtros(transacciones, filtros))
+    )
+
+
+def test_extender_igual_que_construir():
+    df = transacciones_sinteticas(num_filas=6000, random_state=3)
+    previas, nuevas = df.iloc[:4500], df.iloc[4500:].reset_index(drop=True)
+    completa = pd.concat([previas, nuevas], ignore_index=True)
+
+    extendido = IndiceFiltros.construir(previas).extender(nuevas, completa)
+    nuevo = IndiceFiltros.construir(completa)
+
+    assert extendido.num_filas == nuevo.num_filas
+    assert extendido.listas.keys() == nuevo.listas.keys()
+    for columna, por_valor in nuevo.listas.items():
+        assert extendido.listas[columna].keys() == por_valor.keys()
+        for valor, posiciones in por_valor.items():
+            np.testing.assert_array_equal(extendido.listas[columna][valor], posiciones)
+    np.testing.assert_array_equal(extendido.fechas, nuevo.fechas)
+
+
+@pytest.mark.parametrize('fecha_inicio, fecha_fin', [
+    (None, None),
+    ('2024-02-10', '2024-02-10 23:59:59'),
+    ('2023-06-01', '2024-01-15'),
+    ('2024-12-20', '2025-03-01'),
+    ('2025-01-01', None)
+])
+def test_tramo_fechas_por_busqueda_binaria(transacciones, fecha_inicio, fecha_fin):
+    filtros = {'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin}
+    inicio, fin = IndiceFiltros.construir(transacciones).tramo_fechas(filtros)
+    np.testing.assert_array_equal(np.arange(inicio, fin), np.flatnonzero(mascara_filtros(transacciones, filtros)))
+
+
+def test_tabla_sin_ordenar_usa_la_mascara(transacciones):
+    desordenada = transacciones.sample(frac=1.0, random_state=0).reset_index(drop=True)
+    indice = IndiceFiltros.construir(desordenada)
+    filtros = {'fecha_inicio': '2024-04-01', 'fecha_fin': '2024-04-30 23:59:59', 'paises': ['España']}
+
+    assert indice.tramo_fechas(filtros) is None
+    np.testing.assert_array_equal(
+        filtrar_vista(desordenada, filtros, indice).filas,
+        np.flatnonzero(mascara_filtros(desordenada, filtros))
+    )
+
+
+def test_ordenar_y_recortar_periodo(transacciones):
+    desordenada = transacciones.sample(frac=1.0, random_state=1).reset_index(drop=True)
+    ordenada = ordenar_por_fecha(desordenada)
+    assert ordenada['date'].is_monotonic_increasing
+    assert ordenar_por_fecha(ordenada) is ordenada
+
+    periodo = periodo_mensual('2024-03-15', '2024-05-02')
+    recortada = filtrar_periodo(ordenada, periodo)
+    esperadas = ordenada[(ordenada['date'] >= '2024-03-01') & (ordenada['date'] < '2024-06-01')]
+    pd.testing.assert_frame_equal(recortada, esperadas.reset_index(drop=True))
@@ -0,0 +1,78 @@
+"""
+Pruebas del registro persistente de modelos
+Autor: cmsr92
+"""
+
+import pandas as pd
+import pytest
+
+import utils.registro_modelos as registro_modelos
+from utils.dataset import DatasetCompartido
+from utils.registro_modelos import (
+    VERSIONES_CONSERVADAS, ModeloNoEntrenado, RegistroModelos, cargar_modelo, derivado_registrado,
+    huella_parametros
+)
+
+TIPO = 'modelo_prueba'
+PARAMETROS = {'n_clusters': 4, 'caracteristicas': ['recency', 'monetary']}
+
+
+@pytest.fixture
+def registro(tmp_path, monkeypatch):
+    """Registro en un directorio temporal, también como registro del proceso"""
+    registro = RegistroModelos(str(tmp_path / 'modelos'))
+    monkeypatch.setattr(registro_modelos, '_registro', registro)
+    return registro
+
+
+def test_guardar_y_cargar_de_disco(registro):
+    modelo = {'centroides': pd.DataFrame({'recency': [1.0, 30.0], 'monetary': [900.0, 15.5]})}
+    metadatos = registro.guardar(TIPO, PARAMETROS, 'v-dataset', modelo, {'inercia': 12.5})
+
+    # Un registro nuevo sobre el mismo directorio no tiene nada en memoria: lee el disco
+    cargado, leidos = RegistroModelos(registro.directorio).cargar(TIPO, dict(reversed(list(PARAMETROS.items()))))
+    pd.testing.assert_frame_equal(cargado['centroides'], modelo['centroides'])
+    assert leidos['version'] == metadatos['version']
+    assert leidos['version_dataset'] == 'v-dataset'
+    assert leidos['parametros'] == PARAMETROS
+    assert leidos['metricas'] == {'inercia': 12.5}
+    assert 'sklearn' in leidos['librerias']
+
+
+def test_prefiere_la_version_del_dataset_y_conserva_las_ultimas(registro):
+    for i in range(VERSIONES_CONSERVADAS + 2):
+        registro.guardar(TIPO, PARAMETROS, f'dataset-{i}', {'orden': i})
+
+    versiones = registro.versiones(TIPO, PARAMETROS)
+    assert len(versiones) == VERSIONES_CONSERVADAS
+    assert [m['version_dataset'] for m in versiones] == [f'dataset-{i}' for i in range(VERSIONES_CONSERVADAS + 1, 1, -1)]
+
+    assert registro.cargar(TIPO, PARAMETROS)[0] == {'orden': VERSIONES_CONSERVADAS + 1}
+    assert registro.cargar(TIPO, PARAMETROS, 'dataset-2')[0] == {'orden': 2}
+    # Una versión del dataset ya no conservada sirve la más reciente
+    assert registro.cargar(TIPO, PARAMETROS, 'dataset-0')[0] == {'orden': VERSIONES_CONSERVADAS + 1}
+
+
+def test_parametros_distintos_son_modelos_distintos(registro):
+    assert huella_parametros({'a': 1, 'b': 2}) == huella_parametros({'b': 2, 'a': 1})
+    registro.guardar(TIPO, PARAMETROS, 'v', 'cuatro')
+    assert registro.cargar(TIPO, {**PARAMETROS, 'n_clusters': 5}) is None
+    assert len(registro.listar(TIPO)) == 1
+
+
+def test_modelo_no_entrenado(registro):
+    with pytest.raises(ModeloNoEntrenado):
+        cargar_modelo(TIPO, PARAMETROS)
+    registro.guardar(TIPO, PARAMETROS, 'v', 'entrenado')
+    assert cargar_modelo(TIPO, PARAMETROS)[0] == 'entrenado'
+
+
+def test_derivado_registrado_se_construye_al_publicar(registro):
+    dataset = DatasetCompartido(pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), version='v-actual')
+
+    def derivado():
+        return derivado_registrado(dataset, 'prueba', TIPO, PARAMETROS, lambda modelo, metadatos, ds: (modelo, ds.version))
+
+    assert derivado() is None
+    registro.guardar(TIPO, PARAMETROS, 'v-anterior', 'publicado')
+    assert derivado() == ('publicado', 'v-actual')
@@ -0,0 +1,59 @@
+"""
+Pruebas del motor RFM vectorizado frente al group-by con lambdas que sustituye
+Autor: cmsr92
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.filtros import mascara_filtros
+from utils.rfm import calcular_rfm, rfm_clientes
+
+
+def _rfm_groupby(df, clientes):
+    """Cálculo anterior del dashboard: lambda por cliente y merge por customer_id"""
+    fecha_analisis = df['date'].max()
+    rfm = df.groupby('customer_id', observed=True).agg({
+        'date': lambda x: (fecha_analisis - x.max()).days,
+        'transaction_id': 'count',
+        'total_amount_usd': 'sum'
+    }).reset_index()
+    rfm.columns = ['customer_id', 'recency', 'frequency', 'monetary']
+    return rfm.merge(clientes, on='customer_id', how='left')
+
+
+def _clientes(df):
+    ids = df['customer_id'].cat.categories
+    rng = np.random.default_rng(7)
+    # Un cliente sin atributos y uno sin compras
+    return pd.DataFrame({
+        'customer_id': list(ids[1:]) + ['C99999'],
+        'lifetime_value': rng.uniform(0, 5000, len(ids)).round(2)
+    })
+
+
+@pytest.mark.parametrize('filtros', [{}, {'paises': ['España'], 'fecha_inicio': '2024-06-01'}])
+def test_rfm_igual_que_groupby(transacciones, filtros):
+    df = transacciones[mascara_filtros(transacciones, filtros)]
+    clientes = _clientes(transacciones)
+
+    esperado = _rfm_groupby(df, clientes).sort_values('customer_id').reset_index(drop=True)
+    rfm = rfm_clientes(df, clientes).sort_values('customer_id').reset_index(drop=True)
+
+    assert rfm['customer_id'].astype(str).tolist() == esperado['customer_id'].astype(str).tolist()
+    np.testing.assert_array_equal(rfm['recency'], esperado['recency'])
+    np.testing.assert_array_equal(rfm['frequency'], esperado['frequency'])
+    np.testing.assert_allclose(rfm['monetary'], esperado['monetary'])
+    np.testing.assert_array_equal(rfm['lifetime_value'], esperado['lifetime_value'])
+
+
+def test_ids_no_categoricos_y_fecha_de_analisis(transacciones):
+    df = transacciones.iloc[:3000]
+    fecha_analisis = pd.Timestamp('2025-01-01')
+    rfm = calcular_rfm(df['customer_id'].astype(str), df['date'], df['total_amount_usd'], fecha_analisis=fecha_analisis)
+
+    ultima = df.groupby(df['customer_id'].astype(str))['date'].max()
+    recencia = rfm.set_index('customer_id')['recency']
+    assert recencia.index.sort_values().tolist() == ultima.index.sort_values().tolist()
+    np.testing.assert_array_equal(recencia.loc[ultima.index], (fecha_analisis - ultima).dt.days)
@@ -0,0 +1,60 @@
+"""
+Pruebas de las tablas de dimensiones diferidas
+Autor: cmsr92
+"""
+
+import pandas as pd
+import pytest
+
+from utils.tabla_diferida import TablaDiferida
+
+
+def _clientes():
+    return pd.DataFrame({
+        'customer_id': ['C1', 'C2', 'C3'],
+        'lifetime_value': [120.0, 35.5, 990.0],
+        'rfm_segment': ['Campeones', 'En Riesgo', 'Leales'],
+        'churn_probability': [0.1, 0.7, 0.2]
+    })
+
+
+def test_solo_lee_las_columnas_que_faltan():
+    clientes = _clientes()
+    lecturas = []
+
+    def lector(columnas):
+        lecturas.append(list(columnas))
+        return clientes[columnas]
+
+    tabla = TablaDiferida('clientes', lector, clientes.columns)
+    assert tabla.cargadas == []
+
+    pd.testing.assert_frame_equal(tabla.columnas(['customer_id', 'lifetime_value']), clientes[['customer_id', 'lifetime_value']])
+    pd.testing.assert_frame_equal(tabla.columnas(['lifetime_value', 'rfm_segment']), clientes[['lifetime_value', 'rfm_segment']])
+    tabla.columnas('customer_id')
+
+    assert lecturas == [['customer_id', 'lifetime_value'], ['rfm_segment']]
+    assert tabla.cargadas == ['customer_id', 'lifetime_value', 'rfm_segment']
+
+
+def test_completa_conserva_el_orden_original():
+    clientes = _clientes()
+    tabla = TablaDiferida.desde_dataframe('clientes', clientes)
+    tabla.columnas(['churn_probability'])
+    pd.testing.assert_frame_equal(tabla.completa(), clientes)
+
+
+def test_desde_archivo_arrow(tmp_path):
+    clientes = _clientes()
+    ruta = tmp_path / 'clientes.arrow'
+    clientes.to_feather(ruta, compression='uncompressed')
+
+    tabla = TablaDiferida.desde_archivo_arrow('clientes', str(ruta))
+    assert tabla.columnas_disponibles == list(clientes.columns)
+    pd.testing.assert_frame_equal(tabla.columnas(['rfm_segment', 'customer_id']), clientes[['rfm_segment', 'customer_id']])
+
+
+def test_columna_inexistente():
+    tabla = TablaDiferida.desde_dataframe('clientes', _clientes())
+    with pytest.raises(KeyError):
+        tabla.columnas(['age'])
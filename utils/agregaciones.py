@@ -0,0 +1,125 @@
+"""
+Contexto de agregación por ejecución
+Autor: cmsr92
+
+Varias pestañas (y los informes PDF/Excel) piden los mismos group-by sobre los mismos
+datos filtrados: ingresos por país, ingresos y beneficio por categoría, métricas por
+producto... El contexto se crea una vez por rerun y memoriza cada resultado por
+(claves, medidas): la segunda petición se sirve de memoria y solo se calculan las medidas
+que aún no tenga esa agrupación. Con un cubo (utils.cubo), las agrupaciones por
+dimensiones del cubo con medidas aditivas salen de él en lugar de las transacciones.
+"""
+
+import logging
+
+from utils.cubo import DIMENSIONES_CUBO
+from utils.filtros import VistaFiltrada
+
+logger = logging.getLogger(__name__)
+
+# (columna, función) de transacciones -> medida del cubo equivalente
+MEDIDAS_EN_CUBO = {
+    ('total_amount_usd', 'sum'): 'ingresos',
+    ('profit', 'sum'): 'beneficio',
+    ('quantity', 'sum'): 'unidades',
+    ('transaction_id', 'count'): 'pedidos',
+    # transaction_id es único: distintos = filas
+    ('transaction_id', 'nunique'): 'pedidos'
+}
+
+
+def _columna(columna, funcion):
+    return f"{columna}|{funcion}"
+
+
+class ContextoAgregacion:
+    """
+    Memo de agregaciones group-by sobre unos datos filtrados.
+
+    Args:
+        datos: DataFrame filtrado (solo lectura) o VistaFiltrada, de la que cada agregación
+            solo materializa las columnas que usa
+        cubo: función(dimensiones) -> agregado del cubo con los mismos filtros (opcional)
+        nombre: nombre para los mensajes de registro
+    """
+
+    def __init__(self, datos, cubo=None, nombre='datos filtrados'):
+        self.datos = datos
+        self.cubo = cubo
+        self.nombre = nombre
+        # claves -> DataFrame con las claves y una columna 'columna|función' por medida
+        self._resultados = {}
+        self._subconjuntos = {}
+        self.solicitudes = 0
+        self.calculadas = 0
+        self.duplicadas = 0
+
+    def agrupar(self, claves, medidas):
+        """
+        Equivalente a datos.groupby(claves, observed=True).agg(medidas).reset_index()
+
+        Args:
+            claves: columna o lista de columnas
+            medidas: dict columna -> función de agregación ('sum', 'count', 'nunique', 'mean'...)
+
+        Returns:
+            DataFrame nuevo (se puede modificar sin afectar al memo)
+        """
+        claves = [claves] if isinstance(claves, str) else list(claves)
+        pares = list(medidas.items())
+        self.solicitudes += 1
+
+        previo = self._resultados.get(tuple(claves))
+        faltan = [par for par in pares if previo is None or _columna(*par) not in previo.columns]
+        if not faltan:
+            self.duplicadas += 1
+        else:
+            self.calculadas += 1
+            nuevo = self._calcular(claves, faltan)
+            previo = nuevo if previo is None else previo.merge(nuevo, on=claves, how='outer')
+            self._resultados[tuple(claves)] = previo
+
+        resultado = previo[claves + [_columna(*par) for par in pares]].copy()
+        resultado.columns = claves + [columna for columna, _ in pares]
+        return resultado
+
+    def _calcular(self, claves, pares):
+        if self.cubo is not None and set(claves) <= set(DIMENSIONES_CUBO) and all(par in MEDIDAS_EN_CUBO for par in pares):
+            # El cubo conserva los grupos de dimensión nula; groupby sobre las filas no
+            agregado = self.cubo(claves).dropna(subset=claves)
+            resultado = agregado[claves].copy()
+            for par in pares:
+                resultado[_columna(*par)] = agregado[MEDIDAS_EN_CUBO[par]].to_numpy()
+            return resultado
+        datos = self.datos
+        if isinstance(datos, VistaFiltrada):
+            datos = datos.columnas(list(dict.fromkeys(claves + [columna for columna, _ in pares])))
+        return datos.groupby(claves, observed=True).agg(
+            **{_columna(columna, funcion): (columna, funcion) for columna, funcion in pares}
+        ).reset_index()
+
+    def subconjunto(self, nombre, seleccionar):
+        """
+        Contexto hijo sobre un subconjunto de los datos (p. ej. sin productos de envío),
+        calculado una vez por nombre. No usa el cubo: sus filas ya no son las del filtro.
+        """
+        if nombre not in self._subconjuntos:
+            self._subconjuntos[nombre] = ContextoAgregacion(seleccionar(self.datos), nombre=nombre)
+        return self._subconjuntos[nombre]
+
+    def estadisticas(self):
+        """Peticiones, agregaciones calculadas y duplicadas absorbidas (incluidos los subconjuntos)"""
+        totales = {'solicitudes': self.solicitudes, 'calculadas': self.calculadas, 'duplicadas': self.duplicadas}
+        for hijo in self._subconjuntos.values():
+            for clave, valor in hijo.estadisticas().items():
+                totales[clave] += valor
+        return totales
+
+    def registrar(self):
+        """Deja en el log cuántas peticiones repetidas absorbió el contexto"""
+        estadisticas = self.estadisticas()
+        logger.info(
+            "Contexto de agregación (%s): %d peticiones, %d calculadas, %d duplicadas absorbidas",
+            self.nombre, estadisticas['solicitudes'], estadisticas['calculadas'], estadisticas['duplicadas']
+        )
+        return estadisticas
@@ -0,0 +1,144 @@
+"""
+Servicio de detección de anomalías en transacciones (Isolation Forest)
+Autor: cmsr92
+
+El modelo se entrena sobre una muestra acotada y estratificada por categoría (no sobre
+todas las filas filtradas en cada rerun) y, una vez por versión del dataset, puntúa
+todas las transacciones por lotes, con los árboles repartidos en n_jobs hilos.
+La puntuación queda como una columna alineada con las transacciones: cualquier filtro
+solo toma las posiciones de su vista. En los anexos se puntúan solo las filas nuevas
+con el mismo modelo.
+
+El modelo se carga del registro (utils.registro_modelos), donde lo publica el job de
+reentrenamiento; el dashboard nunca entrena: sin modelo registrado no hay puntuaciones.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.registro_modelos import derivado_registrado
+
+CARACTERISTICAS_ANOMALIA = ['total_amount_usd', 'quantity', 'profit']
+CONTAMINACION = 0.05
+
+# Filas como máximo para entrenar, estratificadas por esta columna
+TAMANO_MUESTRA_ANOMALIAS = int(os.getenv('ANOMALIAS_MUESTRA', '100000'))
+COLUMNA_ESTRATO = 'category'
+
+# Filas por lote al puntuar y hilos de joblib para recorrer los árboles (-1 = todos los núcleos)
+TAMANO_LOTE_ANOMALIAS = 65536
+N_JOBS_ANOMALIAS = int(os.getenv('ANOMALIAS_N_JOBS', '-1'))
+
+# Tipo de modelo en el registro y parámetros que forman su clave
+TIPO_MODELO_ANOMALIAS = 'isolation_forest_transacciones'
+PARAMETROS_ANOMALIAS = {
+    'contamination': CONTAMINACION,
+    'caracteristicas': CARACTERISTICAS_ANOMALIA,
+    'tamano_muestra': TAMANO_MUESTRA_ANOMALIAS,
+    'estrato': COLUMNA_ESTRATO
+}
+
+
+def muestra_estratificada(estratos, tamano, random_state=42):
+    """
+    Posiciones de una muestra de como mucho `tamano` filas con la misma proporción de cada
+    estrato que el total (reparto proporcional, al menos una fila por estrato)
+
+    Args:
+        estratos: array de códigos enteros de estrato por fila (-1 = nulo, es su propio estrato)
+        tamano: filas máximas
+    """
+    num_filas = len(estratos)
+    if num_filas <= tamano:
+        return np.arange(num_filas)
+    rng = np.random.default_rng(random_state)
+    _, grupo, conteos = np.unique(estratos, return_inverse=True, return_counts=True)
+    cupo = np.maximum(1, np.floor(conteos * (tamano / num_filas))).astype(np.int64)
+
+    # Orden aleatorio y, dentro de cada estrato, se quedan las primeras `cupo` filas
+    permutacion = rng.permutation(num_filas)
+    orden = permutacion[np.argsort(grupo[permutacion], kind='stable')]
+    inicio_grupo = np.concatenate([[0], np.cumsum(conteos)[:-1]])
+    rango = np.arange(num_filas) - np.repeat(inicio_grupo, conteos)
+    return np.sort(orden[rango < np.repeat(cupo, conteos)])
+
+
+def _matriz(transacciones_df):
+    return np.column_stack([transacciones_df[col].to_numpy(dtype=np.float64) for col in CARACTERISTICAS_ANOMALIA])
+
+
+class ModeloAnomalias:
+    """IsolationForest entrenado sobre una muestra y puntuaciones de todas las transacciones"""
+
+    def __init__(self, modelo, puntuaciones, metadatos=None):
+        self.modelo = modelo
+        # decision_function por transacción (negativa = anómala; NaN si faltan variables)
+        self.puntuaciones = puntuaciones
+        # Metadatos del registro (versión, dataset de entrenamiento, métricas)
+        self.metadatos = metadatos or {}
+
+    @staticmethod
+    def entrenar(transacciones_df, contaminacion=CONTAMINACION, tamano_muestra=TAMANO_MUESTRA_ANOMALIAS, random_state=42):
+        """IsolationForest ajustado a una muestra estratificada de las filas completas"""
+        from sklearn.ensemble import IsolationForest
+
+        matriz = _matriz(transacciones_df)
+        completas = np.flatnonzero(~np.isnan(matriz).any(axis=1))
+        estratos = pd.factorize(transacciones_df[COLUMNA_ESTRATO])[0][completas]
+        muestra = completas[muestra_estratificada(estratos, tamano_muestra, random_state)]
+
+        modelo = IsolationForest(contamination=contaminacion, random_state=random_state, n_jobs=N_JOBS_ANOMALIAS)
+        modelo.fit(matriz[muestra])
+        metricas = {
+            'filas_entrenamiento': len(muestra),
+            'filas_dataset': len(transacciones_df),
+            'tasa_anomalias_muestra': float(np.mean(modelo.predict(matriz[muestra]) == -1))
+        }
+        return modelo, metricas
+
+    @staticmethod
+    def puntuar(modelo, transacciones_df):
+        """decision_function de cada fila por lotes, con los árboles repartidos en hilos"""
+        from joblib import parallel_config
+
+        matriz = _matriz(transacciones_df)
+        puntuaciones = np.full(len(matriz), np.nan)
+        completas = np.flatnonzero(~np.isnan(matriz).any(axis=1))
+        with parallel_config(backend='threading', n_jobs=N_JOBS_ANOMALIAS):
+            for inicio in range(0, len(completas), TAMANO_LOTE_ANOMALIAS):
+                lote = completas[inicio:inicio + TAMANO_LOTE_ANOMALIAS]
+                puntuaciones[lote] = modelo.decision_function(matriz[lote])
+        return puntuaciones
+
+    @classmethod
+    def construir(cls, modelo, metadatos, transacciones_df):
+        """Modelo del registro con las puntuaciones de todas las filas"""
+        return cls(modelo, cls.puntuar(modelo, transacciones_df), metadatos)
+
+    def extender(self, nuevas_df):
+        """Mismo modelo; solo se puntúan las filas anexadas"""
+        if len(nuevas_df) == 0:
+            return self
+        nuevas = ModeloAnomalias.puntuar(self.modelo, nuevas_df)
+        return ModeloAnomalias(self.modelo, np.concatenate([self.puntuaciones, nuevas]), self.metadatos)
+
+    def puntuaciones_de(self, filas):
+        """Puntuaciones de unas posiciones de las transacciones (p. ej. VistaFiltrada.filas)"""
+        return self.puntuaciones[filas]
+
+    def __repr__(self):
+        return f"ModeloAnomalias(filas={len(self.puntuaciones):,}, version={self.metadatos.get('version')})"
+
+
+def modelo_anomalias(dataset):
+    """
+    Modelo del registro y puntuaciones de la versión actual del dataset (los anexos solo
+    puntúan), o None si el job de reentrenamiento aún no lo ha publicado
+    """
+    return derivado_registrado(
+        dataset, 'modelo_anomalias', TIPO_MODELO_ANOMALIAS, PARAMETROS_ANOMALIAS,
+        lambda modelo, metadatos, ds: ModeloAnomalias.construir(modelo, metadatos, ds.transacciones),
+        lambda modelo, nuevas, ds: modelo.extender(nuevas)
+    )
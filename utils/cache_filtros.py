@@ -0,0 +1,274 @@
+"""
+Caché LRU de vistas filtradas y consultas analíticas por filtros
+Autor: cmsr92
+
+Cambiar de pestaña o activar "Análisis ML" vuelve a ejecutar el script con los mismos
+filtros. La selección de filas (y los agregados calculados sobre ella) se guarda por
+FiltroSpec en una caché LRU con presupuesto en bytes, compartida por todas las sesiones
+y ligada a la versión del dataset: un estado repetido se sirve sin recalcular.
+
+Aquí está el punto de entrada de cada consulta por filtros, que elige de dónde sale el
+resultado: filas filtradas, conteos de facetas, cubo diario (utils.cubo), sumas
+prefijas (utils.sumas_prefijas), bocetos HLL (utils.distintos) y RFM (utils.rfm). La
+inferencia de modelos por filtros está en utils.servicio_modelos.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.filtros import FiltroSpec, VistaFiltrada, filtrar_vista
+from utils.facetas import conteos_facetas
+from utils.cubo import DIMENSIONES_CUBO, cubo_diario, medidas_transacciones, reagrupar
+from utils.sumas_prefijas import sumas_prefijas
+from utils.distintos import ERROR_RELATIVO_HLL, bocetos_diarios, distintos_exactos
+from utils.rfm import rfm_clientes
+
+# Presupuesto de la caché de vistas por versión del dataset (MB)
+PRESUPUESTO_CACHE_VISTAS_MB = int(os.getenv('CACHE_VISTAS_MB', '256'))
+
+
+def tamano_bytes(valor):
+    """Estimación del tamaño en memoria de un valor cacheado"""
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        uso = valor.memory_usage(index=True, deep=True)
+        return int(uso.sum()) if isinstance(uso, pd.Series) else int(uso)
+    if isinstance(valor, VistaFiltrada):
+        return valor.filas.nbytes + sum(tamano_bytes(col) for col in valor._columnas.values())
+    if isinstance(valor, (tuple, list)):
+        return sum(tamano_bytes(v) for v in valor)
+    if isinstance(valor, dict):
+        return sum(tamano_bytes(v) for v in valor.values())
+    return 64
+
+
+class CacheLRU:
+    """
+    Caché LRU acotada por bytes (no por número de entradas), con contadores.
+
+    Args:
+        presupuesto_bytes: tamaño máximo acumulado de las entradas
+    """
+
+    def __init__(self, presupuesto_bytes):
+        self.presupuesto_bytes = presupuesto_bytes
+        self.bytes_usados = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self._entradas = OrderedDict()  # clave -> (valor, bytes)
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, constructor):
+        """Devuelve el valor de la clave, calculándolo con constructor() si no está"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[0]
+            self.fallos += 1
+
+        valor = constructor()
+        tamano = tamano_bytes(valor)
+
+        with self._lock:
+            # Un valor mayor que todo el presupuesto no se guarda
+            if tamano > self.presupuesto_bytes:
+                return valor
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self.bytes_usados -= anterior[1]
+            self._entradas[clave] = (valor, tamano)
+            self.bytes_usados += tamano
+            while self.bytes_usados > self.presupuesto_bytes:
+                _, (_, liberados) = self._entradas.popitem(last=False)
+                self.bytes_usados -= liberados
+                self.expulsiones += 1
+        return valor
+
+    def reajustar(self, clave):
+        """
+        Vuelve a medir una entrada que creció tras guardarse (p. ej. una VistaFiltrada que
+        materializó otra columna) y expulsa entradas si se supera el presupuesto. Si la
+        clave ya no está, no hace nada.
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return
+            valor, anterior = entrada
+            tamano = tamano_bytes(valor)
+            self._entradas[clave] = (valor, tamano)
+            self.bytes_usados += tamano - anterior
+            while self.bytes_usados > self.presupuesto_bytes and self._entradas:
+                _, (_, liberados) = self._entradas.popitem(last=False)
+                self.bytes_usados -= liberados
+                self.expulsiones += 1
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        return {
+            'entradas': len(self._entradas),
+            'bytes_usados': self.bytes_usados,
+            'presupuesto_bytes': self.presupuesto_bytes,
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'expulsiones': self.expulsiones,
+            'tasa_aciertos': self.aciertos / total if total else 0.0
+        }
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+def cache_vistas(dataset):
+    """Caché de vistas de la versión actual del dataset (una nueva versión empieza vacía)"""
+    return dataset.derivado(
+        'cache_vistas',
+        lambda ds: CacheLRU(PRESUPUESTO_CACHE_VISTAS_MB * 1024 * 1024)
+    )
+
+
+def _spec(filtros):
+    return filtros if isinstance(filtros, FiltroSpec) else FiltroSpec.desde_filtros(filtros)
+
+
+def obtener_vista_filtrada(dataset, filtros, indice=None):
+    """VistaFiltrada de las transacciones para unos filtros (dict o FiltroSpec), cacheada por spec"""
+    spec = _spec(filtros)
+    cache = cache_vistas(dataset)
+    clave = ('vista', spec)
+
+    def construir():
+        vista = filtrar_vista(dataset.transacciones, spec.como_filtros(), indice)
+        # Las columnas se materializan después de guardarla: cada una se suma a su tamaño
+        vista.al_crecer = lambda: cache.reajustar(clave)
+        return vista
+
+    return cache.obtener(clave, construir)
+
+
+def obtener_datos_filtrados(dataset, filtros, indice=None):
+    """DataFrame filtrado (compartido: solo lectura), cacheado por spec"""
+    spec = _spec(filtros)
+    return cache_vistas(dataset).obtener(
+        ('datos', spec),
+        lambda: obtener_vista_filtrada(dataset, spec, indice).materializar()
+    )
+
+
+def obtener_agregado(dataset, filtros, nombre, funcion, indice=None):
+    """Resultado de funcion(vista) para unos filtros, cacheado por (spec, nombre)"""
+    spec = _spec(filtros)
+    return cache_vistas(dataset).obtener(
+        (nombre, spec),
+        lambda: funcion(obtener_vista_filtrada(dataset, spec, indice))
+    )
+
+
+def obtener_conteos_facetas(dataset, filtros, indice=None):
+    """Pedidos e ingresos por opción de cada faceta (utils.facetas.conteos_facetas), cacheados por spec"""
+    spec = _spec(filtros)
+    return cache_vistas(dataset).obtener(
+        ('facetas', spec),
+        lambda: conteos_facetas(dataset.transacciones, spec.como_filtros(), indice)
+    )
+
+
+def obtener_agregado_cubo(dataset, filtros, dimensiones=(), frecuencia=None, indice=None):
+    """
+    Medidas aditivas (pedidos, ingresos, beneficio, unidades, coste) por dimensiones y
+    periodo, cacheadas por (spec, dimensiones, frecuencia). Salen del cubo diario salvo
+    que el filtro de precio excluya transacciones: entonces se agregan las filas filtradas.
+    """
+    spec = _spec(filtros)
+    dimensiones = tuple(dimensiones)
+
+    def calcular():
+        cubo = cubo_diario(dataset)
+        filtros_spec = spec.como_filtros()
+        if cubo.responde(filtros_spec):
+            return cubo.agregar(filtros_spec, dimensiones, frecuencia)
+        columnas = ['date', 'quantity', 'total_amount_usd', 'profit'] + DIMENSIONES_CUBO
+        vista = obtener_vista_filtrada(dataset, spec, indice)
+        return reagrupar(medidas_transacciones(vista.materializar(columnas)), dimensiones, frecuencia)
+
+    return cache_vistas(dataset).obtener(('cubo', dimensiones, frecuencia, spec), calcular)
+
+
+def obtener_totales(dataset, filtros, indice=None):
+    """
+    Medidas aditivas totales (dict medida -> valor) para unos filtros: con las sumas
+    prefijas cuando bastan (rango de días y como mucho una dimensión seleccionada) y,
+    si no, con el cubo (o las filas filtradas)
+    """
+    spec = _spec(filtros)
+    totales = sumas_prefijas(dataset).consultar(spec.como_filtros())
+    if totales is None:
+        fila = obtener_agregado_cubo(dataset, spec, indice=indice).iloc[0]
+        totales = {medida: fila[medida] for medida in fila.index}
+        totales['pedidos'] = int(totales['pedidos'])
+        totales['unidades'] = int(totales['unidades'])
+    return totales
+
+
+def obtener_distintos(dataset, filtros, campo, indice=None, exacto=False):
+    """
+    Valores distintos de un campo (customer_id, product_id) para unos filtros: estimados
+    con los bocetos HLL diarios si los filtros lo permiten, o exactos sobre las filas
+    filtradas (siempre con exacto=True, p. ej. en exportaciones)
+
+    Returns:
+        dict: valor, error_relativo (0 si es exacto) y exacto
+    """
+    spec = _spec(filtros)
+    if not exacto:
+        estimacion = bocetos_diarios(dataset).estimar(campo, spec.como_filtros())
+        if estimacion is not None:
+            return {'valor': estimacion, 'error_relativo': ERROR_RELATIVO_HLL, 'exacto': False}
+    valor = cache_vistas(dataset).obtener(
+        (('distintos', campo), spec),
+        lambda: distintos_exactos(obtener_vista_filtrada(dataset, spec, indice)[campo])
+    )
+    return {'valor': valor, 'error_relativo': 0.0, 'exacto': True}
+
+
+def obtener_distintos_por_valor(dataset, filtros, campo, dimension, indice=None, exacto=False):
+    """
+    Distintos de un campo por valor de una dimensión (p. ej. clientes por país), con los
+    bocetos HLL si los filtros lo permiten o exactos sobre las filas filtradas
+
+    Returns:
+        tuple: (pd.Series valor -> distintos, error_relativo)
+    """
+    spec = _spec(filtros)
+    if not exacto:
+        estimacion = bocetos_diarios(dataset).estimar_por_valor(campo, dimension, spec.como_filtros())
+        if estimacion is not None:
+            return estimacion, ERROR_RELATIVO_HLL
+
+    def calcular():
+        vista = obtener_vista_filtrada(dataset, spec, indice)
+        return pd.DataFrame({dimension: vista[dimension], campo: vista[campo]}).groupby(
+            dimension, observed=True
+        )[campo].nunique()
+
+    return cache_vistas(dataset).obtener((('distintos', campo, dimension), spec), calcular), 0.0
+
+
+def obtener_rfm(dataset, filtros, indice=None):
+    """
+    RFM por cliente (utils.rfm) de las transacciones filtradas, con lifetime_value,
+    cacheado por spec. DataFrame compartido: solo lectura (copiar antes de añadir columnas)
+    """
+    spec = _spec(filtros)
+    return cache_vistas(dataset).obtener(
+        ('rfm', spec),
+        lambda: rfm_clientes(obtener_vista_filtrada(dataset, spec, indice), dataset.clientes)
+    )
@@ -0,0 +1,163 @@
+"""
+Cubo OLAP diario de transacciones
+Autor: cmsr92
+
+Agregado materializado al grano día × país × región × categoría × subcategoría ×
+segmento × dispositivo × método de pago × fuente de tráfico, con medidas aditivas
+(pedidos, ingresos, beneficio, unidades, coste). Las dimensiones son las mismas que las
+de los filtros del sidebar, así que cualquier combinación de filtros (salvo el de precio,
+que no es una dimensión) se resuelve sobre el cubo y los gráficos de métricas aditivas
+reagrupan sus filas en lugar de las transacciones.
+
+Se construye una vez por versión del dataset y se extiende con las filas anexadas. Los
+nulos de las dimensiones forman su propio grupo (dropna=False): ninguna transacción queda
+fuera de los totales, igual que al contar filas con la máscara de filtros.
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.filtros import COLUMNAS_FILTRO, mascara_valores
+
+DIMENSIONES_CUBO = list(COLUMNAS_FILTRO.values())
+
+# Medidas aditivas del cubo: nombre -> columna de transacciones que se suma (None = contar filas)
+MEDIDAS_CUBO = {
+    'pedidos': None,
+    'ingresos': 'total_amount_usd',
+    'beneficio': 'profit',
+    'unidades': 'quantity',
+    'coste': None  # ingresos - beneficio
+}
+
+# Granularidad temporal de las consultas: None (sin tiempo), día, semana o mes
+FRECUENCIAS = {'D': None, 'W': 'W', 'M': 'M'}
+
+
+def medidas_transacciones(transacciones_df):
+    """Transacciones al formato del cubo (día, dimensiones y medidas), una fila por transacción"""
+    ingresos = transacciones_df['total_amount_usd'].to_numpy(dtype=np.float64)
+    beneficio = transacciones_df['profit'].to_numpy(dtype=np.float64)
+    # Arrays y no Series: las filas anexadas conservan su índice original y no deben alinearse
+    columnas = {'dia': transacciones_df['date'].dt.floor('D').to_numpy()}
+    columnas.update({dim: transacciones_df[dim].array for dim in DIMENSIONES_CUBO})
+    columnas.update({
+        'pedidos': np.ones(len(transacciones_df), dtype=np.int64),
+        'ingresos': ingresos,
+        'beneficio': beneficio,
+        'unidades': transacciones_df['quantity'].to_numpy(dtype=np.int64),
+        'coste': ingresos - beneficio
+    })
+    return pd.DataFrame(columnas, index=pd.RangeIndex(len(transacciones_df)))
+
+
+def reagrupar(filas, dimensiones=(), frecuencia=None):
+    """
+    Suma las medidas de unas filas (del cubo o de medidas_transacciones) por dimensiones
+    y, opcionalmente, por periodo
+
+    Args:
+        filas: DataFrame con 'dia', dimensiones y medidas
+        dimensiones: columnas por las que agrupar
+        frecuencia: 'D', 'W' o 'M' para añadir la columna 'fecha' (inicio del periodo)
+
+    Returns:
+        DataFrame con 'fecha' (si hay frecuencia), las dimensiones y las medidas
+    """
+    claves = list(dimensiones)
+    if frecuencia is not None:
+        dias = filas['dia']
+        fecha = dias if FRECUENCIAS[frecuencia] is None else dias.dt.to_period(FRECUENCIAS[frecuencia]).dt.start_time
+        filas = filas.assign(fecha=fecha)
+        claves = ['fecha'] + claves
+
+    medidas = list(MEDIDAS_CUBO)
+    if not claves:
+        return filas[medidas].sum().to_frame().T.astype({'pedidos': np.int64, 'unidades': np.int64})
+    # dropna=False: una dimensión nula no saca la fila de los totales
+    return filas.groupby(claves, observed=True, dropna=False)[medidas].sum().reset_index()
+
+
+class CuboDiario:
+    """Filas del cubo ordenadas por día, más el rango de precios de las transacciones"""
+
+    def __init__(self, filas, precio_min, precio_max):
+        self.filas = filas
+        self.precio_min = precio_min
+        self.precio_max = precio_max
+
+    @classmethod
+    def construir(cls, transacciones_df):
+        filas = reagrupar(medidas_transacciones(transacciones_df), ['dia'] + DIMENSIONES_CUBO)
+        hay_filas = len(transacciones_df) > 0
+        return cls(
+            filas,
+            float(transacciones_df['unit_price'].min()) if hay_filas else None,
+            float(transacciones_df['unit_price'].max()) if hay_filas else None
+        )
+
+    def extender(self, nuevas_df, transacciones_df):
+        """
+        Cubo con las filas anexadas: solo se reagrupan los días desde el primero de las
+        nuevas (los anteriores no cambian)
+
+        Args:
+            nuevas_df: filas anexadas
+            transacciones_df: tabla completa ya con el anexo (categorías unificadas)
+        """
+        if len(nuevas_df) == 0:
+            return self
+        nuevas = medidas_transacciones(nuevas_df)
+        corte = int(np.searchsorted(self.filas['dia'].to_numpy(), nuevas['dia'].min().to_datetime64(), side='left'))
+        cola = pd.concat([self.filas.iloc[corte:], nuevas], ignore_index=True)
+        partes = [self.filas.iloc[:corte], reagrupar(cola, ['dia'] + DIMENSIONES_CUBO)]
+
+        # Mismas categorías que la tabla completa en las dos partes antes de unirlas
+        tipos = {dim: transacciones_df[dim].dtype for dim in DIMENSIONES_CUBO}
+        filas = pd.concat([parte.astype(tipos) for parte in partes], ignore_index=True)
+
+        precios = [p for p in (self.precio_min, self.precio_max) if p is not None]
+        precios += [float(nuevas_df['unit_price'].min()), float(nuevas_df['unit_price'].max())]
+        return CuboDiario(filas, min(precios), max(precios))
+
+    def responde(self, filtros):
+        """El cubo sirve para estos filtros si el de precio no excluye ninguna transacción"""
+        precio_min, precio_max = filtros.get('precio_min'), filtros.get('precio_max')
+        if precio_min is None or precio_max is None or self.precio_min is None:
+            return True
+        return precio_min <= self.precio_min and precio_max >= self.precio_max
+
+    def seleccionar(self, filtros):
+        """Filas del cubo dentro del rango de fechas (búsqueda binaria) y de los filtros de selección"""
+        dias = self.filas['dia'].to_numpy()
+        inicio, fin = 0, len(dias)
+        if filtros.get('fecha_inicio') is not None:
+            inicio = int(np.searchsorted(dias, pd.Timestamp(filtros['fecha_inicio']).floor('D').to_datetime64(), side='left'))
+        if filtros.get('fecha_fin') is not None:
+            fin = int(np.searchsorted(dias, pd.Timestamp(filtros['fecha_fin']).to_datetime64(), side='right'))
+        filas = self.filas.iloc[inicio:max(inicio, fin)]
+
+        mascara = np.ones(len(filas), dtype=bool)
+        for clave, columna in COLUMNAS_FILTRO.items():
+            if filtros.get(clave):
+                mascara &= mascara_valores(filas[columna], filtros[clave])
+        return filas if mascara.all() else filas[mascara]
+
+    def agregar(self, filtros, dimensiones=(), frecuencia=None):
+        """Medidas aditivas por dimensiones (y periodo) para unos filtros"""
+        return reagrupar(self.seleccionar(filtros), dimensiones, frecuencia)
+
+    def nbytes(self):
+        return int(self.filas.memory_usage(index=True).sum())
+
+    def __repr__(self):
+        return f"CuboDiario(filas={len(self.filas):,}, {self.nbytes() / 1e6:.1f} MB)"
+
+
+def cubo_diario(dataset):
+    """Cubo diario de la versión actual del dataset (se construye una vez y se extiende en los anexos)"""
+    return dataset.derivado(
+        'cubo_diario',
+        lambda ds: CuboDiario.construir(ds.transacciones),
+        lambda cubo, nuevas, ds: cubo.extender(nuevas, ds.transacciones)
+    )
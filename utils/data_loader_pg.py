@@ -1,7 +1,12 @@
+import io
+import logging
+import os
+import numpy as np
 import pandas as pd
 import streamlit as st
-from sqlalchemy import text
-from database.schema import get_engine, get_session
+from pandas.api.types import union_categoricals
+from sqlalchemy import text, types as sa_types
+from database.schema import get_engine, get_session, Transaction
 from datetime import datetime, timedelta
 from utils.traducciones import (
     aplicar_traducciones_df, 
@@ -10,220 +15,576 @@ from utils.traducciones import (
     aplicar_traducciones_dispositivos_df,
     aplicar_traducciones_metodos_pago_df,
     aplicar_traducciones_fuentes_trafico_df,
-    aplicar_traducciones_segmentos_clientes_df
+    aplicar_traducciones_segmentos_clientes_df,
+    valores_origen
+)
+from utils.filtros import aplicar_filtros
+from utils.tabla_diferida import TablaDiferida
+from utils.snapshot import (
+    RUTA_TRANSACCIONES_UNIFICADAS,
+    RUTA_CLIENTES_UNIFICADOS,
+    RUTA_PRODUCTOS_UNIFICADOS,
+    huella_fuente,
+    cargar_snapshot,
+    guardar_snapshot,
+    filtrar_periodo,
+    ordenar_por_fecha,
+    periodo_mensual
 )
 
-@st.cache_data(ttl=60)
-def load_data_from_postgres():
-    """Carga datos desde archivos unificados (Parquet) o PostgreSQL - con consolidación de variantes de países"""
-    import os
+logger = logging.getLogger(__name__)
+
+# Dimensiones de texto que se guardan como Categorical en modo compacto
+COLUMNAS_CATEGORICAS = [
+    'country', 'region', 'city', 'category', 'subcategory', 'payment_method', 'device_type',
+    'traffic_source', 'customer_segment', 'currency', 'product_name'
+]
+
+# Identificadores que se codifican como enteros con diccionario aparte (códigos de Categorical)
+COLUMNAS_IDENTIFICADORES = ['customer_id', 'product_id']
+
+# Importes que pasan a float32 si la conversión es exacta al céntimo
+COLUMNAS_MONETARIAS = [
+    'unit_price', 'total_amount', 'discount_applied', 'shipping_cost', 'cost_price'
+]
+
+# Medidas que se suman (KPIs, group-by, exportaciones): siguen en float64, porque la
+# suma en float32 de millones de filas pierde los céntimos y más
+COLUMNAS_MEDIDAS = ['total_amount_usd', 'profit']
+
+COLUMNAS_ENTERAS = ['quantity', 'delivery_time']
+
+# Columnas de transactions que usa el dataset: todas salvo la clave interna id (solo sirve
+# de predicado en los incrementos)
+COLUMNAS_TRANSACCIONES = [col.name for col in Transaction.__table__.columns if col.name != 'id']
+
+# Tamaño de cada bloque de COPY que se decodifica de una vez (bytes de CSV)
+TAM_BLOQUE_COPY = 32 * 1024 * 1024
+
+def normalizar_transacciones(transactions_df):
+    """
+    Normalización de la tabla de hechos (fechas, traducciones, consolidación de países).
+    Solo depende de las propias filas, así sirve igual para la carga completa y para un anexo.
+    """
+    transactions_df['date'] = pd.to_datetime(transactions_df['date'])
+    
+    # Traducir categorías al español
+    transactions_df = aplicar_traducciones_df(transactions_df, 'category')
+    if 'subcategory' in transactions_df.columns:
+        transactions_df = aplicar_traducciones_df(transactions_df, 'subcategory')
+    
+    # Traducir países al español consolidando variantes (USA, EIRE, RSA...) en el mismo paso
+    transactions_df = aplicar_traducciones_paises_df(transactions_df, 'country', consolidar=True)
+    
+    # Traducir dispositivos al español
+    if 'device_type' in transactions_df.columns:
+        transactions_df = aplicar_traducciones_dispositivos_df(transactions_df, 'device_type')
+    
+    # Traducir métodos de pago al español
+    if 'payment_method' in transactions_df.columns:
+        transactions_df = aplicar_traducciones_metodos_pago_df(transactions_df, 'payment_method')
+    
+    # Traducir fuentes de tráfico al español
+    if 'traffic_source' in transactions_df.columns:
+        transactions_df = aplicar_traducciones_fuentes_trafico_df(transactions_df, 'traffic_source')
+    
+    # Traducir segmentos de clientes al español
+    if 'customer_segment' in transactions_df.columns:
+        transactions_df = aplicar_traducciones_segmentos_clientes_df(transactions_df, 'customer_segment')
+    
+    return transactions_df
+
+def normalizar_dimensiones(customers_df, products_df):
+    """Normalización de clientes y productos (fechas, traducciones, churn en escala 0-1)"""
+    customers_df['registration_date'] = pd.to_datetime(customers_df['registration_date'])
+    customers_df['last_purchase_date'] = pd.to_datetime(customers_df['last_purchase_date'])
+    if 'launch_date' in products_df.columns:
+        products_df['launch_date'] = pd.to_datetime(products_df['launch_date'])
+    
+    products_df = aplicar_traducciones_df(products_df, 'category')
+    if 'subcategory' in products_df.columns:
+        products_df = aplicar_traducciones_df(products_df, 'subcategory')
+    
+    customers_df = aplicar_traducciones_paises_df(customers_df, 'country', consolidar=True)
+    
+    # Traducir segmentos RFM al español
+    if 'rfm_segment' in customers_df.columns:
+        customers_df = aplicar_traducciones_rfm_df(customers_df, 'rfm_segment')
+    
+    if 'customer_segment' in customers_df.columns:
+        customers_df = aplicar_traducciones_segmentos_clientes_df(customers_df, 'customer_segment')
+    
+    # Convertir churn_probability de escala 0-100 a escala 0-1 estándar
+    if 'churn_probability' in customers_df.columns:
+        # Si los valores están en rango 0-100, convertir a 0-1
+        if customers_df['churn_probability'].max() > 1.0:
+            customers_df['churn_probability'] = customers_df['churn_probability'] / 100.0
+    
+    return customers_df, products_df
+
+def normalizar_datos(transactions_df, customers_df, products_df):
+    """
+    Cadena completa de normalización (fechas, traducciones, consolidación de países, churn).
+    Las columnas traducidas quedan como Categorical (traducción a nivel de diccionario).
+    Es la misma para Parquet y PostgreSQL, así el snapshot "gold" es idéntico sea cual sea la fuente.
+    """
+    transactions_df = normalizar_transacciones(transactions_df)
+    customers_df, products_df = normalizar_dimensiones(customers_df, products_df)
+    return transactions_df, customers_df, products_df
+
+def reporte_memoria(antes_df, despues_df):
+    """
+    Compara el uso de memoria por columna entre dos versiones del mismo DataFrame
     
-    # Verificar si existen archivos unificados
-    use_unified = os.path.exists('data/transactions_unified.parquet')
+    Returns:
+        DataFrame con bytes antes, después y ahorrados por columna (más fila TOTAL)
+    """
+    antes = antes_df.memory_usage(deep=True, index=False)
+    despues = despues_df.memory_usage(deep=True, index=False)
+    reporte = pd.DataFrame({
+        'tipo_antes': antes_df.dtypes.astype(str),
+        'tipo_despues': despues_df.dtypes.astype(str),
+        'bytes_antes': antes,
+        'bytes_despues': despues
+    })
+    reporte['bytes_ahorrados'] = reporte['bytes_antes'] - reporte['bytes_despues']
+    reporte.loc['TOTAL', ['bytes_antes', 'bytes_despues', 'bytes_ahorrados']] = reporte[
+        ['bytes_antes', 'bytes_despues', 'bytes_ahorrados']
+    ].sum()
+    return reporte
+
+def compactar_transacciones(transactions_df):
+    """
+    Modo compacto de la tabla de hechos: dimensiones como Categorical, identificadores
+    codificados como enteros, importes en float32 cuando es seguro (salvo las medidas
+    que se suman, COLUMNAS_MEDIDAS) y enteros reducidos.
+    
+    Returns:
+        tuple: (DataFrame compacto, diccionarios {columna: categorías}, reporte de memoria)
+    """
+    compacto = transactions_df.copy()
+    
+    for col in COLUMNAS_CATEGORICAS + COLUMNAS_IDENTIFICADORES:
+        if col in compacto.columns and not isinstance(compacto[col].dtype, pd.CategoricalDtype):
+            compacto[col] = compacto[col].astype('category')
+    
+    for col in COLUMNAS_MONETARIAS:
+        if col in compacto.columns and compacto[col].dtype == np.float64:
+            valores = compacto[col].to_numpy()
+            valores_32 = valores.astype(np.float32)
+            # Seguro = el valor en float32 coincide al céntimo con el original
+            error = np.nanmax(np.abs(valores_32.astype(np.float64) - valores)) if len(valores) else 0.0
+            if np.isfinite(valores_32[~np.isnan(valores)]).all() and error < 0.005:
+                compacto[col] = valores_32
+    
+    for col in COLUMNAS_ENTERAS:
+        if col in compacto.columns and pd.api.types.is_integer_dtype(compacto[col]):
+            compacto[col] = pd.to_numeric(compacto[col], downcast='integer')
     
-    if use_unified:
+    if 'transaction_id' in compacto.columns and compacto['transaction_id'].dtype == object:
         try:
-            # Cargar desde archivos unificados
-            transactions_df = pd.read_parquet('data/transactions_unified.parquet')
-            customers_df = pd.read_parquet('data/customers_unified.parquet')
-            products_df = pd.read_parquet('data/products_unified.parquet')
-            
-            # Convertir fechas
-            transactions_df['date'] = pd.to_datetime(transactions_df['date'])
-            customers_df['registration_date'] = pd.to_datetime(customers_df['registration_date'])
-            customers_df['last_purchase_date'] = pd.to_datetime(customers_df['last_purchase_date'])
-            if 'launch_date' in products_df.columns:
-                products_df['launch_date'] = pd.to_datetime(products_df['launch_date'])
-            
-            # Traducir categorías al español
-            transactions_df = aplicar_traducciones_df(transactions_df, 'category')
-            products_df = aplicar_traducciones_df(products_df, 'category')
-            if 'subcategory' in transactions_df.columns:
-                transactions_df = aplicar_traducciones_df(transactions_df, 'subcategory')
-            if 'subcategory' in products_df.columns:
-                products_df = aplicar_traducciones_df(products_df, 'subcategory')
-            
-            # Traducir países al español
-            transactions_df = aplicar_traducciones_paises_df(transactions_df, 'country')
-            customers_df = aplicar_traducciones_paises_df(customers_df, 'country')
-            
-            # Consolidar variantes de nombres de países
-            transactions_df['country'] = transactions_df['country'].replace({
-                'USA': 'Estados Unidos',
-                'EIRE': 'Irlanda',
-                'Ireland': 'Irlanda',
-                'RSA': 'Sudáfrica',
-                'Channel Islands': 'Reino Unido',
-                'European Community': 'Unión Europea',
-                'Unspecified': 'No Especificado'
-            })
-            customers_df['country'] = customers_df['country'].replace({
-                'USA': 'Estados Unidos',
-                'EIRE': 'Irlanda',
-                'Ireland': 'Irlanda',
-                'RSA': 'Sudáfrica',
-                'Channel Islands': 'Reino Unido',
-                'European Community': 'Unión Europea',
-                'Unspecified': 'No Especificado'
-            })
-            
-            # Traducir segmentos RFM al español
-            if 'rfm_segment' in customers_df.columns:
-                customers_df = aplicar_traducciones_rfm_df(customers_df, 'rfm_segment')
-            
-            # Traducir dispositivos al español
-            if 'device_type' in transactions_df.columns:
-                transactions_df = aplicar_traducciones_dispositivos_df(transactions_df, 'device_type')
-            
-            # Traducir métodos de pago al español
-            if 'payment_method' in transactions_df.columns:
-                transactions_df = aplicar_traducciones_metodos_pago_df(transactions_df, 'payment_method')
-            
-            # Traducir fuentes de tráfico al español
-            if 'traffic_source' in transactions_df.columns:
-                transactions_df = aplicar_traducciones_fuentes_trafico_df(transactions_df, 'traffic_source')
-            
-            # Traducir segmentos de clientes al español
-            if 'customer_segment' in transactions_df.columns:
-                transactions_df = aplicar_traducciones_segmentos_clientes_df(transactions_df, 'customer_segment')
-            if 'customer_segment' in customers_df.columns:
-                customers_df = aplicar_traducciones_segmentos_clientes_df(customers_df, 'customer_segment')
-            
-            # Convertir churn_probability de escala 0-100 a escala 0-1 estándar
-            if 'churn_probability' in customers_df.columns:
-                # Si los valores están en rango 0-100, convertir a 0-1
-                if customers_df['churn_probability'].max() > 1.0:
-                    customers_df['churn_probability'] = customers_df['churn_probability'] / 100.0
-            
-            return transactions_df, customers_df, products_df
-            
-        except Exception as e:
+            compacto['transaction_id'] = compacto['transaction_id'].astype('string[pyarrow]')
+        except (ImportError, TypeError):
             pass
     
-    # Fallback a PostgreSQL
+    diccionarios = {
+        col: compacto[col].cat.categories
+        for col in COLUMNAS_IDENTIFICADORES if col in compacto.columns
+    }
+    
+    return compacto, diccionarios, reporte_memoria(transactions_df, compacto)
+
+def leer_dimensiones():
+    """Lee clientes y productos crudos desde archivos unificados (Parquet) o PostgreSQL"""
+    if os.path.exists(RUTA_TRANSACCIONES_UNIFICADAS):
+        return pd.read_parquet(RUTA_CLIENTES_UNIFICADOS), pd.read_parquet(RUTA_PRODUCTOS_UNIFICADOS)
+    
     engine = get_engine()
+    return pd.read_sql_table('customers', engine), pd.read_sql_table('products', engine)
+
+class _DecodificadorCopy:
+    """
+    Destino de copy_expert: acumula el CSV que envía el servidor y, cada TAM_BLOQUE_COPY
+    bytes, decodifica los registros completos a columnas tipadas (dimensiones como
+    Categorical), de modo que nunca se materializan filas como tuplas de Python.
+    """
     
-    try:
-        # Cargar transacciones
-        transactions_df = pd.read_sql_table('transactions', engine)
-        
-        # Cargar clientes
-        customers_df = pd.read_sql_table('customers', engine)
-        
-        # Cargar productos
-        products_df = pd.read_sql_table('products', engine)
-        
-        # Convertir fechas
-        transactions_df['date'] = pd.to_datetime(transactions_df['date'])
-        customers_df['registration_date'] = pd.to_datetime(customers_df['registration_date'])
-        customers_df['last_purchase_date'] = pd.to_datetime(customers_df['last_purchase_date'])
-        products_df['launch_date'] = pd.to_datetime(products_df['launch_date'])
-        
-        # Traducir categorías al español
-        transactions_df = aplicar_traducciones_df(transactions_df, 'category')
-        products_df = aplicar_traducciones_df(products_df, 'category')
-        if 'subcategory' in transactions_df.columns:
-            transactions_df = aplicar_traducciones_df(transactions_df, 'subcategory')
-        if 'subcategory' in products_df.columns:
-            products_df = aplicar_traducciones_df(products_df, 'subcategory')
-        
-        # Traducir países al español
-        transactions_df = aplicar_traducciones_paises_df(transactions_df, 'country')
-        customers_df = aplicar_traducciones_paises_df(customers_df, 'country')
-        
-        # Consolidar variantes de nombres de países
-        transactions_df['country'] = transactions_df['country'].replace({
-            'USA': 'Estados Unidos',
-            'EIRE': 'Irlanda',
-            'Ireland': 'Irlanda',
-            'RSA': 'Sudáfrica',
-            'Channel Islands': 'Reino Unido',
-            'European Community': 'Unión Europea',
-            'Unspecified': 'No Especificado'
-        })
-        customers_df['country'] = customers_df['country'].replace({
-            'USA': 'Estados Unidos',
-            'EIRE': 'Irlanda',
-            'Ireland': 'Irlanda',
-            'RSA': 'Sudáfrica',
-            'Channel Islands': 'Reino Unido',
-            'European Community': 'Unión Europea',
-            'Unspecified': 'No Especificado'
-        })
-        
-        # Traducir segmentos RFM al español
-        if 'rfm_segment' in customers_df.columns:
-            customers_df = aplicar_traducciones_rfm_df(customers_df, 'rfm_segment')
-        
-        # Traducir dispositivos al español
-        if 'device_type' in transactions_df.columns:
-            transactions_df = aplicar_traducciones_dispositivos_df(transactions_df, 'device_type')
+    def __init__(self, columnas, tipos, fechas, tam_bloque=TAM_BLOQUE_COPY):
+        self.columnas = columnas
+        self.tipos = tipos
+        self.fechas = fechas
+        self.tam_bloque = tam_bloque
+        self.bloques = []
+        self._buffer = bytearray()
+        # Hasta dónde se han contado las comillas del buffer y su paridad en ese punto:
+        # cada corte solo recorre los bytes recibidos desde el anterior
+        self._escaneado = 0
+        self._paridad = 0
+    
+    def write(self, datos):
+        self._buffer += datos
+        if len(self._buffer) >= self.tam_bloque:
+            self._decodificar(final=False)
+        return len(datos)
+    
+    def _corte(self):
+        """Último salto de línea que cierra un registro (fuera de un campo entre comillas)"""
+        inicio, fin = self._escaneado, len(self._buffer)
+        paridad_fin = (self._paridad + self._buffer.count(b'"', inicio, fin)) % 2
         
-        # Traducir métodos de pago al español
-        if 'payment_method' in transactions_df.columns:
-            transactions_df = aplicar_traducciones_metodos_pago_df(transactions_df, 'payment_method')
+        # Hacia atrás desde el final: la paridad antes de cada salto de línea se obtiene
+        # restando las comillas del tramo recorrido, sin volver al principio del buffer
+        corte, paridad, tramo_fin = -1, paridad_fin, fin
+        pos = self._buffer.rfind(b'\n', inicio)
+        while pos >= 0:
+            paridad = (paridad - self._buffer.count(b'"', pos, tramo_fin)) % 2
+            if paridad == 0:
+                corte = pos
+                break
+            tramo_fin = pos
+            pos = self._buffer.rfind(b'\n', inicio, pos)
         
-        # Traducir fuentes de tráfico al español
-        if 'traffic_source' in transactions_df.columns:
-            transactions_df = aplicar_traducciones_fuentes_trafico_df(transactions_df, 'traffic_source')
+        # Tras el corte no queda ningún salto fuera de comillas: la siguiente búsqueda
+        # empieza al final de lo recibido (antes del corte la paridad es par)
+        self._escaneado = fin - (corte + 1)
+        self._paridad = paridad_fin
+        return corte
+    
+    def _decodificar(self, final):
+        corte = len(self._buffer) - 1 if final else self._corte()
+        if corte < 0:
+            return
         
-        # Traducir segmentos de clientes al español
-        if 'customer_segment' in transactions_df.columns:
-            transactions_df = aplicar_traducciones_segmentos_clientes_df(transactions_df, 'customer_segment')
-        if 'customer_segment' in customers_df.columns:
-            customers_df = aplicar_traducciones_segmentos_clientes_df(customers_df, 'customer_segment')
+        bloque = pd.read_csv(
+            io.BytesIO(bytes(self._buffer[:corte + 1])),
+            header=None,
+            names=self.columnas,
+            dtype=self.tipos,
+            keep_default_na=False,
+            na_values=['']
+        )
+        del self._buffer[:corte + 1]
+        if final:
+            self._escaneado, self._paridad = 0, 0
         
-        # Convertir churn_probability de escala 0-100 a escala 0-1 estándar
-        if 'churn_probability' in customers_df.columns:
-            # Si los valores están en rango 0-100, convertir a 0-1
-            if customers_df['churn_probability'].max() > 1.0:
-                customers_df['churn_probability'] = customers_df['churn_probability'] / 100.0
+        for col in self.fechas:
+            bloque[col] = pd.to_datetime(bloque[col], format='ISO8601')
+        self.bloques.append(bloque)
+    
+    def cerrar(self):
+        """Decodifica lo pendiente y une los bloques columna a columna (liberando cada bloque)"""
+        if self._buffer:
+            self._decodificar(final=True)
         
-        return transactions_df, customers_df, products_df
+        if not self.bloques:
+            return pd.DataFrame({col: pd.Series(dtype=self.tipos[col]) for col in self.columnas})
         
+        resultado = {}
+        for col in self.columnas:
+            partes = [bloque.pop(col) for bloque in self.bloques]
+            if isinstance(partes[0].dtype, pd.CategoricalDtype):
+                resultado[col] = union_categoricals(partes)
+            else:
+                serie = pd.concat(partes, ignore_index=True)
+                # Enteros anulables a int64 si no hay nulos (igual que read_sql_table)
+                if isinstance(serie.dtype, pd.Int64Dtype):
+                    serie = serie.astype('int64') if not serie.isna().any() else serie.astype('float64')
+                resultado[col] = serie
+            del partes
+        self.bloques = []
+        return pd.DataFrame(resultado)
+
+def _tipos_copy(columnas):
+    """Tipos de lectura por columna a partir del modelo Transaction"""
+    tipos, fechas = {}, []
+    modelo = Transaction.__table__.columns
+    for col in columnas:
+        tipo = modelo[col].type
+        if isinstance(tipo, sa_types.Integer):
+            tipos[col] = 'Int64'
+        elif isinstance(tipo, sa_types.Float):
+            tipos[col] = 'float64'
+        elif isinstance(tipo, (sa_types.DateTime, sa_types.Date)):
+            tipos[col] = 'object'
+            fechas.append(col)
+        elif col in COLUMNAS_CATEGORICAS or col in COLUMNAS_IDENTIFICADORES:
+            tipos[col] = 'category'
+        else:
+            tipos[col] = 'object'
+    return tipos, fechas
+
+def leer_transacciones_copy(columnas=None, fecha_inicio=None, fecha_fin=None, id_desde=None, id_hasta=None,
+                            tam_bloque=TAM_BLOQUE_COPY):
+    """
+    Lee transacciones de PostgreSQL con COPY ... TO STDOUT (CSV) en streaming por bloques.
+    
+    Args:
+        columnas: proyección (por defecto todas las del modelo Transaction)
+        fecha_inicio, fecha_fin: predicado sobre date (inclusive)
+        id_desde, id_hasta: predicado sobre id (id_desde < id <= id_hasta), para incrementos
+        tam_bloque: bytes de CSV por bloque decodificado
+    
+    Returns:
+        DataFrame con columnas tipadas; el pico de memoria es el frame final más un bloque
+    """
+    from psycopg2 import sql
+    
+    modelo = Transaction.__table__.columns
+    columnas = list(columnas) if columnas else [col.name for col in modelo]
+    desconocidas = [col for col in columnas if col not in modelo]
+    if desconocidas:
+        raise ValueError(f"Columnas desconocidas en transactions: {desconocidas}")
+    
+    condiciones, parametros = [], {}
+    if fecha_inicio is not None:
+        condiciones.append("date >= %(fecha_inicio)s")
+        parametros['fecha_inicio'] = pd.Timestamp(fecha_inicio).to_pydatetime()
+    if fecha_fin is not None:
+        condiciones.append("date <= %(fecha_fin)s")
+        parametros['fecha_fin'] = pd.Timestamp(fecha_fin).to_pydatetime()
+    if id_desde is not None:
+        condiciones.append("id > %(id_desde)s")
+        parametros['id_desde'] = int(id_desde)
+    if id_hasta is not None:
+        condiciones.append("id <= %(id_hasta)s")
+        parametros['id_hasta'] = int(id_hasta)
+    
+    tipos, fechas = _tipos_copy(columnas)
+    decodificador = _DecodificadorCopy(columnas, tipos, fechas, tam_bloque)
+    
+    conexion = get_engine().raw_connection()
+    try:
+        cursor = conexion.cursor()
+        consulta = sql.SQL("SELECT {} FROM transactions").format(
+            sql.SQL(', ').join(sql.Identifier(col) for col in columnas)
+        ).as_string(cursor)
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        if id_desde is not None:
+            consulta += " ORDER BY id"
+        # COPY no admite parámetros: se interpolan en cliente con el escape de psycopg2
+        consulta = cursor.mogrify(consulta, parametros).decode() if parametros else consulta
+        cursor.copy_expert(f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv)", decodificador)
+        cursor.close()
+    finally:
+        conexion.close()
+    
+    return decodificador.cerrar()
+
+def leer_fuentes(periodo=None):
+    """
+    Lee las tablas crudas desde archivos unificados (Parquet) o, si no existen, desde PostgreSQL.
+    
+    Args:
+        periodo: (inicio, fin) de las transacciones a leer de PostgreSQL (None = todas);
+            los archivos unificados se leen enteros
+    
+    Returns:
+        tuple: (transacciones, clientes, productos, completo); completo indica si las
+        transacciones son el histórico entero (las únicas que se guardan como snapshot)
+    """
+    if os.path.exists(RUTA_TRANSACCIONES_UNIFICADAS):
+        try:
+            return (pd.read_parquet(RUTA_TRANSACCIONES_UNIFICADAS),) + leer_dimensiones() + (True,)
+        except Exception as e:
+            pass
+    
+    # Fallback a PostgreSQL: transacciones por COPY en streaming (solo las columnas del
+    # dataset y el periodo pedido), dimensiones (pequeñas) por SQL
+    inicio, fin = periodo if periodo is not None else (None, None)
+    try:
+        transacciones = leer_transacciones_copy(COLUMNAS_TRANSACCIONES, inicio, fin)
     except Exception as e:
-        st.error(f"Error loading data: {str(e)}")
-        return None, None, None
+        logger.warning("COPY no disponible, se lee transactions con read_sql_query: %s", e)
+        condiciones = " WHERE date >= :inicio AND date <= :fin" if periodo is not None else ""
+        transacciones = pd.read_sql_query(
+            text(f"SELECT {', '.join(COLUMNAS_TRANSACCIONES)} FROM transactions{condiciones}"),
+            get_engine(),
+            params={'inicio': inicio, 'fin': fin} if periodo is not None else None
+        )
+    
+    engine = get_engine()
+    return (
+        transacciones, pd.read_sql_table('customers', engine), pd.read_sql_table('products', engine),
+        periodo is None
+    )
 
-@st.cache_data
-def load_or_generate_data():
-    """Carga datos desde fuente disponible"""
-    # Cargar directamente sin mensajes
-    return load_data_from_postgres()
+def leer_incremento(marca_anterior, marca_nueva):
+    """
+    Lee solo las transacciones crudas añadidas desde la marca de agua anterior:
+    los row groups nuevos del Parquet o las filas con id mayor en PostgreSQL.
+    
+    Raises:
+        ValueError: si el incremento no cuadra con la marca (el histórico cambió)
+    """
+    tx_anterior, tx_nueva = marca_anterior['transacciones'], marca_nueva['transacciones']
+    
+    if marca_nueva['origen'] == 'parquet':
+        import pyarrow.parquet as pq
+        
+        grupos = range(len(tx_anterior['grupos']), len(tx_nueva['grupos']))
+        if not grupos:
+            return None
+        return pq.ParquetFile(RUTA_TRANSACCIONES_UNIFICADAS).read_row_groups(list(grupos)).to_pandas()
+    
+    if tx_anterior == tx_nueva:
+        return None
+    
+    nuevas = leer_transacciones_copy(
+        COLUMNAS_TRANSACCIONES, id_desde=tx_anterior['max_id'], id_hasta=tx_nueva['max_id']
+    )
+    if len(nuevas) != tx_nueva['filas'] - tx_anterior['filas']:
+        raise ValueError("El conteo de transacciones no cuadra con un anexo: cambió el histórico")
+    return nuevas
 
-def filter_data(df, filters):
-    """Aplica filtros al DataFrame"""
-    filtered_df = df.copy()
+def alinear_tipos(nuevas_df, referencia_df):
+    """
+    Convierte un incremento a los tipos de la tabla ya cargada (float32, enteros reducidos...).
+    Las categóricas quedan como categóricas con su propio diccionario; se unifican al anexar.
+    
+    Raises:
+        ValueError: si faltan columnas o la conversión pierde información
+    """
+    if list(nuevas_df.columns) != list(referencia_df.columns):
+        raise ValueError("Las columnas del incremento no coinciden con las del dataset")
+    
+    alineadas = nuevas_df.copy()
+    for col, tipo in referencia_df.dtypes.items():
+        if isinstance(tipo, pd.CategoricalDtype):
+            alineadas[col] = alineadas[col].astype('category')
+        elif alineadas[col].dtype != tipo:
+            convertida = alineadas[col].astype(tipo)
+            if pd.api.types.is_numeric_dtype(tipo):
+                # Misma tolerancia que el modo compacto: exacto al céntimo
+                diferencia = np.abs(convertida.to_numpy(np.float64) - alineadas[col].to_numpy(np.float64))
+                if np.nanmax(diferencia, initial=0.0) >= 0.005:
+                    raise ValueError(f"La columna {col} no cabe en {tipo}")
+            alineadas[col] = convertida
+    return alineadas
+
+def anexar_transacciones(transactions_df, nuevas_df):
+    """
+    Concatena un incremento ya alineado conservando los códigos de las categóricas existentes:
+    las categorías nuevas se añaden al final del diccionario. El resultado queda ordenado por
+    fecha; si el incremento es posterior a todo lo cargado (el caso normal), las filas previas
+    conservan su posición y las nuevas quedan al final.
+    """
+    if nuevas_df is None or len(nuevas_df) == 0:
+        return transactions_df
+    nuevas_df = ordenar_por_fecha(nuevas_df)
+    
+    actuales, nuevas = transactions_df.copy(deep=False), nuevas_df.copy(deep=False)
+    for col in actuales.columns:
+        if isinstance(actuales[col].dtype, pd.CategoricalDtype):
+            categorias = actuales[col].cat.categories
+            categorias = categorias.append(nuevas[col].cat.categories.difference(categorias))
+            actuales[col] = actuales[col].cat.set_categories(categorias)
+            nuevas[col] = nuevas[col].cat.set_categories(categorias)
+    
+    return ordenar_por_fecha(pd.concat([actuales, nuevas], ignore_index=True))
+
+def cargar_incremento(marca_anterior, marca_nueva, referencia_df):
+    """
+    Lee y normaliza lo añadido a la fuente desde la marca anterior.
+    
+    Returns:
+        tuple: (transacciones nuevas alineadas con referencia_df, clientes, productos);
+        clientes y productos son None si no cambiaron
+    """
+    nuevas = leer_incremento(marca_anterior, marca_nueva)
+    if nuevas is not None and len(nuevas):
+        nuevas = ordenar_por_fecha(alinear_tipos(normalizar_transacciones(nuevas), referencia_df))
+    else:
+        nuevas = referencia_df.iloc[:0]
+    
+    clientes, productos = None, None
+    if marca_anterior['dimensiones'] != marca_nueva['dimensiones']:
+        clientes, productos = normalizar_dimensiones(*leer_dimensiones())
     
-    if 'date_range' in filters and filters['date_range']:
-        start_date, end_date = filters['date_range']
-        filtered_df = filtered_df[(filtered_df['date'] >= pd.Timestamp(start_date)) & 
-                                   (filtered_df['date'] <= pd.Timestamp(end_date))]
+    return nuevas, clientes, productos
+
+def clave_snapshot(huella, compacto=True):
+    """Clave del snapshot "gold" para una huella: cada modo tiene su propio snapshot"""
+    return f"{huella}-compacto" if huella and compacto else huella
+
+def load_data_from_postgres(huella=None, compacto=True, fecha_inicio=None, fecha_fin=None):
+    """
+    Carga datos normalizados desde el snapshot "gold" si está vigente; si no, los lee de
+    archivos unificados (Parquet) o PostgreSQL, los normaliza y regenera el snapshot.
+    Con compacto=True la tabla de transacciones se guarda y devuelve en modo compacto.
+    
+    Con fecha_inicio/fecha_fin solo se devuelven las transacciones de los meses que
+    solapan ese rango (poda de particiones); sin ellas, el histórico completo.
+    Clientes y productos se devuelven como TablaDiferida: sus columnas se materializan
+    la primera vez que una pestaña las pide.
+    """
+    if huella is None:
+        huella = huella_fuente()
+    
+    clave = clave_snapshot(huella, compacto)
     
-    if 'countries' in filters and filters['countries']:
-        filtered_df = filtered_df[filtered_df['country'].isin(filters['countries'])]
+    datos = cargar_snapshot(clave, fecha_inicio, fecha_fin)
+    if datos is not None:
+        return datos
+    
+    periodo = periodo_mensual(fecha_inicio, fecha_fin)
+    try:
+        *tablas, completo = leer_fuentes(periodo)
+        transactions_df, customers_df, products_df = normalizar_datos(*tablas)
+    except Exception as e:
+        st.error(f"Error loading data: {str(e)}")
+        return None, None, None
     
-    if 'categories' in filters and filters['categories']:
-        filtered_df = filtered_df[filtered_df['category'].isin(filters['categories'])]
+    if compacto:
+        transactions_df, _, reporte = compactar_transacciones(transactions_df)
+        total = reporte.loc['TOTAL']
+        logger.info(
+            "Modo compacto: %.1f MB -> %.1f MB (%.1f MB ahorrados)\n%s",
+            total['bytes_antes'] / 1e6, total['bytes_despues'] / 1e6,
+            total['bytes_ahorrados'] / 1e6, reporte.to_string()
+        )
     
-    if 'segments' in filters and filters['segments']:
-        filtered_df = filtered_df[filtered_df['customer_segment'].isin(filters['segments'])]
+    # Orden físico por fecha: los rangos de fechas se resuelven con searchsorted
+    transactions_df = ordenar_por_fecha(transactions_df)
     
-    if 'payment_methods' in filters and filters['payment_methods']:
-        filtered_df = filtered_df[filtered_df['payment_method'].isin(filters['payment_methods'])]
+    # El snapshot guarda siempre el histórico completo (una lectura acotada de PostgreSQL no
+    # se guarda: lo construye python -m utils.snapshot); se devuelve solo el periodo pedido
+    if completo:
+        guardar_snapshot(clave, transactions_df, customers_df, products_df)
+    transactions_df = filtrar_periodo(transactions_df, periodo)
     
-    if 'device_types' in filters and filters['device_types']:
-        filtered_df = filtered_df[filtered_df['device_type'].isin(filters['device_types'])]
+    return (
+        transactions_df,
+        TablaDiferida.desde_dataframe('clientes', customers_df),
+        TablaDiferida.desde_dataframe('productos', products_df)
+    )
+
+def load_or_generate_data():
+    """Carga datos desde fuente disponible (sin caché: el dataset compartido vive en utils.dataset)"""
+    # Cargar directamente sin mensajes; aquí las dimensiones se materializan completas
+    transactions_df, customers, products = load_data_from_postgres()
+    if transactions_df is None:
+        return None, None, None
+    return transactions_df, customers.completa(), products.completa()
+
+def filter_data(df, filters):
+    """Aplica filtros al DataFrame (claves en inglés; mismo motor de máscara única que aplicar_filtros)"""
+    filtros = {
+        'paises': filters.get('countries'),
+        'categorias': filters.get('categories'),
+        'segmentos': filters.get('segments'),
+        'metodos_pago': filters.get('payment_methods'),
+        'dispositivos': filters.get('device_types'),
+        'fuentes_trafico': filters.get('traffic_sources')
+    }
     
-    if 'traffic_sources' in filters and filters['traffic_sources']:
-        filtered_df = filtered_df[filtered_df['traffic_source'].isin(filters['traffic_sources'])]
+    if filters.get('date_range'):
+        filtros['fecha_inicio'], filtros['fecha_fin'] = filters['date_range']
     
-    if 'price_range' in filters and filters['price_range']:
-        min_price, max_price = filters['price_range']
-        filtered_df = filtered_df[(filtered_df['unit_price'] >= min_price) & 
-                                   (filtered_df['unit_price'] <= max_price)]
+    if filters.get('price_range'):
+        filtros['precio_min'], filtros['precio_max'] = filters['price_range']
     
-    return filtered_df
+    return aplicar_filtros(df, filtros)
 
 def get_date_range_preset(preset):
     """Devuelve rango de fechas basado en preset"""
@@ -264,11 +625,12 @@ def get_kpis_from_db(start_date, end_date, filters=None):
     
     if filters:
         if 'countries' in filters and filters['countries']:
-            countries_str = "','".join(filters['countries'])
+            # Los filtros llegan en español; la base de datos guarda los valores originales
+            countries_str = "','".join(valores_origen('country', filters['countries']))
             query += f" AND country IN ('{countries_str}')"
         
         if 'categories' in filters and filters['categories']:
-            categories_str = "','".join(filters['categories'])
+            categories_str = "','".join(valores_origen('category', filters['categories']))
             query += f" AND category IN ('{categories_str}')"
     
     try:
@@ -0,0 +1,400 @@
+"""
+Dataset compartido del dashboard
+Autor: cmsr92
+
+Un único objeto de solo lectura por proceso, compartido por todas las sesiones
+de Streamlit a través de st.cache_resource (sin pickle ni copias por sesión).
+
+Las transacciones se cargan por periodo: solo los meses que pide la barra lateral
+(más la ventana de comparación). Si una sesión pide un rango no cubierto, el almacén
+amplía el periodo cargado y publica una nueva versión del dataset.
+
+Refresco incremental en segundo plano: un hilo del almacén compara cada
+INTERVALO_REFRESCO segundos la marca de agua de la fuente (max id/fecha en PostgreSQL,
+mtime y row groups en Parquet). Si solo hay filas nuevas se anexan al dataset en memoria
+y al snapshot, y los resultados derivados se extienden; solo un cambio de esquema o de
+histórico provoca una recarga completa. La versión nueva (con sus derivados ya
+calculados) sustituye a la anterior de forma atómica: las peticiones siempre se sirven
+de la última versión buena y nunca esperan a una recarga.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+from utils.data_loader_pg import (
+    load_data_from_postgres,
+    clave_snapshot,
+    cargar_incremento,
+    anexar_transacciones
+)
+from utils.tabla_diferida import TablaDiferida
+from utils.snapshot import (
+    huella_y_marca,
+    marca_agua_fuente,
+    comparar_marcas,
+    anexar_snapshot,
+    filtrar_periodo,
+    periodo_mensual
+)
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre comprobaciones de la marca de agua de la fuente
+INTERVALO_REFRESCO = 60
+
+# Meses que carga la API cuando una petición no acota alguno de los extremos del rango
+MESES_DATASET_API = int(os.getenv('API_MESES_DATASET', '12'))
+
+
+class DatasetCompartido:
+    """
+    Contenedor inmutable de las tablas normalizadas del dashboard.
+
+    Las tablas se comparten entre sesiones: los consumidores deben tratarlas
+    como solo lectura y trabajar sobre vistas filtradas o copias propias.
+    Clientes y productos son TablaDiferida: se piden por columnas con .columnas([...]).
+    """
+
+    def __init__(self, transacciones, clientes, productos, version=None, periodo=None):
+        self.transacciones = transacciones
+        self.clientes = clientes
+        self.productos = productos
+        self.version = version or uuid.uuid4().hex[:12]
+        # (inicio, fin) en meses completos de las transacciones cargadas; None = histórico completo
+        self.periodo = periodo
+        self.creado_en = datetime.now()
+        # nombre -> (valor, constructor, extensor) de los resultados derivados de esta versión
+        self._derivados = {}
+        # Reentrante: un derivado puede construirse a partir de otro (sumas prefijas <- cubo)
+        self._lock = threading.RLock()
+
+    def derivado(self, nombre, constructor, extensor=None):
+        """
+        Resultado derivado del dataset (agregados, índices...), calculado una vez por versión.
+
+        Args:
+            nombre: clave del resultado
+            constructor: función(dataset) que lo calcula desde cero
+            extensor: función(valor, nuevas_df, dataset) que lo actualiza con filas anexadas;
+                sin extensor, la versión siguiente lo recalcula con el constructor
+
+        Returns:
+            El valor derivado
+        """
+        entrada = self._derivados.get(nombre)
+        if entrada is None:
+            with self._lock:
+                entrada = self._derivados.get(nombre)
+                if entrada is None:
+                    entrada = (constructor(self), constructor, extensor)
+                    self._derivados[nombre] = entrada
+        return entrada[0]
+
+    def descartar_derivado(self, nombre):
+        """Olvida un derivado: la siguiente llamada a derivado() lo vuelve a construir"""
+        with self._lock:
+            self._derivados.pop(nombre, None)
+
+    def precalcular(self, origen):
+        """Calcula los derivados que tenía registrados otra versión (para publicar esta ya caliente)"""
+        for nombre, (_, constructor, extensor) in list(origen._derivados.items()):
+            try:
+                self.derivado(nombre, constructor, extensor)
+            except Exception as e:
+                logger.warning("No se pudo precalcular %s: %s", nombre, e)
+
+    def anexar(self, nuevas_df, clientes=None, productos=None, version=None):
+        """
+        Nueva versión con las transacciones anexadas al final (y clientes/productos
+        sustituidos si se pasan). Los derivados con extensor se actualizan con las filas nuevas;
+        el resto se recalcula, así la versión nueva se publica con todos sus derivados.
+
+        Returns:
+            DatasetCompartido
+        """
+        filas_previas = len(self.transacciones)
+        # Si alguna fila nueva es anterior a la última cargada, el orden por fecha desplaza
+        # posiciones existentes y los derivados no se pueden extender: se recalculan
+        en_orden = (
+            len(nuevas_df) == 0 or filas_previas == 0
+            or nuevas_df['date'].min() >= self.transacciones['date'].iloc[-1]
+        )
+        nuevo = DatasetCompartido(
+            anexar_transacciones(self.transacciones, nuevas_df),
+            TablaDiferida.desde_dataframe('clientes', clientes) if clientes is not None else self.clientes,
+            TablaDiferida.desde_dataframe('productos', productos) if productos is not None else self.productos,
+            version=version,
+            periodo=self.periodo
+        )
+
+        # Cola del nuevo frame: filas anexadas con las categorías ya unificadas
+        anexadas = nuevo.transacciones.iloc[filas_previas:]
+        cambian_dimensiones = clientes is not None or productos is not None
+        for nombre, (valor, constructor, extensor) in list(self._derivados.items()):
+            if extensor is None or cambian_dimensiones or not en_orden:
+                continue
+            try:
+                nuevo._derivados[nombre] = (extensor(valor, anexadas, nuevo), constructor, extensor)
+            except Exception as e:
+                logger.warning("No se pudo extender %s, se recalculará: %s", nombre, e)
+        nuevo.precalcular(self)
+        return nuevo
+
+    def cubre(self, periodo):
+        """Indica si las transacciones cargadas incluyen el periodo (None = histórico completo)"""
+        if self.periodo is None:
+            return True
+        if periodo is None:
+            return False
+        return self.periodo[0] <= periodo[0] and periodo[1] <= self.periodo[1]
+
+    def __iter__(self):
+        # Permite desempaquetar: transacciones, clientes, productos = dataset
+        return iter((self.transacciones, self.clientes, self.productos))
+
+    def __repr__(self):
+        return f"DatasetCompartido(version={self.version!r}, filas={len(self.transacciones):,})"
+
+
+class AlmacenDataset:
+    """
+    Almacén por proceso del dataset compartido. Mantiene el periodo cargado y lo amplía
+    bajo demanda; el periodo solo crece, así todas las sesiones comparten un único dataset.
+    También sigue la marca de agua de la fuente para anexar filas nuevas sin recargar.
+    """
+
+    def __init__(self):
+        self.huella, self.marca = huella_y_marca()
+        self.actual = None
+        # Estado del último refresco con cambios (hora, segundos y tipo) y de la última comprobación
+        self.ultima_actualizacion = None
+        self.duracion_actualizacion = None
+        self.ultimo_cambio = None
+        self.ultima_comprobacion = None
+        self.ultimo_error = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def _version(self, periodo):
+        """La versión deriva de la huella de la fuente y del periodo cargado"""
+        if not self.huella:
+            return None
+        version = self.huella[:12]
+        if periodo is not None:
+            version += f"-{periodo[0]:%Y%m}-{periodo[1]:%Y%m}"
+        return version
+
+    def _cargar(self, periodo):
+        """Carga completa (desde el snapshot o la fuente) del periodo indicado"""
+        inicio, fin = periodo if periodo is not None else (None, None)
+        transacciones_df, clientes_df, productos_df = load_data_from_postgres(
+            self.huella, fecha_inicio=inicio, fecha_fin=fin
+        )
+        if transacciones_df is None or clientes_df is None or productos_df is None:
+            return None
+        return DatasetCompartido(
+            transacciones_df, clientes_df, productos_df, version=self._version(periodo), periodo=periodo
+        )
+
+    def asegurar_periodo(self, fecha_inicio=None, fecha_fin=None):
+        """
+        Devuelve un dataset cuyas transacciones cubren [fecha_inicio, fecha_fin], cargando
+        las particiones que falten. Sin fechas, carga el histórico completo.
+
+        Returns:
+            DatasetCompartido o None si falla la carga
+        """
+        periodo = periodo_mensual(fecha_inicio, fecha_fin)
+
+        actual = self.actual
+        if actual is not None and actual.cubre(periodo):
+            return actual
+
+        with self._lock:
+            actual = self.actual
+            if actual is not None and actual.cubre(periodo):
+                return actual
+
+            # Unión con lo ya cargado (releer del snapshot es más barato que concatenar categóricas)
+            if actual is not None and periodo is not None:
+                periodo = (min(actual.periodo[0], periodo[0]), max(actual.periodo[1], periodo[1]))
+
+            nuevo = self._cargar(periodo)
+            if nuevo is not None:
+                self.actual = nuevo
+            return nuevo
+
+    def refrescar(self):
+        """
+        Compara la marca de agua de la fuente con la del dataset cargado: anexa las filas
+        nuevas si es un anexo y recarga todo si cambió el esquema o el histórico.
+
+        Returns:
+            str: 'igual', 'anexo' o 'recarga'
+        """
+        with self._lock:
+            inicio = time.perf_counter()
+            self.ultima_comprobacion = datetime.now()
+            # Primero la marca de agua (barata); la huella solo se calcula si la fuente cambió
+            marca = marca_agua_fuente()
+            if marca is None or comparar_marcas(self.marca, marca) == 'igual':
+                return 'igual'
+            huella, marca = huella_y_marca()
+            if marca is None:
+                return 'igual'
+            cambio = comparar_marcas(self.marca, marca)
+            if cambio == 'igual':
+                return 'igual'
+
+            actual = self.actual
+            huella_anterior, marca_anterior = self.huella, self.marca
+            self.huella, self.marca = huella, marca
+            if actual is None:
+                return cambio
+
+            if cambio == 'anexo':
+                try:
+                    nuevas, clientes, productos = cargar_incremento(
+                        marca_anterior, marca, actual.transacciones
+                    )
+                except Exception as e:
+                    logger.info("Incremento no aplicable, recarga completa: %s", e)
+                    cambio = 'recarga'
+
+            if cambio == 'anexo':
+                # El snapshot recibe todas las filas nuevas; la memoria, solo las del periodo cargado
+                anexar_snapshot(
+                    clave_snapshot(huella_anterior), clave_snapshot(huella), nuevas, clientes, productos
+                )
+                self.actual = actual.anexar(
+                    filtrar_periodo(nuevas, actual.periodo), clientes, productos,
+                    version=self._version(actual.periodo)
+                )
+                logger.info("Dataset %s: %d filas anexadas", self.actual.version, len(nuevas))
+                self._registrar(cambio, inicio)
+                return cambio
+
+            nuevo = self._cargar(actual.periodo)
+            if nuevo is None:
+                # Se sigue sirviendo la versión anterior; se reintentará en la siguiente comprobación
+                self.huella, self.marca = huella_anterior, marca_anterior
+                return cambio
+
+            nuevo.precalcular(actual)
+            self.actual = nuevo
+            self._registrar(cambio, inicio)
+            return cambio
+
+    def _registrar(self, cambio, inicio):
+        self.ultima_actualizacion = datetime.now()
+        self.duracion_actualizacion = time.perf_counter() - inicio
+        self.ultimo_cambio = cambio
+
+    def _bucle_refresco(self, intervalo):
+        while not self._parar.wait(intervalo):
+            try:
+                self.refrescar()
+                self.ultimo_error = None
+            except Exception as e:
+                # Un fallo de la fuente no tumba el hilo: se sigue sirviendo la última versión buena
+                self.ultimo_error = str(e)
+                logger.warning("Fallo en el refresco en segundo plano: %s", e)
+
+    def iniciar_refresco(self, intervalo=INTERVALO_REFRESCO):
+        """Arranca (una vez) el hilo que refresca el dataset fuera de las peticiones"""
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(
+            target=self._bucle_refresco, args=(intervalo,), name="refresco-dataset", daemon=True
+        )
+        self._hilo.start()
+
+    def detener_refresco(self):
+        self._parar.set()
+
+    def estado(self):
+        """Estado del refresco para mostrar en la interfaz"""
+        return {
+            'version': self.actual.version if self.actual is not None else None,
+            'ultima_actualizacion': self.ultima_actualizacion,
+            'duracion_actualizacion': self.duracion_actualizacion,
+            'ultimo_cambio': self.ultimo_cambio,
+            'ultima_comprobacion': self.ultima_comprobacion,
+            'ultimo_error': self.ultimo_error
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def obtener_almacen():
+    """Almacén del proceso con su hilo de refresco (vive mientras el proceso)"""
+    almacen = AlmacenDataset()
+    almacen.iniciar_refresco()
+    return almacen
+
+
+def obtener_dataset(fecha_inicio=None, fecha_fin=None):
+    """
+    Devuelve el dataset compartido con las transacciones de los meses que solapan
+    [fecha_inicio, fecha_fin] (histórico completo sin fechas), o None si falla la carga
+    """
+    almacen = obtener_almacen()
+    actual = almacen.actual
+    if actual is not None and actual.cubre(periodo_mensual(fecha_inicio, fecha_fin)):
+        return actual
+
+    with st.spinner("Cargando datos..."):
+        return almacen.asegurar_periodo(fecha_inicio, fecha_fin)
+
+
+def estado_refresco():
+    """Última actualización del dataset compartido (hora, duración, tipo de cambio)"""
+    return obtener_almacen().estado()
+
+
+def invalidar_dataset():
+    """Descarta la versión actual del dataset; la siguiente llamada lo recarga"""
+    obtener_almacen().detener_refresco()
+    obtener_almacen.clear()
+
+
+_almacen_api = None
+_almacen_api_lock = threading.Lock()
+
+
+def obtener_dataset_api(fecha_inicio=None, fecha_fin=None):
+    """
+    Dataset compartido para la API, sin Streamlit: almacén propio del proceso sin hilo de
+    refresco (la marca de agua se comprueba en las peticiones, como mucho cada
+    INTERVALO_REFRESCO segundos). El periodo siempre está acotado: un extremo ausente se
+    completa con hoy o con MESES_DATASET_API meses antes del otro, así una petición sin
+    fechas no carga el histórico completo.
+
+    Returns:
+        DatasetCompartido o None si falla la carga
+    """
+    global _almacen_api
+    with _almacen_api_lock:
+        if _almacen_api is None:
+            _almacen_api = AlmacenDataset()
+            # El constructor ya leyó la marca de agua de la fuente
+            _almacen_api.ultima_comprobacion = datetime.now()
+        almacen = _almacen_api
+
+    fin = pd.Timestamp(fecha_fin) if fecha_fin else pd.Timestamp.now().normalize()
+    inicio = pd.Timestamp(fecha_inicio) if fecha_inicio else fin - pd.DateOffset(months=MESES_DATASET_API)
+
+    if almacen.actual is not None and (datetime.now() - almacen.ultima_comprobacion).total_seconds() >= INTERVALO_REFRESCO:
+        try:
+            almacen.refrescar()
+        except Exception as e:
+            logger.warning("No se pudo refrescar el dataset de la API: %s", e)
+    return almacen.asegurar_periodo(inicio, fin)
@@ -0,0 +1,266 @@
+"""
+Recuentos aproximados de valores distintos (HyperLogLog)
+Autor: cmsr92
+
+Clientes y productos únicos no son aditivos: no se pueden sumar por días como las medidas
+del cubo. Un boceto HyperLogLog sí se combina (máximo registro a registro), así que se
+guarda uno por día y por valor de cada dimensión del cubo, y los distintos de cualquier
+rango y segmento salen de unir los bocetos de sus días, con un error relativo típico de
+1.04 / sqrt(2^PRECISION_HLL) (~1.6%).
+
+Los bocetos diarios se guardan dispersos: solo los registros no nulos de cada (grupo, día),
+en arrays ordenados por clave grupo | día | registro. Con filtros en más de una
+dimensión, o con filtro de precio, el recuento es exacto sobre las filas filtradas.
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.cubo import DIMENSIONES_CUBO
+from utils.filtros import COLUMNAS_FILTRO
+
+# Registros por boceto = 2^PRECISION_HLL
+PRECISION_HLL = 12
+ERROR_RELATIVO_HLL = 1.04 / np.sqrt(2 ** PRECISION_HLL)
+
+# Columnas con recuento de distintos
+CAMPOS_DISTINTOS = ['customer_id', 'product_id']
+
+# Columna -> clave del diccionario de filtros
+COLUMNAS_FILTRO_INVERSO = {columna: clave for clave, columna in COLUMNAS_FILTRO.items()}
+
+# Desplazamientos de la clave dispersa: grupo (24 bits) | día (28 bits) | registro (12 bits)
+_BITS_REGISTRO = PRECISION_HLL
+_BITS_DIA = 28
+UN_DIA = np.timedelta64(1, 'D')
+
+
+def hash_valores(serie):
+    """Hash de 64 bits por fila, estable entre procesos (en categóricas, una vez por categoría)"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        hashes = pd.util.hash_array(serie.cat.categories.to_numpy(dtype=object))
+        codigos = serie.cat.codes.to_numpy()
+        return hashes[codigos], codigos >= 0
+    valores = serie.to_numpy(dtype=object)
+    return pd.util.hash_array(valores), ~pd.isna(valores)
+
+
+def registro_y_rango(hashes):
+    """Registro (primeros bits del hash) y rango (ceros a la izquierda del resto + 1)"""
+    bits_resto = 64 - PRECISION_HLL
+    registro = (hashes >> np.uint64(bits_resto)).astype(np.int64)
+    resto = hashes & np.uint64((1 << bits_resto) - 1)
+    # El resto cabe en 52 bits: log2 en float64 es exacto para su bit más alto
+    con_bits = resto > 0
+    rango = np.full(len(hashes), bits_resto + 1, dtype=np.uint8)
+    rango[con_bits] = bits_resto - np.floor(np.log2(resto[con_bits].astype(np.float64))).astype(np.uint8)
+    return registro, rango
+
+
+def estimar_hll(registros):
+    """Estimación HyperLogLog de un boceto denso (con corrección de rango bajo)"""
+    m = len(registros)
+    alfa = 0.7213 / (1 + 1.079 / m)
+    estimacion = alfa * m * m / np.sum(np.exp2(-registros.astype(np.float64)))
+    vacios = int(np.count_nonzero(registros == 0))
+    if estimacion <= 2.5 * m and vacios > 0:
+        estimacion = m * np.log(m / vacios)
+    return int(round(estimacion))
+
+
+def _entradas(claves, rangos):
+    """Entradas dispersas deduplicadas: por clave, el rango máximo (claves ordenadas)"""
+    if len(claves) == 0:
+        return claves, rangos
+    orden = np.argsort(claves, kind='stable')
+    claves, rangos = claves[orden], rangos[orden]
+    inicio = np.flatnonzero(np.r_[True, claves[1:] != claves[:-1]])
+    return claves[inicio], np.maximum.reduceat(rangos, inicio)
+
+
+def _grupos(serie, categorias):
+    """Código de cada fila respecto a unas categorías de referencia (-1 si no está)"""
+    if isinstance(serie.dtype, pd.CategoricalDtype) and serie.cat.categories.equals(categorias):
+        return serie.cat.codes.to_numpy().astype(np.int64)
+    return categorias.get_indexer(serie.to_numpy(dtype=object)).astype(np.int64)
+
+
+class BocetosDiarios:
+    """
+    Bocetos HLL dispersos por día: para cada campo (customer_id, product_id) y nivel
+    (None = total, o una dimensión del cubo), claves ordenadas y rangos.
+    """
+
+    def __init__(self, dia_inicial, niveles, categorias, precio_min, precio_max):
+        self.dia_inicial = dia_inicial
+        # (campo, nivel) -> (claves int64 ordenadas, rangos uint8)
+        self.niveles = niveles
+        # dimensión -> categorías (el código de cada valor es su grupo)
+        self.categorias = categorias
+        self.precio_min = precio_min
+        self.precio_max = precio_max
+
+    @staticmethod
+    def _calcular(transacciones_df, dia_inicial, categorias):
+        dias = transacciones_df['date'].to_numpy().astype('datetime64[D]')
+        indice_dia = ((dias - dia_inicial) // UN_DIA).astype(np.int64)
+        grupos = {dim: _grupos(transacciones_df[dim], categorias[dim]) for dim in DIMENSIONES_CUBO}
+        niveles = {}
+        for campo in CAMPOS_DISTINTOS:
+            hashes, validos = hash_valores(transacciones_df[campo])
+            registro, rango = registro_y_rango(hashes)
+            base = (indice_dia << _BITS_REGISTRO) | registro
+            niveles[(campo, None)] = _entradas(base[validos], rango[validos])
+            for dim in DIMENSIONES_CUBO:
+                # Grupo = código respecto a las categorías de la tabla completa
+                en_grupo = validos & (grupos[dim] >= 0)
+                claves = (grupos[dim] << (_BITS_DIA + _BITS_REGISTRO)) | base
+                niveles[(campo, dim)] = _entradas(claves[en_grupo], rango[en_grupo])
+        return niveles
+
+    @classmethod
+    def construir(cls, transacciones_df):
+        categorias = {dim: transacciones_df[dim].cat.categories for dim in DIMENSIONES_CUBO}
+        if len(transacciones_df) == 0:
+            vacio = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8))
+            niveles = {(campo, nivel): vacio for campo in CAMPOS_DISTINTOS for nivel in [None] + DIMENSIONES_CUBO}
+            return cls(None, niveles, categorias, None, None)
+        dia_inicial = transacciones_df['date'].min().to_datetime64().astype('datetime64[D]')
+        return cls(
+            dia_inicial,
+            cls._calcular(transacciones_df, dia_inicial, categorias),
+            categorias,
+            float(transacciones_df['unit_price'].min()),
+            float(transacciones_df['unit_price'].max())
+        )
+
+    def extender(self, nuevas_df, transacciones_df):
+        """
+        Bocetos con las filas anexadas (de días iguales o posteriores al último): las
+        entradas nuevas se unen con las existentes tomando el rango máximo
+
+        Args:
+            nuevas_df: filas anexadas
+            transacciones_df: tabla completa ya con el anexo (categorías unificadas)
+        """
+        if len(nuevas_df) == 0:
+            return self
+        if self.dia_inicial is None:
+            return BocetosDiarios.construir(transacciones_df)
+        categorias = {dim: transacciones_df[dim].cat.categories for dim in DIMENSIONES_CUBO}
+        # Las categorías unificadas pueden reordenar valores: se recodifican los grupos existentes
+        niveles = {}
+        for (campo, nivel), (claves, rangos) in self.niveles.items():
+            if nivel is not None and not categorias[nivel].equals(self.categorias[nivel]):
+                desplazamiento = _BITS_DIA + _BITS_REGISTRO
+                mapa = categorias[nivel].get_indexer(self.categorias[nivel]).astype(np.int64)
+                claves = (mapa[claves >> desplazamiento] << desplazamiento) | (claves & ((1 << desplazamiento) - 1))
+            niveles[(campo, nivel)] = (claves, rangos)
+
+        nuevas = BocetosDiarios._calcular(nuevas_df, self.dia_inicial, categorias)
+        for clave_nivel, (claves, rangos) in nuevas.items():
+            previas, rangos_previos = niveles[clave_nivel]
+            niveles[clave_nivel] = _entradas(np.concatenate([previas, claves]), np.concatenate([rangos_previos, rangos]))
+        return BocetosDiarios(
+            self.dia_inicial, niveles, categorias,
+            min(self.precio_min, float(nuevas_df['unit_price'].min())),
+            max(self.precio_max, float(nuevas_df['unit_price'].max()))
+        )
+
+    def _responde(self, filtros):
+        """Dimensión seleccionada (None si no hay selección), o False si no se puede responder"""
+        precio_min, precio_max = filtros.get('precio_min'), filtros.get('precio_max')
+        if precio_min is not None and precio_max is not None and self.precio_min is not None:
+            if precio_min > self.precio_min or precio_max < self.precio_max:
+                return False
+        selecciones = [clave for clave in COLUMNAS_FILTRO if filtros.get(clave)]
+        if len(selecciones) > 1:
+            return False
+        return COLUMNAS_FILTRO[selecciones[0]] if selecciones else None
+
+    def _dias(self, filtros):
+        """Índices de día [a, b) del rango de fechas de los filtros"""
+        a, b = 0, 1 << _BITS_DIA
+        if filtros.get('fecha_inicio') is not None:
+            a = int((pd.Timestamp(filtros['fecha_inicio']).to_datetime64().astype('datetime64[D]') - self.dia_inicial) // UN_DIA)
+        if filtros.get('fecha_fin') is not None:
+            b = int((pd.Timestamp(filtros['fecha_fin']).to_datetime64().astype('datetime64[D]') - self.dia_inicial) // UN_DIA) + 1
+        a, b = min(max(a, 0), 1 << _BITS_DIA), min(max(b, 0), 1 << _BITS_DIA)
+        return a, max(a, b)
+
+    def _unir(self, campo, nivel, grupos, a, b):
+        """Boceto denso de la unión de los días [a, b) de los grupos indicados"""
+        registros = np.zeros(2 ** PRECISION_HLL, dtype=np.uint8)
+        claves, rangos = self.niveles[(campo, nivel)]
+        for grupo in grupos:
+            prefijo = int(grupo) << (_BITS_DIA + _BITS_REGISTRO)
+            # Suma y no OR: sin fecha fin, b = 2^_BITS_DIA y el límite es el inicio del grupo siguiente
+            desde = np.searchsorted(claves, prefijo + (a << _BITS_REGISTRO), side='left')
+            hasta = np.searchsorted(claves, prefijo + (b << _BITS_REGISTRO), side='left')
+            registro = (claves[desde:hasta] & ((1 << _BITS_REGISTRO) - 1)).astype(np.int64)
+            np.maximum.at(registros, registro, rangos[desde:hasta])
+        return registros
+
+    def estimar(self, campo, filtros):
+        """
+        Distintos aproximados de un campo para unos filtros (días completos)
+
+        Returns:
+            int, o None si los filtros no se pueden resolver con los bocetos
+        """
+        dimension = self._responde(filtros)
+        if dimension is False:
+            return None
+        if self.dia_inicial is None:
+            return 0
+        a, b = self._dias(filtros)
+        if dimension is None:
+            return estimar_hll(self._unir(campo, None, [0], a, b))
+        grupos = self.categorias[dimension].get_indexer(list(filtros[COLUMNAS_FILTRO_INVERSO[dimension]]))
+        return estimar_hll(self._unir(campo, dimension, grupos[grupos >= 0], a, b))
+
+    def estimar_por_valor(self, campo, dimension, filtros):
+        """
+        Distintos aproximados por valor de una dimensión (filtros sin selección, o con
+        selección solo en esa dimensión)
+
+        Returns:
+            pd.Series valor -> distintos, o None si los filtros no se pueden resolver
+        """
+        seleccionada = self._responde(filtros)
+        if seleccionada is False or seleccionada not in (None, dimension):
+            return None
+        valores = self.categorias[dimension]
+        if seleccionada is not None:
+            valores = valores[valores.isin(list(filtros[COLUMNAS_FILTRO_INVERSO[dimension]]))]
+        if self.dia_inicial is None:
+            return pd.Series(0, index=valores, dtype=np.int64)
+        a, b = self._dias(filtros)
+        grupos = self.categorias[dimension].get_indexer(valores)
+        return pd.Series(
+            [estimar_hll(self._unir(campo, dimension, [g], a, b)) for g in grupos],
+            index=valores, dtype=np.int64
+        )
+
+    def nbytes(self):
+        return sum(claves.nbytes + rangos.nbytes for claves, rangos in self.niveles.values())
+
+    def __repr__(self):
+        return f"BocetosDiarios(niveles={len(self.niveles)}, {self.nbytes() / 1e6:.1f} MB)"
+
+
+def bocetos_diarios(dataset):
+    """Bocetos HLL diarios de la versión actual del dataset (se extienden en los anexos)"""
+    return dataset.derivado(
+        'bocetos_diarios',
+        lambda ds: BocetosDiarios.construir(ds.transacciones),
+        lambda bocetos, nuevas, ds: bocetos.extender(nuevas, ds.transacciones)
+    )
+
+
+def distintos_exactos(serie):
+    """Número exacto de valores distintos (sin nulos); en categóricas, sobre los códigos"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos = serie.cat.codes.to_numpy()
+        return int(np.count_nonzero(np.bincount(codigos[codigos >= 0], minlength=len(serie.cat.categories))))
+    return int(serie.nunique())
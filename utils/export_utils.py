@@ -13,10 +13,17 @@ import plotly.io as pio
 import tempfile
 import os
 
-def create_pdf_report(transactions_df, customers_df, products_df, filters):
+from utils.agregaciones import ContextoAgregacion
+
+def create_pdf_report(transactions_df, customers_df, products_df, filters, contexto=None):
     """
     Genera reporte PDF profesional con gráficos y análisis
+    
+    contexto: ContextoAgregacion de transactions_df ya usado por quien llama (opcional);
+    los distintos del informe son siempre exactos
     """
+    if contexto is None:
+        contexto = ContextoAgregacion(transactions_df, nombre='informe PDF')
     buffer = io.BytesIO()
     
     # Crear documento
@@ -101,10 +108,10 @@ def create_pdf_report(transactions_df, customers_df, products_df, filters):
     # Top 10 países
     story.append(Paragraph("Top 10 Países por Revenue", heading_style))
     
-    country_data = transactions_df.groupby('country').agg({
+    country_data = contexto.agrupar('country', {
         'total_amount_usd': 'sum',
         'transaction_id': 'count'
-    }).reset_index().nlargest(10, 'total_amount_usd')
+    }).nlargest(10, 'total_amount_usd')
     
     country_table_data = [['País', 'Revenue', 'Orders']]
     for _, row in country_data.iterrows():
@@ -131,10 +138,10 @@ def create_pdf_report(transactions_df, customers_df, products_df, filters):
     # Top 10 productos
     story.append(Paragraph("Top 10 Productos por Revenue", heading_style))
     
-    product_data = transactions_df.groupby(['product_id', 'product_name', 'category']).agg({
+    product_data = contexto.agrupar(['product_id', 'product_name', 'category'], {
         'total_amount_usd': 'sum',
         'quantity': 'sum'
-    }).reset_index().nlargest(10, 'total_amount_usd')
+    }).nlargest(10, 'total_amount_usd')
     
     product_table_data = [['Producto', 'Categoría', 'Revenue', 'Units']]
     for _, row in product_data.iterrows():
@@ -163,10 +170,10 @@ def create_pdf_report(transactions_df, customers_df, products_df, filters):
     # Análisis de categorías
     story.append(Paragraph("Revenue por Categoría", heading_style))
     
-    category_data = transactions_df.groupby('category').agg({
+    category_data = contexto.agrupar('category', {
         'total_amount_usd': 'sum',
         'profit': 'sum'
-    }).reset_index().sort_values('total_amount_usd', ascending=False)
+    }).sort_values('total_amount_usd', ascending=False)
     
     category_table_data = [['Categoría', 'Revenue', 'Profit', 'Margin %']]
     for _, row in category_data.iterrows():
@@ -191,16 +198,23 @@ def create_pdf_report(transactions_df, customers_df, products_df, filters):
     
     story.append(category_table)
     
+    contexto.registrar()
+    
     # Construir PDF
     doc.build(story)
     buffer.seek(0)
     
     return buffer
 
-def create_excel_report(transactions_df, customers_df, products_df, filters):
+def create_excel_report(transactions_df, customers_df, products_df, filters, contexto=None):
     """
     Genera reporte Excel con múltiples hojas y análisis
+    
+    contexto: ContextoAgregacion de transactions_df ya usado por quien llama (opcional);
+    los distintos del informe son siempre exactos
     """
+    if contexto is None:
+        contexto = ContextoAgregacion(transactions_df, nombre='informe Excel')
     buffer = io.BytesIO()
     
     with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
@@ -239,35 +253,35 @@ def create_excel_report(transactions_df, customers_df, products_df, filters):
         transactions_export.to_excel(writer, sheet_name='Transacciones', index=False)
         
         # Hoja 3: Análisis por país
-        country_analysis = transactions_df.groupby('country').agg({
+        country_analysis = contexto.agrupar('country', {
             'total_amount_usd': 'sum',
             'transaction_id': 'count',
             'customer_id': 'nunique',
             'profit': 'sum'
-        }).reset_index()
+        })
         country_analysis.columns = ['País', 'Revenue', 'Orders', 'Customers', 'Profit']
         country_analysis = country_analysis.sort_values('Revenue', ascending=False)
         country_analysis.to_excel(writer, sheet_name='Por País', index=False)
         
         # Hoja 4: Análisis por categoría
-        category_analysis = transactions_df.groupby('category').agg({
+        category_analysis = contexto.agrupar('category', {
             'total_amount_usd': 'sum',
             'transaction_id': 'count',
             'quantity': 'sum',
             'profit': 'sum'
-        }).reset_index()
+        })
         category_analysis.columns = ['Categoría', 'Revenue', 'Orders', 'Units Sold', 'Profit']
         category_analysis['Profit Margin %'] = (category_analysis['Profit'] / category_analysis['Revenue'] * 100).round(2)
         category_analysis = category_analysis.sort_values('Revenue', ascending=False)
         category_analysis.to_excel(writer, sheet_name='Por Categoría', index=False)
         
         # Hoja 5: Top productos
-        product_analysis = transactions_df.groupby(['product_id', 'product_name', 'category']).agg({
+        product_analysis = contexto.agrupar(['product_id', 'product_name', 'category'], {
             'total_amount_usd': 'sum',
             'quantity': 'sum',
             'transaction_id': 'count',
             'profit': 'sum'
-        }).reset_index()
+        })
         product_analysis.columns = ['Product ID', 'Product Name', 'Category', 'Revenue', 'Units', 'Orders', 'Profit']
         product_analysis = product_analysis.nlargest(100, 'Revenue')
         product_analysis.to_excel(writer, sheet_name='Top 100 Productos', index=False)
@@ -280,7 +294,7 @@ def create_excel_report(transactions_df, customers_df, products_df, filters):
         top_customers.to_excel(writer, sheet_name='Clientes VIP', index=False)
         
         # Hoja 7: Segmentación RFM
-        rfm_analysis = customers_df.groupby('rfm_segment').agg({
+        rfm_analysis = customers_df.groupby('rfm_segment', observed=True).agg({
             'customer_id': 'count',
             'lifetime_value': 'mean',
             'total_orders': 'mean',
@@ -299,5 +313,6 @@ def create_excel_report(transactions_df, customers_df, products_df, filters):
         time_series.columns = ['Fecha', 'Revenue', 'Orders']
         time_series.to_excel(writer, sheet_name='Serie Temporal', index=False)
     
+    contexto.registrar()
     buffer.seek(0)
     return buffer
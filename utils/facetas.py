@@ -0,0 +1,177 @@
+"""
+Catálogo de facetas del sidebar
+Autor: cmsr92
+
+Opciones de cada filtro (valores distintos ordenados), mapas en cascada país → regiones
+y categoría → subcategorías, y rango de precios. Se calcula una vez por versión del
+dataset a partir de los códigos de las categóricas (sin escanear cadenas) y el sidebar
+lo lee en cada rerun en lugar de recorrer la tabla.
+
+conteos_facetas añade, para la selección actual, cuántos pedidos e ingresos daría cada
+opción de cada faceta sin aplicar el filtro de la propia faceta (búsqueda facetada).
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.filtros import COLUMNAS_FILTRO, mascara_rangos, mascara_valores
+
+
+def _codigos(serie):
+    """Códigos y valores de una columna (categórica o no)"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy(), serie.cat.categories
+    return pd.factorize(serie)
+
+
+def _valores_presentes(serie):
+    """Valores distintos presentes (sin nulos), ordenados"""
+    codigos, valores = _codigos(serie)
+    conteos = np.bincount(codigos[codigos >= 0], minlength=len(valores))
+    return sorted(valores[conteos > 0].tolist())
+
+
+def _mapa_cascada(padre, hijo):
+    """Mapa valor padre -> valores hijo presentes (ordenados), a partir de los pares de códigos"""
+    codigos_padre, valores_padre = _codigos(padre)
+    codigos_hijo, valores_hijo = _codigos(hijo)
+    validos = (codigos_padre >= 0) & (codigos_hijo >= 0)
+    pares = np.unique(codigos_padre[validos].astype(np.int64) * len(valores_hijo) + codigos_hijo[validos])
+
+    mapa = {}
+    for cod_padre, cod_hijo in zip(pares // len(valores_hijo), pares % len(valores_hijo)):
+        mapa.setdefault(valores_padre[cod_padre], []).append(valores_hijo[cod_hijo])
+    return {clave: sorted(hijos) for clave, hijos in mapa.items()}
+
+
+def _unir_mapas(mapa, otro):
+    unido = {clave: list(valores) for clave, valores in mapa.items()}
+    for clave, valores in otro.items():
+        unido[clave] = sorted(set(unido.get(clave, [])) | set(valores))
+    return unido
+
+
+class CatalogoFacetas:
+    """Valores distintos por columna filtrable, mapas en cascada y rango de precios"""
+
+    def __init__(self, valores, regiones_por_pais, subcategorias_por_categoria, precio_min, precio_max):
+        # columna -> lista ordenada de valores presentes
+        self.valores = valores
+        self.regiones_por_pais = regiones_por_pais
+        self.subcategorias_por_categoria = subcategorias_por_categoria
+        self.precio_min = precio_min
+        self.precio_max = precio_max
+
+    @classmethod
+    def construir(cls, transacciones_df):
+        valores = {
+            columna: _valores_presentes(transacciones_df[columna])
+            for columna in COLUMNAS_FILTRO.values() if columna in transacciones_df.columns
+        }
+        hay_filas = len(transacciones_df) > 0
+        return cls(
+            valores,
+            _mapa_cascada(transacciones_df['country'], transacciones_df['region']),
+            _mapa_cascada(transacciones_df['category'], transacciones_df['subcategory']),
+            float(transacciones_df['unit_price'].min()) if hay_filas else None,
+            float(transacciones_df['unit_price'].max()) if hay_filas else None
+        )
+
+    def extender(self, nuevas_df):
+        """Catálogo con los valores de las filas anexadas incorporados"""
+        if len(nuevas_df) == 0:
+            return self
+        otro = CatalogoFacetas.construir(nuevas_df)
+        precios = [p for p in (self.precio_min, self.precio_max, otro.precio_min, otro.precio_max) if p is not None]
+        return CatalogoFacetas(
+            {col: sorted(set(self.valores.get(col, [])) | set(otro.valores[col])) for col in otro.valores},
+            _unir_mapas(self.regiones_por_pais, otro.regiones_por_pais),
+            _unir_mapas(self.subcategorias_por_categoria, otro.subcategorias_por_categoria),
+            min(precios),
+            max(precios)
+        )
+
+    def opciones(self, columna):
+        return self.valores.get(columna, [])
+
+    def regiones(self, paises=None):
+        """Regiones de los países indicados (todas si no se indica ninguno)"""
+        if not paises:
+            return self.opciones('region')
+        return sorted({region for pais in paises for region in self.regiones_por_pais.get(pais, [])})
+
+    def subcategorias(self, categorias=None):
+        """Subcategorías de las categorías indicadas (todas si no se indica ninguna)"""
+        if not categorias:
+            return self.opciones('subcategory')
+        return sorted({sub for cat in categorias for sub in self.subcategorias_por_categoria.get(cat, [])})
+
+
+def catalogo_facetas(dataset):
+    """Catálogo de facetas de la versión actual del dataset (se extiende en los anexos)"""
+    return dataset.derivado(
+        'catalogo_facetas',
+        lambda ds: CatalogoFacetas.construir(ds.transacciones),
+        lambda catalogo, nuevas, ds: catalogo.extender(nuevas)
+    )
+
+
+def conteos_facetas(transacciones_df, filtros, indice=None):
+    """
+    Pedidos e ingresos por valor de cada faceta bajo la selección actual, excluyendo el
+    filtro de la propia faceta: los filtros de rango se aplican siempre y, de los de
+    selección, todos menos el de la columna que se cuenta.
+
+    Se hace en una pasada: cada fila guarda cuántos filtros de selección cumple; las que
+    los cumplen todos cuentan para todas las facetas y las que fallan solo uno, también
+    para la faceta de ese filtro. El recuento es un bincount de los códigos de cada
+    columna sobre esas filas. Con un IndiceFiltros del mismo df, el rango de fechas es un
+    tramo por búsqueda binaria y los bitmaps salen de las listas de posiciones.
+
+    Returns:
+        dict: columna -> {valor: (pedidos, ingresos)} solo con los valores con pedidos
+    """
+    tramo = None
+    if indice is not None and indice.valido_para(transacciones_df):
+        tramo = indice.tramo_fechas(filtros)
+
+    if tramo is not None:
+        inicio, fin = tramo
+        resto = {k: v for k, v in filtros.items() if k not in ('fecha_inicio', 'fecha_fin')}
+        base = mascara_rangos(transacciones_df.iloc[inicio:fin], resto)
+        bitmaps = indice.bitmaps(filtros, inicio, fin)
+    else:
+        inicio, fin = 0, len(transacciones_df)
+        base = mascara_rangos(transacciones_df, filtros)
+        bitmaps = {
+            clave: mascara_valores(transacciones_df[columna], filtros[clave])
+            for clave, columna in COLUMNAS_FILTRO.items() if filtros.get(clave)
+        }
+
+    # Filtros de selección que cumple cada fila del tramo
+    cumplidos = np.zeros(fin - inicio, dtype=np.uint8)
+    for bitmap in bitmaps.values():
+        cumplidos += bitmap
+    todos = base & (cumplidos == len(bitmaps))
+    filas_todos = np.flatnonzero(todos)
+    casi = base & (cumplidos == len(bitmaps) - 1) if bitmaps else None
+
+    importes = transacciones_df['total_amount_usd'].to_numpy()[inicio:fin]
+    conteos = {}
+    for clave, columna in COLUMNAS_FILTRO.items():
+        if columna not in transacciones_df.columns:
+            continue
+        if clave in bitmaps:
+            # Filas que solo fallan el filtro de esta faceta
+            filas = np.flatnonzero(todos | (casi & ~bitmaps[clave]))
+        else:
+            filas = filas_todos
+        codigos, valores = _codigos(transacciones_df[columna])
+        codigos = codigos[inicio:fin][filas]
+        validos = codigos >= 0
+        pedidos = np.bincount(codigos[validos], minlength=len(valores))
+        ingresos = np.bincount(codigos[validos], weights=importes[filas][validos], minlength=len(valores))
+        conteos[columna] = {
+            valores[i]: (int(pedidos[i]), float(ingresos[i])) for i in np.flatnonzero(pedidos)
+        }
+    return conteos
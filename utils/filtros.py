@@ -4,9 +4,23 @@ Autor: cmsr92
 """
 
 import streamlit as st
+import numpy as np
 import pandas as pd
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 
+# Filtros de selección múltiple: clave en el diccionario de filtros -> columna de transacciones
+COLUMNAS_FILTRO = {
+    'paises': 'country',
+    'regiones': 'region',
+    'categorias': 'category',
+    'subcategorias': 'subcategory',
+    'segmentos': 'customer_segment',
+    'metodos_pago': 'payment_method',
+    'dispositivos': 'device_type',
+    'fuentes_trafico': 'traffic_source'
+}
+
 def obtener_rango_fecha_preset(preset):
     """Convierte preset de periodo a rango de fechas"""
     fecha_fin = datetime.now()
@@ -24,12 +38,13 @@ def obtener_rango_fecha_preset(preset):
     
     return fecha_inicio, fecha_fin
 
-def crear_filtros_sidebar(transacciones_df):
+def crear_filtro_periodo():
     """
-    Crea sistema de filtros colapsables en sidebar sin solapamiento
+    Crea la cabecera del panel y el selector de periodo. Va antes que el resto de
+    filtros porque el periodo decide qué particiones de transacciones se cargan.
     
     Returns:
-        dict: Diccionario con todos los filtros aplicados
+        dict: Diccionario con fecha_inicio y fecha_fin
     """
     st.sidebar.markdown("### ⚙️ Panel de Control")
     st.sidebar.markdown("---")
@@ -100,115 +115,183 @@ def crear_filtros_sidebar(transacciones_df):
         duracion_dias = (fecha_fin - fecha_inicio).days
         st.caption(f"📊 Analizando {duracion_dias} días de datos")
     
+    return filtros
+
+def ventana_carga(filtros):
+    """
+    Rango de fechas a cargar para unos filtros: el periodo seleccionado más el periodo
+    anterior de igual duración que usan las comparativas de Resumen y Rendimiento
+    """
+    duracion = pd.Timestamp(filtros['fecha_fin']) - pd.Timestamp(filtros['fecha_inicio'])
+    return pd.Timestamp(filtros['fecha_inicio']) - duracion - pd.Timedelta(days=1), pd.Timestamp(filtros['fecha_fin'])
+
+def _multiselect_faceta(etiqueta, clave, opciones, conteos, ayuda):
+    """
+    Multiselect de una faceta con los pedidos e ingresos de cada opción en su etiqueta.
+    La clave fija la identidad del widget: la selección se conserva aunque cambien los
+    recuentos (y se descartan los valores que ya no están entre las opciones).
+    """
+    por_valor = conteos.get(COLUMNAS_FILTRO[clave]) if conteos is not None else None
+    
+    def formato(valor):
+        if por_valor is None:
+            return str(valor)
+        pedidos, ingresos = por_valor.get(valor, (0, 0.0))
+        return f"{valor} · {pedidos:,} ped. · ${ingresos:,.0f}"
+    
+    clave_widget = f"filtro_{clave}"
+    return st.multiselect(
+        etiqueta,
+        opciones,
+        default=[v for v in st.session_state.get(clave_widget, []) if v in opciones],
+        format_func=formato,
+        key=clave_widget,
+        placeholder="Elige opciones",
+        help=ayuda
+    )
+
+def _seleccion_previa(filtros, precio_min, precio_max):
+    """
+    Filtros con la selección que tienen los widgets al empezar este rerun (session_state):
+    los recuentos de facetas se calculan antes de dibujar los multiselect
+    """
+    previa = dict(filtros)
+    for clave in COLUMNAS_FILTRO:
+        previa[clave] = list(st.session_state.get(f"filtro_{clave}", []))
+    rango = st.session_state.get('filtro_precio')
+    if rango is not None and precio_min is not None and precio_min <= rango[0] <= rango[1] <= precio_max:
+        previa['precio_min'], previa['precio_max'] = rango
+    return previa
+
+def crear_filtros_sidebar(transacciones_df, filtros=None, catalogo=None, contar_facetas=None):
+    """
+    Crea sistema de filtros colapsables en sidebar sin solapamiento
+    
+    Args:
+        transacciones_df: DataFrame de transacciones del que salen las opciones
+        filtros: Resultado de crear_filtro_periodo (si no se pasa, se crea aquí)
+        catalogo: CatalogoFacetas de transacciones_df (utils.facetas); si no se pasa, se calcula
+        contar_facetas: función(filtros) -> conteos por faceta (utils.facetas.conteos_facetas);
+            si se pasa, cada opción muestra sus pedidos e ingresos con la selección actual
+    
+    Returns:
+        dict: Diccionario con todos los filtros aplicados
+    """
+    filtros = dict(filtros) if filtros is not None else crear_filtro_periodo()
+    
+    if catalogo is None:
+        from utils.facetas import CatalogoFacetas
+        catalogo = CatalogoFacetas.construir(transacciones_df)
+    
+    conteos = None
+    if contar_facetas is not None:
+        conteos = contar_facetas(_seleccion_previa(filtros, catalogo.precio_min, catalogo.precio_max))
+    
     with st.sidebar.expander("🌍 GEOGRAFÍA"):
-        paises_disponibles = sorted(transacciones_df['country'].unique().tolist())
-        paises_seleccionados = st.multiselect(
+        paises_disponibles = catalogo.opciones('country')
+        paises_seleccionados = _multiselect_faceta(
             "Países",
+            'paises',
             paises_disponibles,
-            default=[],
-            placeholder="Elige opciones",
-            help="Filtra por uno o más países (deja vacío para todos)"
+            conteos,
+            "Filtra por uno o más países (deja vacío para todos)"
         )
         filtros['paises'] = paises_seleccionados
         
-        if paises_seleccionados:
-            regiones_disponibles = sorted(transacciones_df[
-                transacciones_df['country'].isin(paises_seleccionados)
-            ]['region'].unique().tolist())
-        else:
-            regiones_disponibles = sorted(transacciones_df['region'].unique().tolist())
+        regiones_disponibles = catalogo.regiones(paises_seleccionados)
         
-        regiones_seleccionadas = st.multiselect(
+        regiones_seleccionadas = _multiselect_faceta(
             "Regiones",
+            'regiones',
             regiones_disponibles,
-            default=[],
-            placeholder="Elige opciones",
-            help="Filtra por una o más regiones"
+            conteos,
+            "Filtra por una o más regiones"
         )
         filtros['regiones'] = regiones_seleccionadas
     
     with st.sidebar.expander("📦 PRODUCTOS"):
-        categorias_disponibles = sorted(transacciones_df['category'].unique().tolist())
-        categorias_seleccionadas = st.multiselect(
+        categorias_disponibles = catalogo.opciones('category')
+        categorias_seleccionadas = _multiselect_faceta(
             "Categorías",
+            'categorias',
             categorias_disponibles,
-            default=[],
-            placeholder="Elige opciones",
-            help="Filtra por categorías de productos"
+            conteos,
+            "Filtra por categorías de productos"
         )
         filtros['categorias'] = categorias_seleccionadas
         
-        if categorias_seleccionadas:
-            subcategorias_disponibles = sorted(transacciones_df[
-                transacciones_df['category'].isin(categorias_seleccionadas)
-            ]['subcategory'].unique().tolist())
-        else:
-            subcategorias_disponibles = sorted(transacciones_df['subcategory'].unique().tolist())
+        subcategorias_disponibles = catalogo.subcategorias(categorias_seleccionadas)
         
-        subcategorias_seleccionadas = st.multiselect(
+        subcategorias_seleccionadas = _multiselect_faceta(
             "Subcategorías",
+            'subcategorias',
             subcategorias_disponibles,
-            default=[],
-            placeholder="Elige opciones",
-            help="Filtra por subcategorías específicas"
+            conteos,
+            "Filtra por subcategorías específicas"
         )
         filtros['subcategorias'] = subcategorias_seleccionadas
     
     with st.sidebar.expander("👥 CLIENTES"):
-        segmentos_disponibles = sorted(transacciones_df['customer_segment'].unique().tolist())
-        segmentos_seleccionados = st.multiselect(
+        segmentos_disponibles = catalogo.opciones('customer_segment')
+        segmentos_seleccionados = _multiselect_faceta(
             "Segmentos de Cliente",
+            'segmentos',
             segmentos_disponibles,
-            default=[],
-            placeholder="Elige opciones",
-            help="Filtra por segmento de cliente (VIP, Regular, etc.)"
+            conteos,
+            "Filtra por segmento de cliente (VIP, Regular, etc.)"
         )
         filtros['segmentos'] = segmentos_seleccionados
     
     with st.sidebar.expander("💳 CANAL Y PAGO"):
-        metodos_pago = sorted(transacciones_df['payment_method'].unique().tolist())
-        metodos_seleccionados = st.multiselect(
+        metodos_pago = catalogo.opciones('payment_method')
+        metodos_seleccionados = _multiselect_faceta(
             "Método de Pago",
+            'metodos_pago',
             metodos_pago,
-            default=[],
-            placeholder="Elige opciones",
-            help="Filtra por método de pago utilizado"
+            conteos,
+            "Filtra por método de pago utilizado"
         )
         filtros['metodos_pago'] = metodos_seleccionados
         
-        dispositivos = sorted(transacciones_df['device_type'].unique().tolist())
-        dispositivos_seleccionados = st.multiselect(
+        dispositivos = catalogo.opciones('device_type')
+        dispositivos_seleccionados = _multiselect_faceta(
             "Tipo de Dispositivo",
+            'dispositivos',
             dispositivos,
-            default=[],
-            placeholder="Elige opciones",
-            help="Filtra por dispositivo usado para la compra"
+            conteos,
+            "Filtra por dispositivo usado para la compra"
         )
         filtros['dispositivos'] = dispositivos_seleccionados
         
-        fuentes_trafico = sorted(transacciones_df['traffic_source'].unique().tolist())
-        fuentes_seleccionadas = st.multiselect(
+        fuentes_trafico = catalogo.opciones('traffic_source')
+        fuentes_seleccionadas = _multiselect_faceta(
             "Fuente de Tráfico",
+            'fuentes_trafico',
             fuentes_trafico,
-            default=[],
-            placeholder="Elige opciones",
-            help="Filtra por canal de adquisición"
+            conteos,
+            "Filtra por canal de adquisición"
         )
         filtros['fuentes_trafico'] = fuentes_seleccionadas
     
     with st.sidebar.expander("💰 RANGO DE PRECIOS"):
-        precio_min = float(transacciones_df['unit_price'].min())
-        precio_max = float(transacciones_df['unit_price'].max())
+        precio_min, precio_max = catalogo.precio_min, catalogo.precio_max
         
-        rango_precios = st.slider(
-            "Precio Unitario (USD)",
-            min_value=precio_min,
-            max_value=precio_max,
-            value=(precio_min, precio_max),
-            help="Ajusta el rango de precios unitarios"
-        )
-        filtros['precio_min'] = rango_precios[0]
-        filtros['precio_max'] = rango_precios[1]
+        if precio_min is not None and precio_min < precio_max:
+            rango_precios = st.slider(
+                "Precio Unitario (USD)",
+                min_value=precio_min,
+                max_value=precio_max,
+                value=(precio_min, precio_max),
+                key='filtro_precio',
+                help="Ajusta el rango de precios unitarios"
+            )
+            filtros['precio_min'] = rango_precios[0]
+            filtros['precio_max'] = rango_precios[1]
+        else:
+            # Sin datos en el periodo (o un único precio) no hay rango que ajustar
+            st.caption("Sin rango de precios en el periodo seleccionado")
+            filtros['precio_min'] = None
+            filtros['precio_max'] = None
     
     with st.sidebar.expander("🤖 OPCIONES ML/IA"):
         mostrar_ml = st.checkbox(
@@ -244,52 +327,192 @@ def crear_filtros_sidebar(transacciones_df):
     
     return filtros
 
-def aplicar_filtros(df, filtros):
+@dataclass(frozen=True)
+class FiltroSpec:
     """
-    Aplica filtros al DataFrame
+    Forma canónica y hashable de los filtros que afectan a las filas: fechas normalizadas
+    a días completos, listas ordenadas y sin duplicados, y sin las opciones de
+    visualización (mostrar_ml, mostrar_anomalias). Dos estados del sidebar que
+    seleccionan las mismas filas producen el mismo FiltroSpec.
+    """
+    fecha_inicio: pd.Timestamp = None
+    fecha_fin: pd.Timestamp = None
+    # ((clave, (valores ordenados...)), ...) solo de los filtros de selección activos
+    selecciones: tuple = ()
+    precio_min: float = None
+    precio_max: float = None
+    
+    @classmethod
+    def desde_filtros(cls, filtros):
+        fecha_inicio = filtros.get('fecha_inicio')
+        fecha_fin = filtros.get('fecha_fin')
+        # Días completos: los presets relativos a "ahora" no cambian la clave en cada rerun
+        if fecha_inicio is not None:
+            fecha_inicio = pd.Timestamp(fecha_inicio).floor('D')
+        if fecha_fin is not None:
+            fecha_fin = pd.Timestamp(fecha_fin).floor('D') + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+        
+        selecciones = tuple(
+            (clave, tuple(sorted({str(v) for v in filtros[clave]})))
+            for clave in COLUMNAS_FILTRO if filtros.get(clave)
+        )
+        
+        precio_min, precio_max = filtros.get('precio_min'), filtros.get('precio_max')
+        if precio_min is None or precio_max is None:
+            precio_min = precio_max = None
+        else:
+            precio_min, precio_max = float(precio_min), float(precio_max)
+        
+        return cls(fecha_inicio, fecha_fin, selecciones, precio_min, precio_max)
+    
+    def como_filtros(self):
+        """Diccionario de filtros equivalente (el que entienden aplicar_filtros y filtrar_vista)"""
+        filtros = {
+            'fecha_inicio': self.fecha_inicio,
+            'fecha_fin': self.fecha_fin,
+            'precio_min': self.precio_min,
+            'precio_max': self.precio_max
+        }
+        filtros.update({clave: list(valores) for clave, valores in self.selecciones})
+        return filtros
+
+def mascara_valores(serie, valores):
+    """
+    Máscara booleana de pertenencia a valores. En columnas categóricas se evalúa sobre los
+    códigos: una tabla de consulta por categoría y un único acceso indexado por fila.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        seleccion = serie.cat.categories.get_indexer(list(valores))
+        # Última posición reservada para el código -1 (nulos), que nunca coincide
+        tabla = np.zeros(len(serie.cat.categories) + 1, dtype=bool)
+        tabla[seleccion[seleccion >= 0]] = True
+        return tabla[serie.cat.codes.to_numpy()]
+    return serie.isin(valores).to_numpy()
+
+def mascara_rangos(df, filtros, filas=None):
+    """
+    Máscara de los filtros de rango (fechas y precio), sobre todas las filas o solo sobre
+    las posiciones indicadas
+    
+    Returns:
+        np.ndarray de bool (una posición por fila de df, o por elemento de filas)
+    """
+    mascara = np.ones(len(df) if filas is None else len(filas), dtype=bool)
+    
+    def columna(nombre):
+        valores = df[nombre].to_numpy()
+        return valores if filas is None else valores[filas]
+    
+    if filtros.get('fecha_inicio') is not None or filtros.get('fecha_fin') is not None:
+        fechas = columna('date')
+        if filtros.get('fecha_inicio') is not None:
+            mascara &= fechas >= pd.Timestamp(filtros['fecha_inicio']).to_datetime64()
+        if filtros.get('fecha_fin') is not None:
+            mascara &= fechas <= pd.Timestamp(filtros['fecha_fin']).to_datetime64()
+    
+    if filtros.get('precio_min') is not None and filtros.get('precio_max') is not None:
+        precios = columna('unit_price')
+        mascara &= (precios >= filtros['precio_min']) & (precios <= filtros['precio_max'])
+    
+    return mascara
+
+def mascara_filtros(df, filtros):
+    """
+    Evalúa todos los filtros en una sola máscara booleana, sin crear DataFrames intermedios
     
     Args:
         df: DataFrame de transacciones
-        filtros: Diccionario de filtros
+        filtros: Diccionario de filtros (las claves ausentes o vacías no filtran)
         
     Returns:
-        DataFrame filtrado
+        np.ndarray de bool con una posición por fila de df
     """
-    df_filtrado = df.copy()
+    mascara = mascara_rangos(df, filtros)
     
-    df_filtrado = df_filtrado[
-        (df_filtrado['date'] >= pd.Timestamp(filtros['fecha_inicio'])) & 
-        (df_filtrado['date'] <= pd.Timestamp(filtros['fecha_fin']))
-    ]
+    for clave, columna in COLUMNAS_FILTRO.items():
+        if filtros.get(clave):
+            mascara &= mascara_valores(df[columna], filtros[clave])
     
-    if filtros.get('paises'):
-        df_filtrado = df_filtrado[df_filtrado['country'].isin(filtros['paises'])]
+    return mascara
+
+class VistaFiltrada:
+    """
+    Resultado de filtrar sin copiar: el DataFrame compartido más las posiciones de las filas
+    que cumplen los filtros. Las columnas se materializan solo cuando se piden.
+    """
     
-    if filtros.get('regiones'):
-        df_filtrado = df_filtrado[df_filtrado['region'].isin(filtros['regiones'])]
+    def __init__(self, df, filas):
+        self.df = df
+        self.filas = filas
+        self._columnas = {}
+        # Se llama tras guardar una columna nueva (la caché que contiene la vista reajusta su tamaño)
+        self.al_crecer = None
     
-    if filtros.get('categorias'):
-        df_filtrado = df_filtrado[df_filtrado['category'].isin(filtros['categorias'])]
+    def __len__(self):
+        return len(self.filas)
     
-    if filtros.get('subcategorias'):
-        df_filtrado = df_filtrado[df_filtrado['subcategory'].isin(filtros['subcategorias'])]
+    @property
+    def vacia(self):
+        return len(self.filas) == 0
     
-    if filtros.get('segmentos'):
-        df_filtrado = df_filtrado[df_filtrado['customer_segment'].isin(filtros['segmentos'])]
+    def __getitem__(self, columna):
+        """Columna con solo las filas filtradas (se calcula una vez por vista)"""
+        if columna not in self._columnas:
+            self._columnas[columna] = self.df[columna].take(self.filas)
+            if self.al_crecer is not None:
+                self.al_crecer()
+        return self._columnas[columna]
     
-    if filtros.get('metodos_pago'):
-        df_filtrado = df_filtrado[df_filtrado['payment_method'].isin(filtros['metodos_pago'])]
+    def materializar(self, columnas=None):
+        """DataFrame con las filas filtradas (y solo las columnas indicadas, si se pasan)"""
+        origen = self.df if columnas is None else self.df[columnas]
+        return origen.take(self.filas)
     
-    if filtros.get('dispositivos'):
-        df_filtrado = df_filtrado[df_filtrado['device_type'].isin(filtros['dispositivos'])]
+    def columnas(self, columnas):
+        """DataFrame con las columnas indicadas, reutilizando las ya materializadas en la vista"""
+        return pd.DataFrame({columna: self[columna] for columna in columnas})
     
-    if filtros.get('fuentes_trafico'):
-        df_filtrado = df_filtrado[df_filtrado['traffic_source'].isin(filtros['fuentes_trafico'])]
+    def seleccionar(self, mascara):
+        """Vista con el subconjunto de sus filas que cumple la máscara (alineada con la vista)"""
+        return VistaFiltrada(self.df, self.filas[np.asarray(mascara, dtype=bool)])
+
+def filtrar_vista(df, filtros, indice=None):
+    """
+    Aplica los filtros y devuelve una VistaFiltrada (sin materializar columnas).
     
-    if filtros.get('precio_min') is not None and filtros.get('precio_max') is not None:
-        df_filtrado = df_filtrado[
-            (df_filtrado['unit_price'] >= filtros['precio_min']) & 
-            (df_filtrado['unit_price'] <= filtros['precio_max'])
-        ]
+    Con un IndiceFiltros de este df (utils.indices), el rango de fechas se resuelve por
+    búsqueda binaria (tabla ordenada por fecha), los filtros de selección múltiple uniendo/
+    intersecando listas de posiciones dentro de ese tramo y el precio solo sobre esas filas;
+    sin índice, se evalúa la máscara sobre toda la tabla.
+    """
+    if indice is not None and indice.valido_para(df):
+        tramo = indice.tramo_fechas(filtros)
+        if tramo is not None:
+            # Tabla ordenada por fecha: el rango de fechas es un tramo contiguo y el resto
+            # de predicados solo se evalúa dentro de él
+            inicio, fin = tramo
+            candidatas = indice.filas(filtros, inicio, fin)
+            if candidatas is None:
+                candidatas = np.arange(inicio, fin, dtype=np.int32)
+            resto = {k: v for k, v in filtros.items() if k not in ('fecha_inicio', 'fecha_fin')}
+            return VistaFiltrada(df, candidatas[mascara_rangos(df, resto, candidatas)])
+        
+        candidatas = indice.filas(filtros)
+        if candidatas is not None:
+            return VistaFiltrada(df, candidatas[mascara_rangos(df, filtros, candidatas)])
+    
+    return VistaFiltrada(df, np.flatnonzero(mascara_filtros(df, filtros)))
+
+def aplicar_filtros(df, filtros, indice=None):
+    """
+    Aplica filtros al DataFrame
     
-    return df_filtrado
+    Args:
+        df: DataFrame de transacciones
+        filtros: Diccionario de filtros
+        indice: IndiceFiltros opcional del mismo df
+        
+    Returns:
+        DataFrame filtrado (una única copia de las filas seleccionadas)
+    """
+    return filtrar_vista(df, filtros, indice).materializar()
@@ -0,0 +1,201 @@
+"""
+Índices invertidos para los filtros del sidebar
+Autor: cmsr92
+
+Por cada columna filtrable (países, regiones, categorías...) se guarda, para cada valor
+distinto, la lista ordenada de posiciones de fila donde aparece. Un filtro de selección
+múltiple pasa a ser la unión de unas pocas listas y varios filtros, su intersección:
+el coste depende de las filas seleccionadas, no del tamaño de la tabla.
+
+Como la tabla compartida está ordenada físicamente por fecha, un rango de fechas es un
+tramo contiguo de filas [inicio, fin) que se resuelve con búsqueda binaria; las listas se
+recortan a ese tramo antes de combinarlas, así todo lo demás trabaja solo sobre él.
+
+El índice se construye una vez por versión del dataset (DatasetCompartido.derivado) y
+se extiende con las filas anexadas en los refrescos incrementales.
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.filtros import COLUMNAS_FILTRO
+
+
+def _listas_por_valor(serie, desplazamiento=0):
+    """
+    Listas de posiciones (int32, ordenadas) por valor distinto de la serie.
+
+    Returns:
+        dict: valor -> np.ndarray de posiciones (+ desplazamiento)
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos, valores = serie.cat.codes.to_numpy(), serie.cat.categories
+    else:
+        codigos, valores = pd.factorize(serie)
+
+    # Ordenación estable por código: las posiciones de cada valor quedan ya ordenadas
+    orden = np.argsort(codigos, kind='stable').astype(np.int32) + np.int32(desplazamiento)
+    conteos = np.bincount(codigos[codigos >= 0], minlength=len(valores))
+    inicio = int((codigos < 0).sum())  # los nulos (código -1) quedan al principio
+
+    listas = {}
+    for valor, conteo in zip(valores, conteos):
+        if conteo:
+            listas[valor] = orden[inicio:inicio + conteo]
+        inicio += conteo
+    return listas
+
+
+class IndiceFiltros:
+    """Listas de posiciones por valor para cada columna de COLUMNAS_FILTRO, más las fechas"""
+
+    def __init__(self, listas, num_filas, fechas=None):
+        # columna -> {valor -> posiciones ordenadas}
+        self.listas = listas
+        self.num_filas = num_filas
+        # Fechas de la tabla (vista, sin copia) si está ordenada por fecha; si no, None
+        self.fechas = fechas
+
+    @staticmethod
+    def _fechas_ordenadas(transacciones_df):
+        fechas = transacciones_df['date']
+        return fechas.to_numpy() if fechas.is_monotonic_increasing else None
+
+    @classmethod
+    def construir(cls, transacciones_df):
+        listas = {
+            columna: _listas_por_valor(transacciones_df[columna])
+            for columna in COLUMNAS_FILTRO.values() if columna in transacciones_df.columns
+        }
+        return cls(listas, len(transacciones_df), cls._fechas_ordenadas(transacciones_df))
+
+    def extender(self, nuevas_df, transacciones_df):
+        """
+        Índice nuevo con las filas anexadas al final (posiciones a partir de num_filas)
+
+        Args:
+            nuevas_df: filas anexadas
+            transacciones_df: tabla completa ya con el anexo
+        """
+        listas = {}
+        for columna, por_valor in self.listas.items():
+            por_valor = dict(por_valor)
+            for valor, posiciones in _listas_por_valor(nuevas_df[columna], self.num_filas).items():
+                previas = por_valor.get(valor)
+                por_valor[valor] = posiciones if previas is None else np.concatenate([previas, posiciones])
+            listas[columna] = por_valor
+        return IndiceFiltros(listas, self.num_filas + len(nuevas_df), self._fechas_ordenadas(transacciones_df))
+
+    def valido_para(self, df):
+        return len(df) == self.num_filas and all(col in df.columns for col in self.listas)
+
+    def tramo_fechas(self, filtros):
+        """
+        Tramo contiguo de filas [inicio, fin) del rango de fechas de los filtros, por
+        búsqueda binaria (O(log n)).
+
+        Returns:
+            tuple: (inicio, fin), o None si la tabla no está ordenada por fecha
+        """
+        if self.fechas is None:
+            return None
+        inicio, fin = 0, self.num_filas
+        if filtros.get('fecha_inicio') is not None:
+            inicio = int(np.searchsorted(self.fechas, pd.Timestamp(filtros['fecha_inicio']).to_datetime64(), side='left'))
+        if filtros.get('fecha_fin') is not None:
+            fin = int(np.searchsorted(self.fechas, pd.Timestamp(filtros['fecha_fin']).to_datetime64(), side='right'))
+        return inicio, max(inicio, fin)
+
+    def filas(self, filtros, inicio=0, fin=None):
+        """
+        Posiciones que cumplen los filtros de selección múltiple: unión de las listas de los
+        valores elegidos en cada columna e intersección entre columnas (la columna más
+        selectiva da las candidatas; el resto se comprueba con un bitmap de pertenencia).
+
+        Args:
+            filtros: Diccionario de filtros
+            inicio, fin: tramo de filas al que se limita el resultado (por defecto, toda la tabla)
+
+        Returns:
+            np.ndarray ordenado de posiciones, o None si no hay filtros de selección activos
+        """
+        fin = self.num_filas if fin is None else fin
+        selecciones = []
+        for clave, columna in COLUMNAS_FILTRO.items():
+            valores = filtros.get(clave)
+            if not valores or columna not in self.listas:
+                continue
+            por_valor = self.listas[columna]
+            partes = [self._recortar(por_valor[v], inicio, fin) for v in valores if v in por_valor]
+            partes = [p for p in partes if len(p)]
+            if not partes:
+                return np.empty(0, dtype=np.int32)
+            selecciones.append((sum(len(p) for p in partes), partes))
+
+        if not selecciones:
+            return None
+
+        # Se parte de la columna más selectiva y las demás solo descartan candidatas
+        selecciones.sort(key=lambda s: s[0])
+        total, partes = selecciones[0]
+        if len(partes) == 1:
+            filas = partes[0]
+        elif total > (fin - inicio) // 8:
+            # Unión grande: marcar en un bitmap es más barato que ordenar
+            filas = (np.flatnonzero(self._bitmap(partes, inicio, fin)) + inicio).astype(np.int32)
+        else:
+            # Las listas de valores distintos son disjuntas: basta concatenar y ordenar
+            filas = np.sort(np.concatenate(partes))
+
+        for _, partes in selecciones[1:]:
+            if len(filas) == 0:
+                break
+            filas = filas[self._bitmap(partes, inicio, fin)[filas - inicio]]
+        return filas
+
+    def bitmaps(self, filtros, inicio=0, fin=None):
+        """
+        Bitmap del tramo [inicio, fin) por cada filtro de selección múltiple activo
+        (sin combinarlos: el recuento de facetas necesita cada uno por separado).
+
+        Returns:
+            dict: clave del filtro -> np.ndarray de bool de longitud fin - inicio
+        """
+        fin = self.num_filas if fin is None else fin
+        bitmaps = {}
+        for clave, columna in COLUMNAS_FILTRO.items():
+            valores = filtros.get(clave)
+            if not valores or columna not in self.listas:
+                continue
+            por_valor = self.listas[columna]
+            partes = [self._recortar(por_valor[v], inicio, fin) for v in valores if v in por_valor]
+            bitmaps[clave] = self._bitmap(partes, inicio, fin)
+        return bitmaps
+
+    @staticmethod
+    def _recortar(posiciones, inicio, fin):
+        """Parte de una lista ordenada dentro del tramo [inicio, fin)"""
+        return posiciones[np.searchsorted(posiciones, inicio):np.searchsorted(posiciones, fin)]
+
+    @staticmethod
+    def _bitmap(partes, inicio, fin):
+        """Bitmap del tramo (un bool por fila) con las posiciones de las listas marcadas"""
+        marca = np.zeros(fin - inicio, dtype=bool)
+        for posiciones in partes:
+            marca[posiciones - inicio] = True
+        return marca
+
+    def nbytes(self):
+        return sum(p.nbytes for por_valor in self.listas.values() for p in por_valor.values())
+
+    def __repr__(self):
+        return f"IndiceFiltros(filas={self.num_filas:,}, columnas={len(self.listas)}, {self.nbytes() / 1e6:.1f} MB)"
+
+
+def indice_filtros(dataset):
+    """Índice de filtros de la versión actual del dataset (se calcula una vez y se extiende en los anexos)"""
+    return dataset.derivado(
+        'indice_filtros',
+        lambda ds: IndiceFiltros.construir(ds.transacciones),
+        lambda indice, nuevas, ds: indice.extender(nuevas, ds.transacciones)
+    )
@@ -0,0 +1,157 @@
+"""
+Job de reentrenamiento de modelos
+Autor: cmsr92
+
+Entrena con los datos actuales los modelos que el dashboard y la API solo cargan del
+registro (utils.registro_modelos) y publica una versión nueva de cada uno. Se ejecuta
+fuera de las peticiones, como el paso de build del snapshot (cron o despliegue):
+
+    python -m utils.reentrenar_modelos                    # todos los grupos
+    python -m utils.reentrenar_modelos anomalias api      # solo los indicados
+    python -m utils.reentrenar_modelos segmentacion --desde 2024-01-01 --hasta 2024-06-30
+
+Los procesos en marcha usan la versión nueva en cuanto cargan una versión del dataset
+(tras un refresco), o en la siguiente petición si aún no tenían ninguna; las peticiones
+a la API, en la siguiente carga del registro.
+"""
+
+import argparse
+import logging
+
+from utils.registro_modelos import obtener_registro
+
+logger = logging.getLogger(__name__)
+
+GRUPOS_MODELOS = ['anomalias', 'segmentacion', 'api']
+
+# Valores que aceptan los endpoints de ML de la API: el job entrena un modelo por cada uno
+# y la API rechaza (422) los demás, así ningún valor válido queda sin modelo
+METRICAS_FORECAST = ('revenue', 'orders')
+N_CLUSTERS_API = tuple(range(3, 11))
+CONTAMINACION_API = tuple(round(0.01 * i, 2) for i in range(1, 11))
+
+# Segmentadores RFM: 4 segmentos del dashboard y los de /clustering/customers
+N_CLUSTERS_SEGMENTACION = tuple(sorted({4, *N_CLUSTERS_API}))
+
+
+def _registrar(tipo, parametros, version, entrenar):
+    """Entrena, registra e informa; un fallo no detiene el resto del job"""
+    try:
+        modelo, metricas = entrenar()
+        metadatos = obtener_registro().guardar(tipo, parametros, version, modelo, metricas)
+        print(f"✅ {tipo} {parametros}: versión {metadatos['version']}")
+        return True
+    except Exception as e:
+        logger.warning("No se pudo reentrenar %s %s: %s", tipo, parametros, e)
+        print(f"❌ {tipo} {parametros}: {e}")
+        return False
+
+
+def reentrenar_anomalias(dataset):
+    from utils.anomalias import ModeloAnomalias, TIPO_MODELO_ANOMALIAS, PARAMETROS_ANOMALIAS
+
+    return [_registrar(
+        TIPO_MODELO_ANOMALIAS, PARAMETROS_ANOMALIAS, dataset.version,
+        lambda: ModeloAnomalias.entrenar(dataset.transacciones)
+    )]
+
+
+def _semillas_previas(tipo, parametros):
+    """Centroides de la versión registrada más reciente (None si no hay o no los guardó)"""
+    cargado = obtener_registro().cargar(tipo, parametros)
+    return cargado[0].get('centroides') if cargado is not None else None
+
+
+def reentrenar_segmentacion(dataset):
+    from utils.rfm import rfm_clientes
+    from utils.segmentacion import (
+        TIPO_MODELO_SEGMENTACION, entrenar_segmentador, parametros_segmentacion, periodo_dataset
+    )
+
+    rfm = rfm_clientes(dataset.transacciones, dataset.clientes)
+    resultados = []
+    for n_clusters in N_CLUSTERS_SEGMENTACION:
+        parametros = parametros_segmentacion(n_clusters)
+        semillas = _semillas_previas(TIPO_MODELO_SEGMENTACION, parametros)
+        resultados.append(_registrar(
+            TIPO_MODELO_SEGMENTACION, parametros, dataset.version,
+            lambda: entrenar_segmentador(rfm, n_clusters, semillas=semillas, periodo=periodo_dataset(dataset))
+        ))
+    return resultados
+
+
+def reentrenar_api(version):
+    from api.ml_endpoints import (
+        TIPO_MODELO_FORECAST, TIPO_MODELO_CLUSTERS, TIPO_MODELO_ANOMALIAS_DIARIAS,
+        entrenar_forecast, entrenar_clusters_clientes, entrenar_anomalias_diarias
+    )
+
+    resultados = [
+        _registrar(TIPO_MODELO_FORECAST, {'metric': metric}, version, lambda metric=metric: entrenar_forecast(metric))
+        for metric in METRICAS_FORECAST
+    ]
+    resultados += [
+        _registrar(TIPO_MODELO_CLUSTERS, {'n_clusters': n}, version, lambda n=n: entrenar_clusters_clientes(n))
+        for n in N_CLUSTERS_API
+    ]
+    resultados += [
+        _registrar(TIPO_MODELO_ANOMALIAS_DIARIAS, {'contamination': c}, version, lambda c=c: entrenar_anomalias_diarias(c))
+        for c in CONTAMINACION_API
+    ]
+    return resultados
+
+
+def reentrenar(grupos=None, desde=None, hasta=None):
+    """
+    Reentrena los grupos indicados (todos por defecto) con el histórico completo o con los
+    meses de [desde, hasta] (los dos extremos o ninguno). El segmentador RFM guarda el
+    segmento de cada cliente en ese periodo y se aplica igual a cualquier periodo cargado
+    en el dashboard.
+
+    Raises:
+        ValueError: si solo se indica uno de los extremos
+
+    Returns:
+        bool: True si todos los modelos se registraron
+    """
+    from utils.dataset import AlmacenDataset
+    from utils.snapshot import huella_fuente
+
+    if (desde is None) != (hasta is None):
+        raise ValueError("desde y hasta se indican juntos (sin ninguno, histórico completo)")
+    grupos = grupos or GRUPOS_MODELOS
+    resultados = []
+
+    dataset = None
+    if 'anomalias' in grupos or 'segmentacion' in grupos:
+        dataset = AlmacenDataset().asegurar_periodo(desde, hasta)
+        if dataset is None:
+            print("❌ No se pudo cargar el dataset")
+            return False
+        if 'anomalias' in grupos:
+            resultados += reentrenar_anomalias(dataset)
+        if 'segmentacion' in grupos:
+            resultados += reentrenar_segmentacion(dataset)
+
+    if 'api' in grupos:
+        huella = huella_fuente()
+        version = dataset.version if dataset is not None else (huella[:12] if huella else None)
+        resultados += reentrenar_api(version)
+
+    return all(resultados)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reentrena los modelos y los publica en el registro")
+    parser.add_argument('grupos', nargs='*', choices=GRUPOS_MODELOS, help="Grupos de modelos (por defecto, todos)")
+    parser.add_argument('--desde', help="Primer día del periodo de entrenamiento (AAAA-MM-DD)")
+    parser.add_argument('--hasta', help="Último día del periodo de entrenamiento (AAAA-MM-DD)")
+    argumentos = parser.parse_args()
+    # Un extremo solo dejaría el periodo abierto y se entrenaría con todo lo cargado
+    if (argumentos.desde is None) != (argumentos.hasta is None):
+        parser.error("--desde y --hasta se indican juntos (sin ninguno, histórico completo)")
+    raise SystemExit(0 if reentrenar(argumentos.grupos, argumentos.desde, argumentos.hasta) else 1)
+
+
+if __name__ == '__main__':
+    main()
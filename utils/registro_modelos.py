@@ -0,0 +1,252 @@
+"""
+Registro persistente de modelos
+Autor: cmsr92
+
+Artefactos entrenados en disco, versionados por tipo de modelo, parámetros y versión del
+dataset con el que se entrenaron, junto a sus metadatos (fecha, métricas de
+entrenamiento, versiones de librerías). El dashboard y la API cargan de aquí y solo hacen
+inferencia; el entrenamiento lo hace un job aparte (python -m utils.reentrenar_modelos).
+Un modelo que el job aún no ha publicado es un estado explícito (ModeloNoEntrenado o
+None), nunca un entrenamiento dentro de la petición.
+
+Estructura: DIRECTORIO_MODELOS/<tipo>/<huella de parámetros>/<versión>/
+    modelo.joblib   artefacto
+    metadatos.json  tipo, parámetros, version_dataset, creado_en, métricas...
+Cada versión se escribe en un directorio temporal y se publica con os.replace.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_MODELOS = os.getenv('REGISTRO_MODELOS_DIR', 'data/modelos')
+
+# Versiones que se conservan por (tipo, parámetros) al registrar una nueva
+VERSIONES_CONSERVADAS = 3
+
+
+def huella_parametros(parametros):
+    """Huella estable de un dict de parámetros (orden de claves indiferente)"""
+    texto = json.dumps(parametros or {}, sort_keys=True, default=str)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()[:12]
+
+
+def _versiones_librerias():
+    versiones = {}
+    for modulo in ('sklearn', 'numpy', 'pandas', 'prophet'):
+        try:
+            versiones[modulo] = __import__(modulo).__version__
+        except Exception:
+            continue
+    return versiones
+
+
+class RegistroModelos:
+    """
+    Registro de modelos sobre un directorio. Los artefactos cargados se guardan en memoria
+    por ruta: pedir el mismo modelo en cada petición no vuelve a leer el disco.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_MODELOS):
+        self.directorio = directorio
+        self._cargados = {}
+        self._lock = threading.Lock()
+
+    def _ruta(self, tipo, parametros):
+        return os.path.join(self.directorio, tipo, huella_parametros(parametros))
+
+    def guardar(self, tipo, parametros, version_dataset, modelo, metricas=None):
+        """
+        Registra una versión nueva del modelo
+
+        Args:
+            tipo: nombre del tipo de modelo (p. ej. 'isolation_forest_transacciones')
+            parametros: dict de hiperparámetros (forma parte de la clave)
+            version_dataset: versión del dataset de entrenamiento
+            modelo: artefacto serializable con joblib
+            metricas: dict de métricas de entrenamiento
+
+        Returns:
+            dict de metadatos de la versión registrada
+        """
+        import joblib
+
+        creado_en = datetime.now()
+        # Microsegundos: dos versiones del mismo segundo (un job rápido) siguen ordenadas por creación
+        version = f"{creado_en:%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:6]}"
+        metadatos = {
+            'tipo': tipo,
+            'parametros': parametros or {},
+            'version_dataset': version_dataset,
+            'version': version,
+            'creado_en': creado_en.isoformat(timespec='seconds'),
+            'metricas': metricas or {},
+            'librerias': _versiones_librerias()
+        }
+
+        base = self._ruta(tipo, parametros)
+        ruta = os.path.join(base, version)
+        ruta_tmp = f"{ruta}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(ruta_tmp, exist_ok=True)
+            joblib.dump(modelo, os.path.join(ruta_tmp, 'modelo.joblib'))
+            with open(os.path.join(ruta_tmp, 'metadatos.json'), 'w', encoding='utf-8') as f:
+                json.dump(metadatos, f, ensure_ascii=False, indent=2, default=str)
+            os.replace(ruta_tmp, ruta)
+        except Exception:
+            shutil.rmtree(ruta_tmp, ignore_errors=True)
+            raise
+
+        metadatos['ruta'] = ruta
+        with self._lock:
+            self._cargados[ruta] = (modelo, metadatos)
+        self._limpiar(base)
+        logger.info("Modelo registrado: %s %s (dataset %s)", tipo, version, version_dataset)
+        return metadatos
+
+    def _leer_metadatos(self, ruta):
+        try:
+            with open(os.path.join(ruta, 'metadatos.json'), encoding='utf-8') as f:
+                metadatos = json.load(f)
+        except (OSError, ValueError):
+            return None
+        metadatos['ruta'] = ruta
+        return metadatos
+
+    def versiones(self, tipo, parametros):
+        """Metadatos de las versiones registradas de (tipo, parámetros), de la más reciente a la más antigua"""
+        base = self._ruta(tipo, parametros)
+        if not os.path.isdir(base):
+            return []
+        versiones = [
+            self._leer_metadatos(os.path.join(base, nombre))
+            for nombre in os.listdir(base) if '.tmp-' not in nombre
+        ]
+        return sorted((m for m in versiones if m is not None), key=lambda m: m['version'], reverse=True)
+
+    def cargar(self, tipo, parametros, version_dataset=None):
+        """
+        Artefacto registrado para (tipo, parámetros): el entrenado con version_dataset si
+        existe y, si no (o sin version_dataset), el más reciente
+
+        Returns:
+            tuple (modelo, metadatos), o None si no hay ninguno
+        """
+        import joblib
+
+        versiones = self.versiones(tipo, parametros)
+        if not versiones:
+            return None
+        exactas = [m for m in versiones if version_dataset is not None and m['version_dataset'] == version_dataset]
+        metadatos = (exactas or versiones)[0]
+
+        ruta = metadatos['ruta']
+        with self._lock:
+            if ruta in self._cargados:
+                return self._cargados[ruta]
+        try:
+            modelo = joblib.load(os.path.join(ruta, 'modelo.joblib'))
+        except Exception as e:
+            logger.warning("No se pudo cargar el modelo %s: %s", ruta, e)
+            return None
+        with self._lock:
+            self._cargados[ruta] = (modelo, metadatos)
+        return modelo, metadatos
+
+    def listar(self, tipo=None):
+        """Metadatos de todas las versiones registradas (de un tipo, si se indica)"""
+        if not os.path.isdir(self.directorio):
+            return []
+        tipos = [tipo] if tipo else sorted(os.listdir(self.directorio))
+        resultado = []
+        for nombre_tipo in tipos:
+            ruta_tipo = os.path.join(self.directorio, nombre_tipo)
+            if not os.path.isdir(ruta_tipo):
+                continue
+            for huella in os.listdir(ruta_tipo):
+                for nombre in os.listdir(os.path.join(ruta_tipo, huella)):
+                    if '.tmp-' not in nombre:
+                        metadatos = self._leer_metadatos(os.path.join(ruta_tipo, huella, nombre))
+                        if metadatos is not None:
+                            resultado.append(metadatos)
+        return resultado
+
+    def _limpiar(self, base):
+        """Elimina las versiones más antiguas por encima de VERSIONES_CONSERVADAS"""
+        nombres = sorted((n for n in os.listdir(base) if '.tmp-' not in n), reverse=True)
+        for nombre in nombres[VERSIONES_CONSERVADAS:]:
+            ruta = os.path.join(base, nombre)
+            shutil.rmtree(ruta, ignore_errors=True)
+            with self._lock:
+                self._cargados.pop(ruta, None)
+
+
+_registro = None
+_registro_lock = threading.Lock()
+
+
+def obtener_registro():
+    """Registro de modelos del proceso (uno por directorio configurado)"""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroModelos()
+        return _registro
+
+
+class ModeloNoEntrenado(LookupError):
+    """El registro aún no tiene una versión del modelo pedido (falta ejecutar el job)"""
+
+    def __init__(self, tipo, parametros):
+        self.tipo = tipo
+        self.parametros = parametros
+        super().__init__(
+            f"Modelo {tipo} {parametros} aún no entrenado: ejecuta python -m utils.reentrenar_modelos"
+        )
+
+
+def cargar_modelo(tipo, parametros, version_dataset=None):
+    """
+    Modelo registrado para (tipo, parámetros), el de version_dataset si existe
+
+    Returns:
+        tuple (modelo, metadatos)
+
+    Raises:
+        ModeloNoEntrenado: si el registro aún no tiene ninguna versión
+    """
+    cargado = obtener_registro().cargar(tipo, parametros, version_dataset)
+    if cargado is None:
+        raise ModeloNoEntrenado(tipo, parametros)
+    return cargado
+
+
+def derivado_registrado(dataset, nombre, tipo, parametros, constructor, extensor=None):
+    """
+    Derivado del dataset (DatasetCompartido.derivado) construido a partir del modelo
+    registrado: constructor(modelo, metadatos, ds). Mientras el registro no tenga el
+    modelo el derivado es None, y cada llamada vuelve a mirar el registro: en cuanto el
+    job publica una versión, se construye sin esperar a otra versión del dataset.
+
+    Args:
+        extensor: función(valor, nuevas_df, ds) para los anexos (como en derivado)
+    """
+    def construir(ds):
+        cargado = obtener_registro().cargar(tipo, parametros, ds.version)
+        return None if cargado is None else constructor(cargado[0], cargado[1], ds)
+
+    def extender(valor, nuevas_df, ds):
+        return None if valor is None else extensor(valor, nuevas_df, ds)
+
+    valor = dataset.derivado(nombre, construir, extender if extensor is not None else None)
+    if valor is None and obtener_registro().versiones(tipo, parametros):
+        dataset.descartar_derivado(nombre)
+        valor = dataset.derivado(nombre, construir, extender if extensor is not None else None)
+    return valor
@@ -0,0 +1,97 @@
+"""
+Motor RFM vectorizado
+Autor: cmsr92
+
+Recencia, frecuencia y valor monetario por cliente en una sola pasada sobre los códigos
+enteros de customer_id (categórico en el dataset compartido): bincount para el número de
+compras y el importe, maximum.at para la última compra. Sin lambdas por cliente ni merge
+por cadenas: los atributos del cliente (lifetime_value...) se unen por código.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Variables de la segmentación de clientes (K-Means del dashboard y de la API)
+CARACTERISTICAS_RFM = ['recency', 'frequency', 'monetary', 'lifetime_value']
+
+UN_DIA = np.timedelta64(1, 'D')
+
+
+def _codigos_clientes(clientes_ids):
+    """Códigos enteros y categorías de customer_id (se factoriza si no es categórico)"""
+    if isinstance(clientes_ids.dtype, pd.CategoricalDtype):
+        return clientes_ids.cat.codes.to_numpy().astype(np.int64), clientes_ids.cat.categories
+    codigos, categorias = pd.factorize(clientes_ids)
+    return codigos.astype(np.int64), pd.Index(categorias)
+
+
+def calcular_rfm(clientes_ids, fechas, importes, atributos=None, fecha_analisis=None):
+    """
+    RFM por cliente de unas transacciones
+
+    Args:
+        clientes_ids: Series customer_id de las transacciones
+        fechas: Series date
+        importes: Series total_amount_usd
+        atributos: DataFrame de clientes con customer_id y las columnas a añadir (opcional)
+        fecha_analisis: referencia de la recencia (por defecto, la última compra de las transacciones)
+
+    Returns:
+        DataFrame con customer_id, recency (días), frequency, monetary y las columnas de
+        atributos; una fila por cliente con compras
+    """
+    codigos, categorias = _codigos_clientes(clientes_ids)
+    validos = codigos >= 0
+    codigos = codigos[validos]
+    instantes = fechas.to_numpy().astype('datetime64[ns]')[validos]
+    num_clientes = len(categorias)
+
+    frecuencia = np.bincount(codigos, minlength=num_clientes)
+    monetario = np.bincount(codigos, weights=importes.to_numpy(dtype=np.float64)[validos], minlength=num_clientes)
+    ultima = np.full(num_clientes, np.iinfo(np.int64).min, dtype=np.int64)
+    np.maximum.at(ultima, codigos, instantes.view(np.int64))
+
+    presentes = np.flatnonzero(frecuencia)
+    ultima = ultima[presentes].view('datetime64[ns]')
+    if fecha_analisis is None:
+        fecha_analisis = ultima.max() if len(presentes) else np.datetime64('NaT', 'ns')
+    else:
+        fecha_analisis = pd.Timestamp(fecha_analisis).to_datetime64().astype('datetime64[ns]')
+
+    if isinstance(clientes_ids.dtype, pd.CategoricalDtype):
+        ids = pd.Categorical.from_codes(presentes, dtype=clientes_ids.dtype)
+    else:
+        ids = categorias[presentes]
+    rfm = pd.DataFrame({
+        'customer_id': ids,
+        'recency': ((fecha_analisis - ultima) // UN_DIA).astype(np.int64),
+        'frequency': frecuencia[presentes],
+        'monetary': monetario[presentes]
+    })
+
+    if atributos is not None:
+        # Posición de cada cliente de la tabla en las categorías: la unión es un reindex por código
+        posiciones = categorias.get_indexer(atributos['customer_id'])
+        conocidos = posiciones >= 0
+        columnas = [col for col in atributos.columns if col != 'customer_id']
+        por_codigo = atributos.loc[conocidos, columnas].set_axis(posiciones[conocidos])
+        por_codigo = por_codigo[~por_codigo.index.duplicated()]
+        for col, valores in por_codigo.reindex(presentes).items():
+            rfm[col] = valores.to_numpy()
+    return rfm
+
+
+def rfm_clientes(transacciones, clientes, fecha_analisis=None):
+    """
+    RFM con lifetime_value de unas transacciones (DataFrame o VistaFiltrada) y la tabla
+    de clientes del dataset (TablaDiferida o DataFrame)
+    """
+    atributos = clientes.columnas(['customer_id', 'lifetime_value']) if hasattr(clientes, 'columnas') \
+        else clientes[['customer_id', 'lifetime_value']]
+    return calcular_rfm(
+        transacciones['customer_id'],
+        transacciones['date'],
+        transacciones['total_amount_usd'],
+        atributos,
+        fecha_analisis
+    )
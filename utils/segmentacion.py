@@ -0,0 +1,196 @@
+"""
+Servicio de segmentación de clientes (K-Means sobre RFM)
+Autor: cmsr92
+
+El ajuste (StandardScaler + K-Means, MiniBatchKMeans con muchos clientes) lo hace el job
+de reentrenamiento sobre el RFM de todo el histórico y lo publica en el registro de
+modelos (utils.registro_modelos), junto al segmento de cada cliente. Cada reentrenamiento
+parte de los centroides de la versión registrada anterior (una sola inicialización) en
+lugar de reiniciar.
+
+El dashboard y la API no ajustan: para unos filtros, cada cliente de la vista recibe su
+segmento registrado, sea cual sea el periodo cargado. Los clientes posteriores al
+entrenamiento se asignan al centroide más cercano según su RFM en el dataset cargado.
+
+Antes el dashboard ajustaba un K-Means por filtro (cacheado por spec, con MiniBatch y
+arranque desde los centroides anteriores). Ese ajuste desapareció a propósito al pasar
+al registro, donde las peticiones solo hacen inferencia: un ajuste por filtro daba
+segmentos distintos al mismo cliente según la selección, y su primer cálculo volvía a
+entrenar en la petición. Lo que aportaba sigue aquí, en otro sitio:
+- caché por filtros: utils.servicio_modelos.obtener_segmentacion guarda la asignación
+  por (spec, n_clusters, modo, versión del modelo) en la caché de vistas;
+- MiniBatchKMeans con muchos clientes y arranque desde los centroides de la versión
+  registrada anterior: en el job (entrenar_segmentador);
+- etiquetas estables: la ordenación por valor de ajustar_segmentacion.
+
+Las etiquetas son estables: los clusters se ordenan por una puntuación de valor del
+centroide (menos recencia, más frecuencia, gasto y LTV), así el 0 es siempre el segmento
+de más valor ('Premium') aunque K-Means los numere distinto en cada ajuste.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.rfm import CARACTERISTICAS_RFM
+from utils.registro_modelos import derivado_registrado
+
+# Nombres de los segmentos del dashboard, de más a menos valor
+NOMBRES_SEGMENTOS = ['Premium', 'Activo', 'En Riesgo', 'Inactivo']
+
+# A partir de cuántos clientes el modo 'auto' usa MiniBatchKMeans
+UMBRAL_MINIBATCH = int(os.getenv('SEGMENTACION_UMBRAL_MINIBATCH', '50000'))
+TAMANO_LOTE_MINIBATCH = 4096
+
+# Signo de cada característica en la puntuación de valor que ordena los clusters
+PESOS_VALOR = {'recency': -1.0, 'frequency': 1.0, 'monetary': 1.0, 'lifetime_value': 1.0}
+
+
+def _modelo(n_clusters, modo, num_clientes, semillas, random_state):
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    if modo == 'auto':
+        modo = 'minibatch' if num_clientes >= UMBRAL_MINIBATCH else 'completo'
+    # Con centroides previos basta una inicialización: se parte de ellos
+    init, n_init = (semillas, 1) if semillas is not None else ('k-means++', 10 if modo == 'completo' else 3)
+    if modo == 'minibatch':
+        return modo, MiniBatchKMeans(
+            n_clusters=n_clusters, init=init, n_init=n_init, batch_size=TAMANO_LOTE_MINIBATCH,
+            random_state=random_state
+        )
+    return modo, KMeans(n_clusters=n_clusters, init=init, n_init=n_init, random_state=random_state)
+
+
+def ajustar_segmentacion(caracteristicas, n_clusters=4, modo='auto', semillas=None, random_state=42):
+    """
+    Ajusta StandardScaler + K-Means y numera los clusters por valor
+
+    Args:
+        caracteristicas: DataFrame numérico (una fila por cliente)
+        n_clusters: número de segmentos
+        modo: 'completo' (KMeans), 'minibatch' (MiniBatchKMeans) o 'auto' (según UMBRAL_MINIBATCH)
+        semillas: centroides previos en unidades originales (DataFrame) para arrancar de ellos
+        random_state: semilla del ajuste
+
+    Returns:
+        dict: etiquetas (array, 0 = más valor), centroides (DataFrame en unidades originales,
+        en el orden de las etiquetas), modo, inercia, calentado (si partió de semillas) y
+        artefacto (escalador, modelo y renumeración, para segmentar otros clientes)
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    columnas = list(caracteristicas.columns)
+    escalador = StandardScaler()
+    escaladas = escalador.fit_transform(caracteristicas.to_numpy(dtype=np.float64))
+
+    calentado = semillas is not None and list(semillas.columns) == columnas and len(semillas) == n_clusters
+    inicio = escalador.transform(semillas.to_numpy(dtype=np.float64)) if calentado else None
+    modo, modelo = _modelo(n_clusters, modo, len(escaladas), inicio, random_state)
+    etiquetas = modelo.fit_predict(escaladas)
+
+    # Renumerar por puntuación de valor del centroide (en unidades estandarizadas)
+    pesos = np.array([PESOS_VALOR.get(col, 0.0) for col in columnas])
+    orden = np.argsort(-(modelo.cluster_centers_ @ pesos), kind='stable')
+    nueva_etiqueta = np.empty(n_clusters, dtype=np.int64)
+    nueva_etiqueta[orden] = np.arange(n_clusters)
+
+    centroides = pd.DataFrame(escalador.inverse_transform(modelo.cluster_centers_[orden]), columns=columnas)
+    return {
+        'etiquetas': nueva_etiqueta[etiquetas],
+        'centroides': centroides,
+        'modo': modo,
+        'inercia': float(modelo.inertia_),
+        'calentado': calentado,
+        # Lo necesario para segmentar otros clientes sin reajustar (base del artefacto del registro)
+        'artefacto': {'columnas': columnas, 'escalador': escalador, 'modelo': modelo, 'nueva_etiqueta': nueva_etiqueta}
+    }
+
+
+def segmentos_registrados(artefacto, clientes_ids, caracteristicas_nuevos):
+    """
+    Segmentación de unos clientes con un segmentador registrado, sin reajustar
+
+    Args:
+        artefacto: artefacto del registro (entrenar_segmentador)
+        clientes_ids: customer_id de los clientes a segmentar
+        caracteristicas_nuevos: función(posiciones) -> DataFrame de características de
+            los clientes sin segmento registrado (solo se llama si los hay)
+
+    Returns:
+        dict: etiquetas (array, 0 = más valor), centroides (DataFrame en unidades
+        originales, en el orden de las etiquetas), modo ('registrado') y nuevos (clientes
+        asignados por su RFM actual)
+    """
+    segmentos = artefacto['segmentos']
+    posiciones = segmentos.index.get_indexer(clientes_ids)
+    etiquetas = np.where(posiciones >= 0, segmentos.to_numpy()[posiciones], -1).astype(np.int64)
+
+    nuevos = np.flatnonzero(posiciones < 0)
+    if len(nuevos):
+        escaladas = artefacto['escalador'].transform(
+            caracteristicas_nuevos(nuevos)[artefacto['columnas']].to_numpy(dtype=np.float64)
+        )
+        etiquetas[nuevos] = artefacto['nueva_etiqueta'][artefacto['modelo'].predict(escaladas)]
+    return {
+        'etiquetas': etiquetas,
+        'centroides': artefacto['centroides'],
+        'modo': 'registrado',
+        'nuevos': len(nuevos)
+    }
+
+
+# Tipo de modelo en el registro (utils.registro_modelos) y sus parámetros
+TIPO_MODELO_SEGMENTACION = 'kmeans_rfm'
+
+
+def parametros_segmentacion(n_clusters=4, modo='auto'):
+    return {'n_clusters': n_clusters, 'modo': modo, 'caracteristicas': CARACTERISTICAS_RFM}
+
+
+def periodo_dataset(dataset):
+    """Periodo cargado como texto ('AAAAMM-AAAAMM'; None = histórico completo)"""
+    if dataset.periodo is None:
+        return None
+    return f"{dataset.periodo[0]:%Y%m}-{dataset.periodo[1]:%Y%m}"
+
+
+def entrenar_segmentador(rfm, n_clusters=4, modo='auto', semillas=None, periodo=None):
+    """
+    Entrenamiento para el registro: (artefacto, métricas). El artefacto guarda, además del
+    escalador y el modelo, los centroides (semillas del siguiente reentrenamiento) y el
+    segmento de cada cliente del entrenamiento.
+
+    Args:
+        rfm: DataFrame de rfm_clientes (customer_id y CARACTERISTICAS_RFM)
+        semillas: centroides de la versión registrada anterior (o None)
+        periodo: periodo de las transacciones de entrenamiento (solo informativo)
+    """
+    resultado = ajustar_segmentacion(rfm[CARACTERISTICAS_RFM].fillna(0), n_clusters, modo, semillas)
+    artefacto = dict(resultado['artefacto'])
+    artefacto['centroides'] = resultado['centroides']
+    artefacto['segmentos'] = pd.Series(
+        resultado['etiquetas'].astype(np.int8),
+        index=pd.Index(np.asarray(rfm['customer_id'], dtype=object), name='customer_id')
+    )
+    metricas = {
+        'clientes': len(rfm),
+        'inercia': resultado['inercia'],
+        'modo': resultado['modo'],
+        'calentado': resultado['calentado'],
+        'tamanos': np.bincount(resultado['etiquetas'], minlength=n_clusters).tolist(),
+        'periodo': periodo
+    }
+    return artefacto, metricas
+
+
+def segmentador(dataset, n_clusters=4, modo='auto'):
+    """
+    Segmentador registrado (artefacto, metadatos) para esta versión del dataset, o None si
+    el job de reentrenamiento aún no lo ha publicado
+    """
+    return derivado_registrado(
+        dataset, f'segmentador_{n_clusters}_{modo}',
+        TIPO_MODELO_SEGMENTACION, parametros_segmentacion(n_clusters, modo),
+        lambda artefacto, metadatos, ds: (artefacto, metadatos)
+    )
@@ -0,0 +1,68 @@
+"""
+Servicio de modelos por filtros
+Autor: cmsr92
+
+Inferencia de los modelos de ML para unos filtros del dashboard (y de la API): aplica el
+modelo del registro a las filas o clientes de la vista filtrada y cachea el resultado en
+la caché de vistas (utils.cache_filtros), por spec y parámetros. Aquí nunca se entrena:
+sin modelo registrado el resultado es None y quien llama muestra que falta entrenarlo.
+"""
+
+import pandas as pd
+
+from utils.filtros import FiltroSpec
+from utils.cache_filtros import cache_vistas, obtener_agregado, obtener_rfm
+from utils.rfm import CARACTERISTICAS_RFM
+from utils.segmentacion import segmentador, segmentos_registrados
+from utils.anomalias import modelo_anomalias
+
+
+def _spec(filtros):
+    return filtros if isinstance(filtros, FiltroSpec) else FiltroSpec.desde_filtros(filtros)
+
+
+def obtener_segmentacion(dataset, filtros, n_clusters=4, modo='auto', indice=None):
+    """
+    Segmentación de los clientes del RFM filtrado con el segmentador del registro
+    (utils.segmentacion), cacheada por (spec, n_clusters, modo). No ajusta nada: cada
+    cliente recibe su segmento registrado (o el de su RFM en el dataset cargado si es
+    posterior al entrenamiento).
+
+    Returns:
+        dict de segmentos_registrados (etiquetas en el orden de obtener_rfm), o None si el
+        segmentador aún no está entrenado
+    """
+    registrado = segmentador(dataset, n_clusters, modo)
+    if registrado is None:
+        return None
+    spec = _spec(filtros)
+
+    def calcular():
+        rfm = obtener_rfm(dataset, spec, indice)
+
+        def caracteristicas_nuevos(posiciones):
+            completo = obtener_rfm(dataset, {}, indice)
+            filas = pd.Index(completo['customer_id']).get_indexer(rfm['customer_id'].iloc[posiciones])
+            return completo[CARACTERISTICAS_RFM].fillna(0).iloc[filas]
+
+        resultado = segmentos_registrados(registrado[0], rfm['customer_id'], caracteristicas_nuevos)
+        resultado['metadatos'] = registrado[1]
+        return resultado
+
+    return cache_vistas(dataset).obtener(
+        ('segmentacion', n_clusters, modo, registrado[1].get('version'), spec), calcular
+    )
+
+
+def obtener_puntuaciones_anomalia(dataset, filtros, indice=None):
+    """
+    Puntuación de anomalía (utils.anomalias; negativa = anómala, NaN sin variables) de las
+    filas filtradas, en su orden: se toma de la columna ya puntuada, sin entrenar.
+    None si el modelo aún no está entrenado.
+    """
+    modelo = modelo_anomalias(dataset)
+    if modelo is None:
+        return None
+    return obtener_agregado(
+        dataset, filtros, 'anomalias', lambda vista: modelo.puntuaciones_de(vista.filas), indice
+    )
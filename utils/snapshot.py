@@ -0,0 +1,440 @@
+"""
+Snapshot "gold" del dataset normalizado
+Autor: cmsr92
+
+Guarda las tablas ya normalizadas y traducidas bajo data/gold/<huella>/, donde la
+huella es un hash del contenido de los archivos fuente o de la marca de agua de
+PostgreSQL. Si la fuente no cambia, el arranque solo lee el snapshot y se salta toda
+la cadena de normalización.
+
+- transacciones/: dataset Parquet particionado por año/mes (anio=AAAA/mes=M), de modo
+  que la carga de un periodo solo lee las particiones que lo solapan.
+- clientes.arrow, productos.arrow: Arrow IPC sin compresión, mapeados en memoria y
+  leídos por columnas bajo demanda (TablaDiferida).
+
+Construcción manual:
+    python -m utils.snapshot
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from database.schema import get_engine
+from utils.tabla_diferida import TablaDiferida
+
+logger = logging.getLogger(__name__)
+
+RUTA_TRANSACCIONES_UNIFICADAS = 'data/transactions_unified.parquet'
+RUTA_CLIENTES_UNIFICADOS = 'data/customers_unified.parquet'
+RUTA_PRODUCTOS_UNIFICADOS = 'data/products_unified.parquet'
+
+DIRECTORIO_GOLD = 'data/gold'
+
+# Incrementar cuando cambie la cadena de normalización o el formato del snapshot
+VERSION_NORMALIZACION = 4
+
+TABLAS_SNAPSHOT = ('transacciones', 'clientes', 'productos')
+
+# Columnas de partición del dataset de transacciones (no forman parte de la tabla)
+COLUMNAS_PARTICION = ['anio', 'mes']
+
+
+def _hash_archivo(ruta, hasher, tam_bloque=1 << 20):
+    """Añade el contenido de un archivo al hasher en bloques de 1 MB"""
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tam_bloque), b''):
+            hasher.update(bloque)
+
+
+def _marca_agua_postgres():
+    """Marca de agua de PostgreSQL: esquema de transactions, conteo, id y fecha máximos"""
+    engine = get_engine()
+    with engine.connect() as conn:
+        filas, max_id, max_fecha = conn.execute(
+            text("SELECT COUNT(*), MAX(id), MAX(date) FROM transactions")
+        ).fetchone()
+        fila_cli = conn.execute(text("SELECT COUNT(*), MAX(id) FROM customers")).fetchone()
+        fila_prod = conn.execute(text("SELECT COUNT(*), MAX(id) FROM products")).fetchone()
+        columnas = conn.execute(text(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_name = 'transactions' ORDER BY ordinal_position"
+        )).fetchall()
+    return {
+        'origen': 'postgres',
+        'esquema': str([tuple(c) for c in columnas]),
+        'transacciones': {'filas': filas, 'max_id': max_id, 'max_fecha': str(max_fecha)},
+        'dimensiones': f"{tuple(fila_cli)}|{tuple(fila_prod)}"
+    }
+
+
+def _marca_agua_parquet():
+    """Marca de agua de los archivos unificados: mtime y filas por row group de transacciones"""
+    import pyarrow.parquet as pq
+
+    archivo = pq.ParquetFile(RUTA_TRANSACCIONES_UNIFICADAS)
+    metadatos = archivo.metadata
+    return {
+        'origen': 'parquet',
+        'esquema': str(archivo.schema_arrow),
+        'transacciones': {
+            'mtime': os.path.getmtime(RUTA_TRANSACCIONES_UNIFICADAS),
+            'grupos': [metadatos.row_group(i).num_rows for i in range(metadatos.num_row_groups)]
+        },
+        'dimensiones': str([
+            (os.path.getmtime(ruta), os.path.getsize(ruta))
+            for ruta in (RUTA_CLIENTES_UNIFICADOS, RUTA_PRODUCTOS_UNIFICADOS)
+        ])
+    }
+
+
+def marca_agua_fuente():
+    """
+    Marca de agua barata de la fuente (sin leer datos), para detectar filas nuevas.
+
+    Returns:
+        dict: origen, esquema, estado de transacciones y de dimensiones; None si no hay fuente
+    """
+    try:
+        if os.path.exists(RUTA_TRANSACCIONES_UNIFICADAS):
+            return _marca_agua_parquet()
+        return _marca_agua_postgres()
+    except Exception as e:
+        logger.warning("No se pudo obtener la marca de agua de la fuente: %s", e)
+        return None
+
+
+def comparar_marcas(anterior, nueva):
+    """
+    Clasifica el cambio de la fuente entre dos marcas de agua.
+
+    Returns:
+        str: 'igual' (sin cambios), 'anexo' (solo filas nuevas al final o cambios en
+        clientes/productos) o 'recarga' (cambio de esquema o de histórico)
+    """
+    if anterior is None or nueva is None:
+        return 'recarga'
+    if anterior['origen'] != nueva['origen'] or anterior['esquema'] != nueva['esquema']:
+        return 'recarga'
+
+    tx_anterior, tx_nueva = anterior['transacciones'], nueva['transacciones']
+    if tx_anterior == tx_nueva:
+        return 'igual' if anterior['dimensiones'] == nueva['dimensiones'] else 'anexo'
+
+    if nueva['origen'] == 'parquet':
+        # Anexo = los row groups previos siguen intactos y solo se añadieron grupos al final
+        grupos_anteriores, grupos_nuevos = tx_anterior['grupos'], tx_nueva['grupos']
+        if len(grupos_nuevos) > len(grupos_anteriores) and grupos_nuevos[:len(grupos_anteriores)] == grupos_anteriores:
+            return 'anexo'
+        return 'recarga'
+
+    # PostgreSQL: más filas e ids mayores; el conteo exacto se verifica al leer el incremento
+    if (tx_anterior['max_id'] is not None and tx_nueva['max_id'] is not None
+            and tx_nueva['filas'] > tx_anterior['filas'] and tx_nueva['max_id'] > tx_anterior['max_id']):
+        return 'anexo'
+    return 'recarga'
+
+
+def huella_fuente(marca=None):
+    """
+    Calcula la huella de la fuente de datos.
+
+    Args:
+        marca: marca de agua ya obtenida (PostgreSQL); si no se pasa, se consulta
+
+    Returns:
+        str: hash hexadecimal, o None si no se puede determinar (sin fuente accesible)
+    """
+    hasher = hashlib.sha256(f"normalizacion-v{VERSION_NORMALIZACION}".encode())
+
+    if os.path.exists(RUTA_TRANSACCIONES_UNIFICADAS):
+        hasher.update(b'parquet')
+        for ruta in (RUTA_TRANSACCIONES_UNIFICADAS, RUTA_CLIENTES_UNIFICADOS, RUTA_PRODUCTOS_UNIFICADOS):
+            _hash_archivo(ruta, hasher)
+        return hasher.hexdigest()
+
+    try:
+        marca = marca or _marca_agua_postgres()
+        hasher.update(b'postgres')
+        hasher.update(repr(sorted(marca.items())).encode())
+        return hasher.hexdigest()
+    except Exception as e:
+        logger.warning("No se pudo obtener la marca de agua de PostgreSQL: %s", e)
+        return None
+
+
+# Última huella calculada y la marca de agua con la que se calculó: mientras la marca no
+# cambie, la huella tampoco, y no hace falta volver a leer los archivos fuente
+_ultima_huella = (None, None)
+
+
+def huella_y_marca():
+    """
+    Huella y marca de agua coherentes entre sí: si la fuente cambia mientras se calcula
+    la huella, se repite (una huella con filas que la marca no cuenta duplicaría el anexo).
+    La marca de agua se consulta primero y la huella (sha256 de los archivos) solo se
+    recalcula si la marca difiere de la de la última huella calculada en el proceso.
+
+    Returns:
+        tuple: (huella, marca); cualquiera puede ser None si no hay fuente
+    """
+    global _ultima_huella
+    marca = marca_agua_fuente()
+    marca_previa, huella_previa = _ultima_huella
+    if marca is not None and marca == marca_previa:
+        return huella_previa, marca
+
+    for _ in range(3):
+        huella = huella_fuente(marca)
+        marca_final = marca_agua_fuente()
+        if marca_final == marca:
+            if marca is not None and huella is not None:
+                _ultima_huella = (marca, huella)
+            return huella, marca
+        marca = marca_final
+    return huella, None
+
+
+def _ruta_snapshot(huella):
+    return os.path.join(DIRECTORIO_GOLD, huella)
+
+
+def periodo_mensual(fecha_inicio, fecha_fin):
+    """
+    Redondea un rango de fechas a meses completos, la unidad de partición del snapshot.
+
+    Returns:
+        tuple: (inicio del primer mes, último instante del último mes) o None si el rango
+        es abierto (histórico completo)
+    """
+    if fecha_inicio is None or fecha_fin is None:
+        return None
+    return (
+        pd.Timestamp(fecha_inicio).to_period('M').start_time,
+        pd.Timestamp(fecha_fin).to_period('M').end_time
+    )
+
+
+def ordenar_por_fecha(transactions_df):
+    """
+    Orden físico por fecha (estable) de la tabla de hechos: permite resolver rangos de
+    fechas con búsqueda binaria. Si ya está ordenada se devuelve tal cual.
+    """
+    if transactions_df['date'].is_monotonic_increasing:
+        return transactions_df
+    return transactions_df.sort_values('date', kind='stable', ignore_index=True)
+
+
+def filtrar_periodo(transactions_df, periodo):
+    """Recorta las transacciones (ordenadas por fecha) a un periodo (inicio, fin); con None, todas"""
+    if periodo is None:
+        return transactions_df
+    inicio, fin = periodo
+    fechas = transactions_df['date'].to_numpy()
+    desde = np.searchsorted(fechas, inicio.to_datetime64(), side='left')
+    hasta = np.searchsorted(fechas, fin.to_datetime64(), side='right')
+    return transactions_df.iloc[desde:hasta].reset_index(drop=True)
+
+
+def _filtro_particiones(periodo):
+    """Expresión sobre anio/mes que selecciona las particiones que solapan el periodo"""
+    import pyarrow.dataset as ds
+
+    inicio, fin = periodo
+    anio, mes = ds.field('anio'), ds.field('mes')
+    desde = (anio > inicio.year) | ((anio == inicio.year) & (mes >= inicio.month))
+    hasta = (anio < fin.year) | ((anio == fin.year) & (mes <= fin.month))
+    return desde & hasta
+
+
+def _leer_transacciones(ruta, periodo):
+    """Lee del dataset particionado solo los meses del periodo (todos con periodo None)"""
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(ruta, format='parquet', partitioning='hive')
+    filtro = _filtro_particiones(periodo) if periodo is not None else None
+    tabla = dataset.to_table(filter=filtro).drop_columns(COLUMNAS_PARTICION)
+    # El descubrimiento del dataset conserva los metadatos pandas (dtypes) del primer fragmento
+    tabla = tabla.replace_schema_metadata(dataset.schema.metadata)
+    # Las particiones no se leen en orden cronológico (mes=10 antes que mes=2) y los anexos
+    # añaden archivos por mes: se restablece el orden por fecha
+    return ordenar_por_fecha(tabla.to_pandas())
+
+
+def _esquema_uniforme(tabla):
+    """
+    Índices de diccionario en int32 para todas las particiones: pandas elige int8/int16
+    según el número de categorías y el dataset no puede unir esquemas distintos
+    """
+    import pyarrow as pa
+
+    campos = [
+        campo.with_type(pa.dictionary(pa.int32(), campo.type.value_type))
+        if pa.types.is_dictionary(campo.type) else campo
+        for campo in tabla.schema
+    ]
+    return tabla.cast(pa.schema(campos, metadata=tabla.schema.metadata))
+
+
+def _escribir_transacciones(transactions_df, ruta, nombre_archivo='part-0.parquet'):
+    """
+    Escribe las transacciones como dataset Parquet particionado por año/mes
+    (ruta/anio=AAAA/mes=M/<nombre_archivo>)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    df = transactions_df.reset_index(drop=True)
+    categoricas = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+
+    for (anio, mes), particion in df.groupby([df['date'].dt.year, df['date'].dt.month], sort=True):
+        # Cada partición guarda solo su diccionario; si no, cada archivo repite las categorías de todo el histórico
+        particion = particion.reset_index(drop=True)
+        for col in categoricas:
+            particion[col] = particion[col].cat.remove_unused_categories()
+
+        ruta_particion = os.path.join(ruta, f"anio={anio}", f"mes={mes}")
+        os.makedirs(ruta_particion, exist_ok=True)
+        pq.write_table(_esquema_uniforme(pa.Table.from_pandas(particion, preserve_index=False)),
+                       os.path.join(ruta_particion, nombre_archivo))
+
+
+def cargar_snapshot(huella, fecha_inicio=None, fecha_fin=None):
+    """
+    Carga el snapshot correspondiente a la huella. De las transacciones solo se leen
+    las particiones mensuales que solapan [fecha_inicio, fecha_fin] (todas si el rango
+    es abierto); clientes y productos se devuelven como TablaDiferida (mapeadas en
+    memoria, sus columnas se leen al pedirlas).
+
+    Returns:
+        tuple: (transacciones, clientes, productos) o None si no existe
+    """
+    if not huella:
+        return None
+
+    ruta = _ruta_snapshot(huella)
+    if not os.path.isdir(ruta):
+        return None
+
+    try:
+        transacciones = _leer_transacciones(
+            os.path.join(ruta, 'transacciones'), periodo_mensual(fecha_inicio, fecha_fin)
+        )
+        return (transacciones,) + tuple(
+            TablaDiferida.desde_archivo_arrow(tabla, os.path.join(ruta, f"{tabla}.arrow"))
+            for tabla in TABLAS_SNAPSHOT[1:]
+        )
+    except Exception as e:
+        logger.warning("Snapshot %s ilegible, se regenerará: %s", huella[:12], e)
+        return None
+
+
+def guardar_snapshot(huella, transactions_df, customers_df, products_df):
+    """Escribe el snapshot de forma atómica y elimina los snapshots obsoletos"""
+    if not huella:
+        return False
+
+    ruta = _ruta_snapshot(huella)
+    ruta_tmp = f"{ruta}.tmp-{os.getpid()}"
+
+    try:
+        os.makedirs(ruta_tmp, exist_ok=True)
+        _escribir_transacciones(transactions_df, os.path.join(ruta_tmp, 'transacciones'))
+        for tabla, df in zip(TABLAS_SNAPSHOT[1:], (customers_df, products_df)):
+            df.reset_index(drop=True).to_feather(
+                os.path.join(ruta_tmp, f"{tabla}.arrow"),
+                compression='uncompressed'
+            )
+        shutil.rmtree(ruta, ignore_errors=True)
+        os.replace(ruta_tmp, ruta)
+    except Exception as e:
+        logger.warning("No se pudo guardar el snapshot %s: %s", huella[:12], e)
+        shutil.rmtree(ruta_tmp, ignore_errors=True)
+        return False
+
+    _limpiar_snapshots(huella)
+    return True
+
+
+def _limpiar_snapshots(huella):
+    """Elimina los snapshots de otras huellas (salvo escrituras en curso)"""
+    for nombre in os.listdir(DIRECTORIO_GOLD):
+        if nombre != huella and '.tmp-' not in nombre:
+            shutil.rmtree(os.path.join(DIRECTORIO_GOLD, nombre), ignore_errors=True)
+
+
+def anexar_snapshot(huella_anterior, huella, transacciones_nuevas, customers_df=None, products_df=None):
+    """
+    Publica el snapshot de la huella nueva a partir del anterior sin reescribirlo: los
+    archivos existentes se enlazan (hard link) y las filas nuevas se añaden como un
+    archivo más en cada partición mensual. Clientes y productos se reescriben si se pasan.
+
+    Returns:
+        bool: True si el snapshot nuevo quedó publicado
+    """
+    if not huella_anterior or not huella:
+        return False
+
+    ruta_anterior = _ruta_snapshot(huella_anterior)
+    if not os.path.isdir(ruta_anterior):
+        return False
+
+    ruta = _ruta_snapshot(huella)
+    ruta_tmp = f"{ruta}.tmp-{os.getpid()}"
+
+    try:
+        shutil.rmtree(ruta_tmp, ignore_errors=True)
+        shutil.copytree(ruta_anterior, ruta_tmp, copy_function=os.link)
+        if len(transacciones_nuevas):
+            _escribir_transacciones(
+                transacciones_nuevas, os.path.join(ruta_tmp, 'transacciones'),
+                nombre_archivo=f"part-{uuid.uuid4().hex[:8]}.parquet"
+            )
+        for tabla, df in zip(TABLAS_SNAPSHOT[1:], (customers_df, products_df)):
+            if df is not None:
+                ruta_tabla = os.path.join(ruta_tmp, f"{tabla}.arrow")
+                # Desenlazar antes de escribir para no modificar el archivo del snapshot anterior
+                os.remove(ruta_tabla)
+                df.reset_index(drop=True).to_feather(ruta_tabla, compression='uncompressed')
+        shutil.rmtree(ruta, ignore_errors=True)
+        os.replace(ruta_tmp, ruta)
+    except Exception as e:
+        logger.warning("No se pudo anexar al snapshot %s: %s", huella_anterior[:12], e)
+        shutil.rmtree(ruta_tmp, ignore_errors=True)
+        return False
+
+    _limpiar_snapshots(huella)
+    return True
+
+
+def construir_snapshot():
+    """Paso de build: normaliza la fuente actual y escribe el snapshot que usa el dashboard"""
+    from utils.data_loader_pg import clave_snapshot, load_data_from_postgres
+
+    huella = huella_fuente()
+    if huella is None:
+        print("❌ No hay fuente de datos accesible")
+        return None
+
+    clave = clave_snapshot(huella)
+    if os.path.isdir(_ruta_snapshot(clave)):
+        print(f"✅ Snapshot vigente: {huella[:12]}")
+        return huella
+
+    transacciones, _, _ = load_data_from_postgres(huella)
+    if transacciones is None or not os.path.isdir(_ruta_snapshot(clave)):
+        print("❌ No se pudo generar el snapshot")
+        return None
+
+    print(f"✅ Snapshot generado: {huella[:12]}")
+    return huella
+
+
+if __name__ == '__main__':
+    construir_snapshot()
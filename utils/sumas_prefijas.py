@@ -0,0 +1,129 @@
+"""
+Sumas prefijas diarias de las medidas aditivas
+Autor: cmsr92
+
+Para cada medida del cubo (pedidos, ingresos, beneficio, unidades, coste) se guarda el
+acumulado día a día, en total y por cada valor de cada dimensión del cubo. Los KPIs de
+cualquier rango contiguo de días son entonces dos accesos y una resta, sin importar
+cuántos años cubra el rango: los presets y el selector de fechas no recorren filas.
+
+Responde a filtros sin selección o con selección en una sola dimensión (sumando los
+valores elegidos) y sin filtro de precio efectivo; el resto se resuelve con el cubo.
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.cubo import DIMENSIONES_CUBO, MEDIDAS_CUBO, cubo_diario
+from utils.filtros import COLUMNAS_FILTRO
+
+UN_DIA = np.timedelta64(1, 'D')
+
+
+class SumasPrefijas:
+    """
+    Acumulados por día: total (dias + 1, medidas) y por dimensión (valores, dias + 1, medidas).
+    La fila 0 es cero, así el rango de días [a, b] es acumulado[b + 1] - acumulado[a].
+    """
+
+    def __init__(self, dia_inicial, num_dias, total, por_dimension, categorias, precio_min, precio_max):
+        self.dia_inicial = dia_inicial
+        self.num_dias = num_dias
+        self.total = total
+        # dimensión -> array (valores, dias + 1, medidas), en el orden de categorias[dimensión]
+        self.por_dimension = por_dimension
+        self.categorias = categorias
+        self.precio_min = precio_min
+        self.precio_max = precio_max
+
+    @classmethod
+    def construir(cls, cubo):
+        filas = cubo.filas
+        medidas = np.column_stack([filas[m].to_numpy(dtype=np.float64) for m in MEDIDAS_CUBO])
+        num_medidas = medidas.shape[1]
+
+        if len(filas) == 0:
+            return cls(None, 0, np.zeros((1, num_medidas)), {}, {}, cubo.precio_min, cubo.precio_max)
+
+        dias = filas['dia'].to_numpy().astype('datetime64[D]')
+        dia_inicial = dias.min()
+        num_dias = int((dias.max() - dia_inicial) // UN_DIA) + 1
+        indice_dia = ((dias - dia_inicial) // UN_DIA).astype(np.int64)
+
+        def acumular(grupos, num_grupos):
+            # Suma por (grupo, día) con bincount y acumulado a lo largo de los días
+            clave = grupos * num_dias + indice_dia
+            acumulado = np.zeros((num_grupos, num_dias + 1, num_medidas))
+            for m in range(num_medidas):
+                sumas = np.bincount(clave, weights=medidas[:, m], minlength=num_grupos * num_dias)
+                acumulado[:, 1:, m] = np.cumsum(sumas.reshape(num_grupos, num_dias), axis=1)
+            return acumulado
+
+        total = acumular(np.zeros(len(filas), dtype=np.int64), 1)[0]
+        por_dimension, categorias = {}, {}
+        for dim in DIMENSIONES_CUBO:
+            codigos = filas[dim].cat.codes.to_numpy().astype(np.int64)
+            validos = codigos >= 0
+            categorias[dim] = filas[dim].cat.categories
+            # Los nulos (código -1) van a un grupo extra que no se consulta
+            por_dimension[dim] = acumular(np.where(validos, codigos, len(categorias[dim])), len(categorias[dim]) + 1)
+        return cls(dia_inicial, num_dias, total, por_dimension, categorias, cubo.precio_min, cubo.precio_max)
+
+    def _tramo(self, fecha_inicio, fecha_fin):
+        """Posiciones [a, b) del acumulado para el rango de días (recortado al histórico)"""
+        a, b = 0, self.num_dias
+        if fecha_inicio is not None:
+            a = int((pd.Timestamp(fecha_inicio).to_datetime64().astype('datetime64[D]') - self.dia_inicial) // UN_DIA)
+        if fecha_fin is not None:
+            b = int((pd.Timestamp(fecha_fin).to_datetime64().astype('datetime64[D]') - self.dia_inicial) // UN_DIA) + 1
+        a, b = min(max(a, 0), self.num_dias), min(max(b, 0), self.num_dias)
+        return a, max(a, b)
+
+    def consultar(self, filtros):
+        """
+        Medidas aditivas para unos filtros con días completos (los de FiltroSpec.como_filtros)
+
+        Returns:
+            dict medida -> valor, o None si los filtros no se pueden resolver con los acumulados
+        """
+        precio_min, precio_max = filtros.get('precio_min'), filtros.get('precio_max')
+        if precio_min is not None and precio_max is not None and self.precio_min is not None:
+            if precio_min > self.precio_min or precio_max < self.precio_max:
+                return None
+
+        selecciones = [(clave, filtros[clave]) for clave in COLUMNAS_FILTRO if filtros.get(clave)]
+        if len(selecciones) > 1:
+            return None
+
+        if self.dia_inicial is None:
+            valores = np.zeros(len(MEDIDAS_CUBO))
+        else:
+            a, b = self._tramo(filtros.get('fecha_inicio'), filtros.get('fecha_fin'))
+            if not selecciones:
+                valores = self.total[b] - self.total[a]
+            else:
+                clave, elegidos = selecciones[0]
+                dim = COLUMNAS_FILTRO[clave]
+                codigos = self.categorias[dim].get_indexer(list(elegidos))
+                acumulado = self.por_dimension[dim][codigos[codigos >= 0]]
+                valores = (acumulado[:, b] - acumulado[:, a]).sum(axis=0)
+
+        resultado = dict(zip(MEDIDAS_CUBO, valores.tolist()))
+        resultado['pedidos'] = int(round(resultado['pedidos']))
+        resultado['unidades'] = int(round(resultado['unidades']))
+        return resultado
+
+    def nbytes(self):
+        return self.total.nbytes + sum(a.nbytes for a in self.por_dimension.values())
+
+    def __repr__(self):
+        return f"SumasPrefijas(dias={self.num_dias:,}, dimensiones={len(self.por_dimension)}, {self.nbytes() / 1e6:.1f} MB)"
+
+
+def sumas_prefijas(dataset):
+    """Sumas prefijas de la versión actual del dataset (se rehacen desde el cubo ya extendido en los anexos)"""
+    return dataset.derivado(
+        'sumas_prefijas',
+        lambda ds: SumasPrefijas.construir(cubo_diario(ds)),
+        lambda sumas, nuevas, ds: SumasPrefijas.construir(cubo_diario(ds))
+    )
@@ -0,0 +1,91 @@
+"""
+Tablas de dimensiones diferidas (clientes y productos)
+Autor: cmsr92
+
+Solo las pestañas de Clientes, Productos, ML y Finanzas usan estas tablas: en vez de
+cargarlas completas al arrancar, el dataset guarda un manejador que materializa las
+columnas pedidas la primera vez que alguien las necesita y las conserva para el resto.
+"""
+
+import threading
+
+import pandas as pd
+
+
+class TablaDiferida:
+    """
+    Manejador de una tabla que se materializa por columnas bajo demanda.
+
+    Args:
+        nombre: nombre de la tabla (para mensajes y repr)
+        lector: función(lista de columnas) -> DataFrame con esas columnas
+        columnas_disponibles: columnas de la tabla, en su orden original
+    """
+
+    def __init__(self, nombre, lector, columnas_disponibles):
+        self.nombre = nombre
+        self._lector = lector
+        self.columnas_disponibles = list(columnas_disponibles)
+        self._cargadas = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_archivo_arrow(cls, nombre, ruta):
+        """
+        Manejador sobre un archivo Arrow IPC del snapshot. El archivo queda mapeado en memoria
+        desde ya, así sigue siendo legible aunque un refresco elimine después el snapshot.
+        """
+        import pyarrow as pa
+
+        lector_ipc = pa.ipc.open_file(pa.memory_map(ruta, 'r'))
+        return cls(
+            nombre,
+            lambda columnas: lector_ipc.read_all().select(columnas).to_pandas(),
+            lector_ipc.schema.names
+        )
+
+    @classmethod
+    def desde_dataframe(cls, nombre, df):
+        """Manejador sobre una tabla ya en memoria (carga desde la fuente sin snapshot)"""
+        return cls(nombre, lambda columnas: df[columnas], df.columns)
+
+    @property
+    def cargadas(self):
+        """Columnas ya materializadas"""
+        return list(self._cargadas)
+
+    def columnas(self, columnas=None):
+        """
+        Devuelve la tabla con las columnas pedidas (todas si no se indican), leyendo solo
+        las que aún no se habían materializado.
+
+        Returns:
+            DataFrame (compartido: tratarlo como solo lectura)
+        """
+        if columnas is None:
+            columnas = self.columnas_disponibles
+        elif isinstance(columnas, str):
+            columnas = [columnas]
+
+        desconocidas = [col for col in columnas if col not in self.columnas_disponibles]
+        if desconocidas:
+            raise KeyError(f"{self.nombre}: columnas inexistentes {desconocidas}")
+
+        faltantes = [col for col in columnas if col not in self._cargadas]
+        if faltantes:
+            with self._lock:
+                faltantes = [col for col in columnas if col not in self._cargadas]
+                if faltantes:
+                    leidas = self._lector(faltantes)
+                    for col in faltantes:
+                        self._cargadas[col] = leidas[col]
+
+        return pd.DataFrame({col: self._cargadas[col] for col in columnas})
+
+    def completa(self):
+        """Tabla con todas sus columnas (exportaciones)"""
+        return self.columnas()
+
+    def __repr__(self):
+        return (f"TablaDiferida({self.nombre!r}, cargadas={len(self._cargadas)}"
+                f"/{len(self.columnas_disponibles)})")
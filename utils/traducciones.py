@@ -3,6 +3,7 @@ Traducciones completas al español para el dashboard
 Incluye: categorías, países, días, segmentos RFM, dispositivos, métodos de pago
 """
 
+import numpy as np
 import pandas as pd
 
 # Diccionario de traducción de segmentos RFM
@@ -185,6 +186,17 @@ PAISES_TRADUCCION = {
     'Iceland': 'Islandia'
 }
 
+# Variantes de nombres de países que se consolidan tras la traducción
+CONSOLIDACION_PAISES = {
+    'USA': 'Estados Unidos',
+    'EIRE': 'Irlanda',
+    'Ireland': 'Irlanda',
+    'RSA': 'Sudáfrica',
+    'Channel Islands': 'Reino Unido',
+    'European Community': 'Unión Europea',
+    'Unspecified': 'No Especificado'
+}
+
 # Diccionario de traducción de días de semana
 DIAS_SEMANA_TRADUCCION = {
     'Monday': 'Lunes',
@@ -345,7 +357,7 @@ def traducir_categoria(categoria):
     return categoria.capitalize()
 
 def traducir_categoria_inverso(categoria_es):
-    """Traduce una categoría del español al inglés (para filtros)"""
+    """Traduce una categoría del español al inglés (para filtros; ver valores_origen para todas las variantes)"""
     if not categoria_es:
         return categoria_es
     
@@ -391,16 +403,47 @@ def traducir_mes(mes):
     # Si no hay traducción, devolver como está
     return mes
 
+def traducir_pais_consolidado(pais):
+    """Traduce un país y consolida sus variantes (USA, EIRE, RSA...) en un único nombre"""
+    pais_es = traducir_pais(pais)
+    return CONSOLIDACION_PAISES.get(pais_es, pais_es)
+
+def traducir_serie_categorica(serie, traductor):
+    """
+    Traduce una Serie a nivel de diccionario: la convierte a Categorical y aplica el
+    traductor solo sobre las categorías únicas, O(valores únicos) en lugar de O(filas).
+    Si varias categorías traducen al mismo valor (p. ej. 'EIRE' e 'Ireland') se fusionan.
+    
+    Returns:
+        Serie Categorical con las categorías traducidas
+    """
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype('category')
+    
+    traducidas = pd.Index([traductor(categoria) for categoria in serie.cat.categories])
+    codigos_traducidos, categorias_nuevas = pd.factorize(traducidas)
+    
+    # El código -1 (nulo) se conserva como nulo
+    recodificacion = np.append(codigos_traducidos, -1)
+    codigos = recodificacion[serie.cat.codes.to_numpy()]
+    
+    return pd.Series(
+        pd.Categorical.from_codes(codigos, categories=categorias_nuevas),
+        index=serie.index,
+        name=serie.name
+    )
+
 def aplicar_traducciones_df(df, columna='category'):
     """Aplica traducciones a una columna de DataFrame"""
     if columna in df.columns:
-        df[columna] = df[columna].apply(traducir_categoria)
+        df[columna] = traducir_serie_categorica(df[columna], traducir_categoria)
     return df
 
-def aplicar_traducciones_paises_df(df, columna='country'):
-    """Aplica traducciones de países a una columna de DataFrame"""
+def aplicar_traducciones_paises_df(df, columna='country', consolidar=False):
+    """Aplica traducciones de países a una columna de DataFrame (opcionalmente consolidando variantes)"""
     if columna in df.columns:
-        df[columna] = df[columna].apply(traducir_pais)
+        traductor = traducir_pais_consolidado if consolidar else traducir_pais
+        df[columna] = traducir_serie_categorica(df[columna], traductor)
     return df
 
 def traducir_segmento_rfm(segmento):
@@ -460,19 +503,19 @@ def traducir_metodo_pago(metodo):
 def aplicar_traducciones_rfm_df(df, columna='rfm_segment'):
     """Aplica traducciones de segmentos RFM a una columna de DataFrame"""
     if columna in df.columns:
-        df[columna] = df[columna].apply(traducir_segmento_rfm)
+        df[columna] = traducir_serie_categorica(df[columna], traducir_segmento_rfm)
     return df
 
 def aplicar_traducciones_dispositivos_df(df, columna='device_type'):
     """Aplica traducciones de dispositivos a una columna de DataFrame"""
     if columna in df.columns:
-        df[columna] = df[columna].apply(traducir_dispositivo)
+        df[columna] = traducir_serie_categorica(df[columna], traducir_dispositivo)
     return df
 
 def aplicar_traducciones_metodos_pago_df(df, columna='payment_method'):
     """Aplica traducciones de métodos de pago a una columna de DataFrame"""
     if columna in df.columns:
-        df[columna] = df[columna].apply(traducir_metodo_pago)
+        df[columna] = traducir_serie_categorica(df[columna], traducir_metodo_pago)
     return df
 
 def traducir_fuente_trafico(fuente):
@@ -512,15 +555,59 @@ def traducir_segmento_cliente(segmento):
 def aplicar_traducciones_fuentes_trafico_df(df, columna='traffic_source'):
     """Aplica traducciones de fuentes de tráfico a una columna de DataFrame"""
     if columna in df.columns:
-        df[columna] = df[columna].apply(traducir_fuente_trafico)
+        df[columna] = traducir_serie_categorica(df[columna], traducir_fuente_trafico)
     return df
 
 def aplicar_traducciones_segmentos_clientes_df(df, columna='customer_segment'):
     """Aplica traducciones de segmentos de clientes a una columna de DataFrame"""
     if columna in df.columns:
-        df[columna] = df[columna].apply(traducir_segmento_cliente)
+        df[columna] = traducir_serie_categorica(df[columna], traducir_segmento_cliente)
     return df
 
+# Diccionarios de origen por columna, usados para la búsqueda inversa (español -> valores fuente)
+DICCIONARIOS_COLUMNAS = {
+    'category': CATEGORIAS_TRADUCCION,
+    'subcategory': CATEGORIAS_TRADUCCION,
+    'country': {**PAISES_TRADUCCION, **CONSOLIDACION_PAISES},
+    'rfm_segment': SEGMENTOS_RFM_TRADUCCION,
+    'device_type': DISPOSITIVOS_TRADUCCION,
+    'payment_method': METODOS_PAGO_TRADUCCION,
+    'traffic_source': FUENTES_TRAFICO_TRADUCCION,
+    'customer_segment': SEGMENTOS_CLIENTES_TRADUCCION
+}
+
+def valores_origen(columna, valores_es):
+    """
+    Búsqueda inversa: devuelve todos los valores fuente (inglés) que se traducen a los
+    valores en español indicados, para poder empujar filtros del dashboard a la fuente.
+    
+    Args:
+        columna: Nombre de la columna en la fuente (p. ej. 'country')
+        valores_es: Lista de valores en español
+        
+    Returns:
+        list: Valores fuente ordenados (incluye el propio valor, por si no tenía traducción)
+    """
+    diccionario = DICCIONARIOS_COLUMNAS.get(columna, {})
+    buscados = set(valores_es)
+    
+    origen = set(buscados)
+    for clave, valor in diccionario.items():
+        if valor in buscados:
+            origen.add(clave)
+    
+    # Claves cuya traducción se consolida después (p. ej. 'Ireland' -> 'Irlanda')
+    if columna == 'country':
+        for clave, valor in PAISES_TRADUCCION.items():
+            if CONSOLIDACION_PAISES.get(valor) in buscados:
+                origen.add(clave)
+    
+    # Variante en minúsculas cuando la traducción capitaliza valores sin diccionario
+    if columna in ('category', 'subcategory'):
+        origen.update(v.lower() for v in buscados)
+    
+    return sorted(origen)
+
 # Diccionario de labels profesionales para gráficos
 LABELS_PROFESIONALES = {
     # Columnas comunes
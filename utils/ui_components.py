@@ -18,6 +18,15 @@ PALETA_CORPORATIVA = {
     'fondo': '#F8FAFC',
 }
 
+def seccion_independiente(funcion):
+    """
+    Decora una sección con controles propios para que sus widgets la vuelvan a ejecutar solo
+    a ella (st.fragment) y no todo el script: ni el sidebar ni los filtros ni las demás
+    secciones. En versiones de Streamlit sin fragmentos la sección se ejecuta tal cual.
+    """
+    fragmento = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+    return fragmento(funcion) if fragmento is not None else funcion
+
 def crear_tarjeta_kpi(icono, etiqueta, valor, cambio=None, formato='numero', col=None):
     """
     Crea una tarjeta KPI profesional